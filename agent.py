@@ -2,11 +2,20 @@
 Mystical Oracle Agent - 神秘预言师核心模块
 将配置、提示词模板分离，提高代码可维护性，并集成语音合成功能
 """
+import asyncio
 import os
-from typing import Optional, Dict, Any
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, asynccontextmanager
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Iterator, AsyncIterator, List, Mapping
 
 from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain_community.chat_message_histories import RedisChatMessageHistory
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import MessagesPlaceholder, ChatPromptTemplate
 from langchain_core.runnables import RunnableLambda, RunnableWithMessageHistory, RunnableConfig
@@ -14,17 +23,102 @@ from langchain_core.messages import SystemMessage
 from langchain_ollama import ChatOllama
 
 from services.tools import bazi_cesuan, get_info_from_local_db, search, yaoyigua, jiemeng
-from utils.helpers import delete_think
+from utils.helpers import ThinkFilter, delete_think, extract_mood_tag
+from utils.metrics import metrics
 from config.settings import config
 from prompts.system_prompts import SystemPrompts
 from prompts.mood_prompts import MoodPrompts
-from services.tts_service import tts_service
+from services.chat_history import RedisChatHistory
+from services.token_budget import history_assembler
+from services.job_queue import JOB_QUEUED, JOB_RUNNING, Job, QueueFullError, job_queue
+from services.mood_classifier import mood_classifier
 from config.logger import agent_logger
 
+# 主对话模型的标签，用于在事件流中区分工具内部的模型调用
+AGENT_LLM_TAG = "master_agent_llm"
+MOOD_OPEN_TAG = "<mood>"
+MOOD_CLOSE_TAG = "</mood>"
+# 历史摘要折叠锁的超时时间(秒)，防止任务异常退出后锁不释放
+SUMMARY_LOCK_TIMEOUT = 300
+
+
+async def _filter_think_stream(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """增量过滤 <think>...</think>，每段只处理新增内容"""
+    think_filter = ThinkFilter()
+    async for chunk in chunks:
+        visible = think_filter.feed(chunk)
+        if visible:
+            yield visible
+    
+    tail = think_filter.flush()
+    if tail:
+        yield tail
+
+
+async def _strip_mood_stream(chunks: AsyncIterator[str], holder: Dict[str, Any]) -> AsyncIterator[str]:
+    """剥离流开头的 <mood>...</mood> 情绪标签，识别结果写入 holder["mood"]"""
+    buffer = ""
+    resolved = False
+    async for chunk in chunks:
+        if resolved:
+            yield chunk
+            continue
+        
+        buffer += chunk
+        stripped = buffer.lstrip()
+        if stripped.startswith(MOOD_OPEN_TAG):
+            if MOOD_CLOSE_TAG not in stripped:
+                continue
+            mood, rest = extract_mood_tag(stripped)
+            holder["mood"] = mood
+            buffer = rest
+        elif MOOD_OPEN_TAG.startswith(stripped):
+            continue
+        
+        resolved = True
+        if buffer:
+            yield buffer
+    
+    if not resolved and buffer:
+        yield buffer
+
+
+class PromptUsageCallback(BaseCallbackHandler):
+    """记录主对话模型每次调用的提示词 token 数与预填充耗时（取自 Ollama 返回的用量信息）"""
+    
+    run_inline = True
+    
+    def on_llm_end(self, response: LLMResult, *, tags: Optional[List[str]] = None, **kwargs: Any) -> None:
+        if AGENT_LLM_TAG not in (tags or []):
+            return
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or {}
+                if usage.get("input_tokens"):
+                    metrics.values("agent.prompt_tokens").record(usage["input_tokens"])
+                prompt_eval_ns = (getattr(message, "response_metadata", None) or {}).get("prompt_eval_duration")
+                if prompt_eval_ns:
+                    metrics.latency("agent.prefill").record(prompt_eval_ns / 1e9)
+
 
 class Master:
     """算命大师 Agent 类 - 优化版本"""
     
+    # 进程级共享的聊天模型与各情绪执行器（只读缓存，所有实例共享）
+    _chat_model: Optional[ChatOllama] = None
+    _mood_executors: Optional[Mapping[str, RunnableWithMessageHistory]] = None
+    _fused_executor: Optional[RunnableWithMessageHistory] = None
+    _emotion_chain = None
+    _summary_chain = None
+    _compile_lock = threading.Lock()
+    
+    # concurrent 模式：情绪识别线程池，以及各会话最近一次识别出的情绪
+    _emotion_pool = ThreadPoolExecutor(max_workers=min(32, config.AGENT_POOL_SIZE), thread_name_prefix="emotion")
+    _session_moods: "OrderedDict[str, str]" = OrderedDict()
+    _session_moods_lock = threading.Lock()
+    MAX_TRACKED_SESSIONS = 10000
+    
     def __init__(self, session_id: Optional[str] = None):
         """初始化算命大师"""
         # 基础配置
@@ -32,29 +126,73 @@ class Master:
         self.memory_key = config.MEMORY_KEY
         self.current_mood = MoodPrompts.get_default_mood()
         
-        # 初始化聊天模型
-        self.chat_model = self._init_chat_model()
-        
-        # 缓存 Agent 组件，避免重复初始化
-        self._agent_prompt_template = None
-        self._agent_executor = None
-        
-        # 初始化 Agent 执行器
-        self.agent_executor = self._init_agent_executor()
+        # 共享聊天模型与预编译的执行器，避免每个实例重复初始化
+        self._executors = self.compile_executors()
+        self.chat_model = self._chat_model
+    
+    @classmethod
+    def compile_executors(cls) -> Mapping[str, RunnableWithMessageHistory]:
+        """一次性编译全部情绪的提示词模板与执行器，之后按情绪 O(1) 选取"""
+        if cls._mood_executors is None:
+            with cls._compile_lock:
+                if cls._mood_executors is None:
+                    cls._chat_model = cls._init_chat_model()
+                    cls._emotion_chain = cls._init_emotion_chain()
+                    cls._summary_chain = cls._init_summary_chain()
+                    if config.get_emotion_mode() == "fused":
+                        cls._fused_executor = cls._init_agent_executor(
+                            SystemPrompts.get_fused_emotion_prompt(
+                                ", ".join(MoodPrompts.get_all_moods()),
+                                MoodPrompts.get_mood_styles()
+                            ),
+                            cls._clean_fused_output
+                        )
+                    cls._mood_executors = MappingProxyType({
+                        mood: cls._init_agent_executor(MoodPrompts.get_mood_role_set(mood))
+                        for mood in MoodPrompts.get_all_moods()
+                    })
+                    agent_logger.info(f"已预编译 {len(cls._mood_executors)} 种情绪的 Agent 执行器")
+        return cls._mood_executors
     
-    def _init_chat_model(self) -> ChatOllama:
+    @classmethod
+    def _init_chat_model(cls) -> ChatOllama:
         """初始化聊天模型"""
         model_config = config.get_model_config()
-        return ChatOllama(**model_config)
+        return ChatOllama(**model_config, callbacks=[PromptUsageCallback()])
+    
+    @classmethod
+    def _init_emotion_chain(cls):
+        """初始化情绪分析链"""
+        return (
+            ChatPromptTemplate.from_template(SystemPrompts.EMOTION_ANALYSIS_PROMPT) |
+            cls._chat_model |
+            StrOutputParser() |
+            RunnableLambda(delete_think)
+        )
+    
+    @classmethod
+    def _init_summary_chain(cls):
+        """初始化历史对话摘要链"""
+        summary_prompt = ChatPromptTemplate.from_messages([
+            ("system", SystemPrompts.MASTER_SYSTEM_PROMPT + "\n" + 
+             SystemPrompts.CONVERSATION_SUMMARY_PROMPT),
+            ("user", "{input}")
+        ]).partial(who_are_you=MoodPrompts.get_mood_role_set(MoodPrompts.get_default_mood()))
+        
+        return (
+            summary_prompt |
+            cls._chat_model |
+            StrOutputParser() |
+            RunnableLambda(delete_think)
+        )
     
-    def _init_agent_executor(self) -> RunnableWithMessageHistory:
-        """初始化 Agent 执行器"""
+    @classmethod
+    def _init_agent_executor(cls, role_set: str, postprocess=None) -> RunnableWithMessageHistory:
+        """初始化指定角色设定的 Agent 执行器"""
         # 创建提示词模板
         prompt = ChatPromptTemplate.from_messages([
-            ("system", SystemPrompts.get_master_prompt(
-                MoodPrompts.get_mood_role_set(self.current_mood)
-            )),
-            MessagesPlaceholder(self.memory_key),
+            ("system", SystemPrompts.get_master_prompt(role_set)),
+            MessagesPlaceholder(config.MEMORY_KEY),
             ("human", "{input}"),
             MessagesPlaceholder(variable_name="agent_scratchpad"),
         ])
@@ -63,143 +201,341 @@ class Master:
         tools = [search, get_info_from_local_db, bazi_cesuan, yaoyigua, jiemeng]
         
         # 创建 Agent
-        agent = create_openai_tools_agent(self.chat_model, tools, prompt)
+        agent = create_openai_tools_agent(cls._chat_model.with_config(tags=[AGENT_LLM_TAG]), tools, prompt)
         
         # 创建 Agent 执行器
         agent_executor = AgentExecutor(
             agent=agent, 
             tools=tools, 
             verbose=True
-        ) | RunnableLambda(lambda x: {**x, "output": delete_think(x["output"])})
+        ) | RunnableLambda(postprocess or cls._clean_output)
         
         # 添加记忆功能
         return RunnableWithMessageHistory(
             agent_executor,
-            self._get_memory,
+            cls._get_memory,
             output_messages_key="output",
-            history_messages_key=self.memory_key,
+            history_messages_key=config.MEMORY_KEY,
         )
     
-    def run(self, query: str) -> Dict[str, Any]:
-        """运行算命师对话"""
+    @staticmethod
+    def _clean_output(result: Dict[str, Any]) -> Dict[str, Any]:
+        """清洗 Agent 输出中的思考内容"""
+        return {**result, "output": delete_think(result["output"])}
+    
+    @staticmethod
+    def _clean_fused_output(result: Dict[str, Any]) -> Dict[str, Any]:
+        """清洗融合模式输出，并拆出情绪标签"""
+        mood, output = extract_mood_tag(delete_think(result["output"]))
+        return {**result, "output": output, "mood": mood}
+    
+    @property
+    def agent_executor(self) -> RunnableWithMessageHistory:
+        """当前情绪对应的 Agent 执行器"""
+        return self._executors.get(self.current_mood) or self._executors[MoodPrompts.get_default_mood()]
+    
+    def run(self, query: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """运行算命师对话，session_id 按请求绑定，未提供时使用实例默认会话"""
+        session_id = session_id or self.session_id
+        mode = config.get_emotion_mode()
         try:
-            # 情绪分析
-            self._analyze_emotion(query)
-            
-            # 更新提示词（仅在情绪变化时）
-            self._update_prompt_if_needed()
-            
-            # 配置会话
-            config_obj = RunnableConfig(configurable={"session_id": self.session_id})
-            
-            # 执行对话
-            result = self.agent_executor.invoke({'input': query}, config=config_obj)
-            
-            return result
+            with metrics.latency(f"agent.turn.{mode}").time():
+                if mode == "fused":
+                    return self._run_fused(query, session_id)
+                if mode == "concurrent":
+                    return self._run_concurrent(query, session_id)
+                
+                # 情绪分析（决定本轮使用的执行器）
+                self._analyze_emotion(query)
+                
+                # 执行对话
+                return self.agent_executor.invoke({'input': query}, config=self._session_config(session_id))
             
         except Exception as e:
             agent_logger.error(f"对话执行出错: {e}")
             return {"output": "老夫此时无法为你算卦，请稍后再试。"}
     
-    def _analyze_emotion(self, query: str) -> str:
-        """分析用户情绪"""
+    async def arun(self, query: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """异步运行算命师对话，全程不阻塞事件循环"""
+        session_id = session_id or self.session_id
+        mode = config.get_emotion_mode()
         try:
-            emotion_prompt = SystemPrompts.get_emotion_prompt(query)
-            chain = (
-                ChatPromptTemplate.from_template(emotion_prompt) |
-                self.chat_model |
-                StrOutputParser() |
-                RunnableLambda(delete_think)
-            )
-            
-            result = chain.invoke({"query": query})
-            emotion = result.strip()
-            
-            # 验证情绪有效性
-            if MoodPrompts.is_valid_mood(emotion):
-                old_mood = self.current_mood
-                self.current_mood = emotion
-                # 只在情绪变化时记录
-                if old_mood != self.current_mood:
-                    agent_logger.info(f"情绪变化: {old_mood} -> {self.current_mood}")
-            else:
-                self.current_mood = MoodPrompts.get_default_mood()
-            
-            return self.current_mood
+            with metrics.latency(f"agent.turn.{mode}").time():
+                if mode == "fused":
+                    return await self._arun_fused(query, session_id)
+                if mode == "concurrent":
+                    return await self._arun_concurrent(query, session_id)
+                
+                # 情绪分析（决定本轮使用的执行器）
+                self._set_mood(await self._aclassify_emotion(query))
+                
+                # 执行对话
+                return await self.agent_executor.ainvoke({'input': query}, config=self._session_config(session_id))
             
         except Exception as e:
-            agent_logger.error(f"情绪分析失败: {e}")
-            self.current_mood = MoodPrompts.get_default_mood()
-            return self.current_mood
-    
-    def _update_prompt_if_needed(self) -> None:
-        """根据情绪更新提示词（仅在需要时）"""
-        # 只在情绪变化时重新初始化
-        if self._agent_executor is None or self._needs_prompt_update():
-            self._agent_executor = None  # 清空缓存
-            self.agent_executor = self._init_agent_executor()
-    
-    def _needs_prompt_update(self) -> bool:
-        """检查是否需要更新提示词"""
-        # 这里可以添加更精细的逻辑来判断是否需要更新
-        return True  # 目前简化为总是更新
-    
-    def _get_memory(self) -> RedisChatMessageHistory:
-        """获取和管理聊天记录"""
+            agent_logger.error(f"对话执行出错: {e}")
+            return {"output": "老夫此时无法为你算卦，请稍后再试。"}
+    
+    async def astream(self, query: str, session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式运行算命师对话
+        
+        逐段产出 {"type": "token", "content": ...}，结束时产出
+        {"type": "done", "output": ..., "mood": ..., "voice_style": ...}，出错时产出 {"type": "error", ...}
+        """
+        session_id = session_id or self.session_id
+        mode = config.get_emotion_mode()
+        start = time.perf_counter()
+        emotion_task = None
+        holder: Dict[str, Any] = {}
+        emitted = []
         try:
-            redis_config = config.get_redis_config()
-            chat_message_history = RedisChatMessageHistory(
-                session_id=self.session_id,
-                **redis_config
-            )
+            if mode == "fused":
+                executor = self._fused_executor
+            elif mode == "concurrent":
+                self.current_mood = self._get_session_mood(session_id)
+                emotion_task = asyncio.create_task(self._aclassify_emotion(query))
+                executor = self.agent_executor
+            else:
+                self._set_mood(await self._aclassify_emotion(query))
+                executor = self.agent_executor
+            
+            tokens = _filter_think_stream(self._astream_tokens(executor, query, session_id, holder))
+            if mode == "fused":
+                tokens = _strip_mood_stream(tokens, holder)
             
-            agent_logger.debug(f"聊天记录: {chat_message_history.messages}")
-            stored_messages = chat_message_history.messages
+            async for token in tokens:
+                if not emitted:
+                    metrics.latency("agent.stream.first_token").record(time.perf_counter() - start)
+                emitted.append(token)
+                yield {"type": "token", "content": token}
             
-            # 如果历史消息过多，进行摘要
-            if len(stored_messages) > config.MAX_HISTORY_MESSAGES:
-                self._summarize_history(chat_message_history, stored_messages)
+            result = holder.get("result") or {"output": delete_think("".join(emitted))}
+            if mode == "fused":
+                self._set_mood(result.get("mood") or holder.get("mood"))
+            if emotion_task is not None:
+                self._set_mood(await emotion_task)
+                self._remember_session_mood(session_id, self.current_mood)
             
-            return chat_message_history
+            metrics.latency(f"agent.turn.{mode}").record(time.perf_counter() - start)
+            yield {
+                "type": "done",
+                "output": result.get("output", ""),
+                "mood": self.current_mood,
+                "voice_style": self.get_voice_style()
+            }
             
         except Exception as e:
-            agent_logger.error(f"获取聊天记录失败: {e}")
-            # 返回一个默认的历史记录
-            return RedisChatMessageHistory(
-                session_id=self.session_id,
-                url=config.REDIS_URL
-            )
-    
-    def _summarize_history(self, chat_history: RedisChatMessageHistory, messages: list) -> None:
-        """摘要历史对话"""
+            agent_logger.error(f"流式对话执行出错: {e}")
+            if emotion_task is not None and not emotion_task.done():
+                emotion_task.cancel()
+            yield {"type": "error", "content": "老夫此时无法为你算卦，请稍后再试。"}
+    
+    async def _astream_tokens(self, executor: RunnableWithMessageHistory, query: str,
+                              session_id: str, holder: Dict[str, Any]) -> AsyncIterator[str]:
+        """从 Agent 事件流中提取主对话模型的增量文本，完整结果写入 holder["result"]"""
+        async for event in executor.astream_events(
+            {'input': query},
+            config=self._session_config(session_id),
+            version="v2"
+        ):
+            kind = event["event"]
+            if kind == "on_chat_model_stream" and AGENT_LLM_TAG in event.get("tags", []):
+                content = event["data"]["chunk"].content
+                if isinstance(content, str) and content:
+                    yield content
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                output = event["data"].get("output")
+                if isinstance(output, dict):
+                    holder["result"] = output
+    
+    def _run_concurrent(self, query: str, session_id: str) -> Dict[str, Any]:
+        """情绪识别与对话并发执行：本轮沿用会话上一次的情绪，识别结果用于语音风格和下一轮"""
+        self.current_mood = self._get_session_mood(session_id)
+        executor = self.agent_executor
+        future = self._emotion_pool.submit(self._classify_emotion, query)
+        try:
+            return executor.invoke({'input': query}, config=self._session_config(session_id))
+        finally:
+            self._set_mood(future.result())
+            self._remember_session_mood(session_id, self.current_mood)
+    
+    async def _arun_concurrent(self, query: str, session_id: str) -> Dict[str, Any]:
+        """异步版本的并发情绪识别"""
+        self.current_mood = self._get_session_mood(session_id)
+        executor = self.agent_executor
+        emotion_task = asyncio.create_task(self._aclassify_emotion(query))
         try:
-            summary_prompt = ChatPromptTemplate.from_messages([
-                ("system", SystemPrompts.MASTER_SYSTEM_PROMPT + "\n" + 
-                 SystemPrompts.CONVERSATION_SUMMARY_PROMPT),
-                ("user", "{input}")
-            ])
+            return await executor.ainvoke({'input': query}, config=self._session_config(session_id))
+        finally:
+            self._set_mood(await emotion_task)
+            self._remember_session_mood(session_id, self.current_mood)
+    
+    def _run_fused(self, query: str, session_id: str) -> Dict[str, Any]:
+        """情绪识别融入主对话：模型在回答开头输出情绪标签"""
+        result = self._fused_executor.invoke({'input': query}, config=self._session_config(session_id))
+        self._set_mood(result.get("mood"))
+        return result
+    
+    async def _arun_fused(self, query: str, session_id: str) -> Dict[str, Any]:
+        """异步版本的融合情绪识别"""
+        result = await self._fused_executor.ainvoke({'input': query}, config=self._session_config(session_id))
+        self._set_mood(result.get("mood"))
+        return result
+    
+    @staticmethod
+    def _session_config(session_id: str) -> RunnableConfig:
+        """配置会话（按请求绑定，实例可在不同会话间复用）"""
+        return RunnableConfig(configurable={"session_id": session_id})
+    
+    def _analyze_emotion(self, query: str) -> str:
+        """分析用户情绪并更新当前情绪"""
+        self._set_mood(self._classify_emotion(query))
+        return self.current_mood
+    
+    def _classify_emotion(self, query: str) -> str:
+        """识别用户情绪：优先本地分类器，置信度不足时回退大模型，失败或结果无效时返回默认情绪"""
+        mood = self._classify_locally(query)
+        if mood:
+            return mood
+        
+        try:
+            with metrics.latency("agent.emotion.llm").time():
+                result = self._emotion_chain.invoke({"query": query})
+            return self._parse_emotion(result)
             
-            chain = (
-                summary_prompt |
-                self.chat_model |
-                StrOutputParser() |
-                RunnableLambda(delete_think)
-            )
+        except Exception as e:
+            agent_logger.error(f"情绪分析失败: {e}")
+            return MoodPrompts.get_default_mood()
+    
+    async def _aclassify_emotion(self, query: str) -> str:
+        """异步识别用户情绪"""
+        mood = self._classify_locally(query)
+        if mood:
+            return mood
+        
+        try:
+            with metrics.latency("agent.emotion.llm").time():
+                result = await self._emotion_chain.ainvoke({"query": query})
+            return self._parse_emotion(result)
             
-            summary = chain.invoke({
-                "input": messages,
-                "who_are_you": MoodPrompts.get_mood_role_set(self.current_mood)
-            })
+        except Exception as e:
+            agent_logger.error(f"情绪分析失败: {e}")
+            return MoodPrompts.get_default_mood()
+    
+    @staticmethod
+    def _classify_locally(query: str) -> Optional[str]:
+        """本地分类器识别情绪，置信度不足或未启用时返回 None"""
+        if not config.MOOD_CLASSIFIER_ENABLED:
+            return None
+        
+        with metrics.latency("agent.emotion.local").time():
+            prediction = mood_classifier.predict(query)
+        if prediction.confidence >= config.MOOD_CLASSIFIER_THRESHOLD:
+            metrics.increment("mood.local_hits")
+            return prediction.mood
+        
+        metrics.increment("mood.llm_fallbacks")
+        agent_logger.debug(f"本地情绪分类置信度不足({prediction.confidence})，回退大模型")
+        return None
+    
+    @staticmethod
+    def _parse_emotion(result: str) -> str:
+        """验证大模型返回的情绪有效性"""
+        emotion = result.strip()
+        if MoodPrompts.is_valid_mood(emotion):
+            return emotion
+        return MoodPrompts.get_default_mood()
+    
+    def _set_mood(self, mood: Optional[str]) -> None:
+        """更新当前情绪，无效情绪回退为默认情绪"""
+        if not mood or not MoodPrompts.is_valid_mood(mood):
+            mood = MoodPrompts.get_default_mood()
+        old_mood = self.current_mood
+        self.current_mood = mood
+        # 只在情绪变化时记录
+        if old_mood != self.current_mood:
+            agent_logger.info(f"情绪变化: {old_mood} -> {self.current_mood}")
+    
+    @classmethod
+    def _get_session_mood(cls, session_id: str) -> str:
+        """获取会话最近一次识别出的情绪"""
+        with cls._session_moods_lock:
+            return cls._session_moods.get(session_id, MoodPrompts.get_default_mood())
+    
+    @classmethod
+    def _remember_session_mood(cls, session_id: str, mood: str) -> None:
+        """记录会话情绪，超出上限时淘汰最久未使用的会话"""
+        with cls._session_moods_lock:
+            cls._session_moods[session_id] = mood
+            cls._session_moods.move_to_end(session_id)
+            while len(cls._session_moods) > cls.MAX_TRACKED_SESSIONS:
+                cls._session_moods.popitem(last=False)
+    
+    @classmethod
+    def _get_memory(cls, session_id: str) -> RedisChatHistory:
+        """获取聊天记录（仅创建访问对象，不做任何 I/O）；读取有界窗口并按 token 预算组装，溢出时后台折叠摘要"""
+        return RedisChatHistory(
+            session_id=session_id,
+            **config.get_redis_config(),
+            **config.get_memory_config(),
+            on_overflow=cls._schedule_summary,
+            aon_overflow=cls._aschedule_summary,
+            assemble=history_assembler.assemble
+        )
+    
+    @classmethod
+    def _schedule_summary(cls, session_id: str) -> None:
+        """提交历史摘要折叠任务（同一会话已有任务排队或执行中时跳过），不阻塞当前对话"""
+        job_id = f"memory-summary-{session_id}"
+        job = job_queue.get(job_id)
+        if job is not None and job.status in (JOB_QUEUED, JOB_RUNNING):
+            return
+        try:
+            job_queue.submit("memory.summarize", {"session_id": session_id}, job_id=job_id)
+        except QueueFullError:
+            agent_logger.warning(f"任务队列已满，暂缓摘要历史对话: {session_id}")
+    
+    @classmethod
+    async def _aschedule_summary(cls, session_id: str) -> None:
+        """异步提交历史摘要折叠任务（同 _schedule_summary），不阻塞事件循环"""
+        job_id = f"memory-summary-{session_id}"
+        job = await job_queue.aget(job_id)
+        if job is not None and job.status in (JOB_QUEUED, JOB_RUNNING):
+            return
+        try:
+            await job_queue.asubmit("memory.summarize", {"session_id": session_id}, job_id=job_id)
+        except QueueFullError:
+            agent_logger.warning(f"任务队列已满，暂缓摘要历史对话: {session_id}")
+    
+    @classmethod
+    def summarize_session(cls, job: Job) -> Dict[str, Any]:
+        """
+        历史摘要折叠任务：将窗口之外的最早消息与已有摘要合并为新摘要，并从聊天记录中移除这些消息
+        """
+        session_id = job.payload["session_id"]
+        chat_history = cls._get_memory(session_id)
+        if not chat_history.acquire_fold_lock(SUMMARY_LOCK_TIMEOUT):
+            return {"folded": 0}
+        try:
+            stale_messages = chat_history.get_stale_messages()
+            if not stale_messages:
+                return {"folded": 0}
             
-            agent_logger.info(f'历史对话大于{config.MAX_HISTORY_MESSAGES}条，总结历史对话: {summary}')
+            cls.compile_executors()
+            previous = chat_history.get_summary()
+            messages = ([SystemMessage(content=f"此前对话摘要：{previous}")] if previous else []) + stale_messages
+            with metrics.latency("agent.summary").time():
+                summary = cls._summary_chain.invoke({"input": messages})
+            if not summary:
+                raise RuntimeError("摘要结果为空")
             
-            # 清空历史记录并添加摘要
-            chat_history.clear()
-            if summary:
-                chat_history.add_message(SystemMessage(content=str(summary)))
-                
-        except Exception as e:
-            agent_logger.error(f"摘要历史对话失败: {e}")
+            chat_history.fold(str(summary), len(stale_messages))
+            metrics.increment("agent.summary.folded", len(stale_messages))
+            agent_logger.info(f"已将 {len(stale_messages)} 条历史对话折叠进摘要: {summary}")
+            return {"folded": len(stale_messages)}
+        finally:
+            chat_history.release_fold_lock()
     
     def set_session_id(self, session_id: str) -> None:
         """设置会话 ID"""
@@ -213,14 +549,152 @@ class Master:
         """获取当前情绪描述"""
         return MoodPrompts.get_mood_description(self.current_mood)
     
-    def synthesize_speech_background(self, text: str, uid: str) -> None:
-        """后台语音合成任务"""
-        if tts_service.is_available():
-            tts_service.synthesize_speech_background(text, uid, self.current_mood)
-        else:
-            agent_logger.warning("TTS 服务不可用，跳过语音合成")
+    def reset(self) -> None:
+        """重置单次对话状态，归还实例池前调用"""
+        self.current_mood = MoodPrompts.get_default_mood()
     
     def get_voice_style(self) -> str:
         """获取当前情绪对应的语音风格"""
         return MoodPrompts.get_voice_style(self.current_mood)
 
+
+class MasterPool:
+    """算命大师实例池 - 进程级共享，启动时预热，请求按需借用并归还"""
+    
+    def __init__(self, max_size: Optional[int] = None, min_size: Optional[int] = None,
+                 acquire_timeout: Optional[float] = None):
+        pool_config = config.get_agent_pool_config()
+        self.max_size = max(1, max_size or pool_config["max_size"])
+        self.min_size = min(
+            min_size if min_size is not None else pool_config["min_size"],
+            self.max_size
+        )
+        self.acquire_timeout = acquire_timeout or pool_config["acquire_timeout"]
+        
+        # 空闲实例（后进先出，优先复用刚归还的实例）
+        self._idle: "queue.LifoQueue[Master]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        
+        # 统计指标
+        self._created = 0
+        self._in_use = 0
+        self._borrowed_total = 0
+        self._waited_total = 0
+        self._timeouts = 0
+    
+    def warm_up(self) -> None:
+        """预热实例池，创建 min_size 个实例"""
+        while self._reserve_slot(limit=self.min_size):
+            self._idle.put(self._create_master())
+        agent_logger.info(f"算命大师实例池预热完成: {self._created}/{self.max_size}")
+    
+    def acquire(self) -> Master:
+        """借用一个实例，池满时等待其他请求归还"""
+        master = self._try_acquire()
+        if master is not None:
+            return master
+        
+        with self._lock:
+            self._waited_total += 1
+        try:
+            master = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise TimeoutError("算命大师实例池已满，等待超时")
+        
+        self._mark_borrowed()
+        return master
+    
+    def release(self, master: Master) -> None:
+        """归还实例"""
+        master.reset()
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(master)
+    
+    @contextmanager
+    def borrow(self) -> Iterator[Master]:
+        """以上下文管理器方式借用实例，退出时自动归还"""
+        master = self.acquire()
+        try:
+            yield master
+        finally:
+            self.release(master)
+    
+    @asynccontextmanager
+    async def aborrow(self) -> AsyncIterator[Master]:
+        """异步借用实例，池满时在线程中等待，不阻塞事件循环；等待中被取消时，线程借到的实例会自动归还"""
+        master = self._try_acquire()
+        if master is None:
+            waiter = asyncio.ensure_future(asyncio.to_thread(self.acquire))
+            try:
+                master = await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                waiter.add_done_callback(self._release_abandoned)
+                raise
+        try:
+            yield master
+        finally:
+            self.release(master)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取实例池占用情况"""
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "size": self._created,
+                "idle": self._idle.qsize(),
+                "in_use": self._in_use,
+                "occupancy": round(self._in_use / self.max_size, 3),
+                "borrowed_total": self._borrowed_total,
+                "waited_total": self._waited_total,
+                "timeouts": self._timeouts
+            }
+    
+    def _try_acquire(self) -> Optional[Master]:
+        """不等待地借用实例：优先复用空闲实例，其次在上限内新建，否则返回 None"""
+        try:
+            master = self._idle.get_nowait()
+        except queue.Empty:
+            if not self._reserve_slot(limit=self.max_size):
+                return None
+            master = self._create_master()
+        
+        self._mark_borrowed()
+        return master
+    
+    def _release_abandoned(self, waiter: "asyncio.Future[Master]") -> None:
+        """归还已取消的异步借用在线程中借到的实例"""
+        if not waiter.cancelled() and waiter.exception() is None:
+            self.release(waiter.result())
+    
+    def _mark_borrowed(self) -> None:
+        """记录一次借出"""
+        with self._lock:
+            self._in_use += 1
+            self._borrowed_total += 1
+    
+    def _reserve_slot(self, limit: int) -> bool:
+        """在不超过 limit 的前提下预占一个新实例名额"""
+        with self._lock:
+            if self._created >= limit:
+                return False
+            self._created += 1
+            return True
+    
+    def _create_master(self) -> Master:
+        """创建新实例，失败时释放预占的名额"""
+        try:
+            return Master()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+
+# 历史摘要折叠在后台任务队列中执行
+job_queue.register("memory.summarize", Master.summarize_session)
+
+# 全局算命大师实例池
+master_pool = MasterPool()
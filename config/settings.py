@@ -22,31 +22,107 @@ class BotConfig:
     # 数据库配置
     QDRANT_PATH = os.getenv("QDRANT_PATH")
     QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME")
+    QDRANT_URL = os.getenv("QDRANT_URL", "")  # 设置后连接 Qdrant 服务端，否则使用 QDRANT_PATH 本地存储
+    QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "")
     REDIS_URL = os.getenv("REDIS_URL")
+    REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))  # 进程内共享连接池上限
+    REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))  # 连接池用尽时等待空闲连接的时间(秒)
+    REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))  # 单次命令读写超时(秒)，需大于 BRPOP 等待时间
     
     # Agent 配置
     DEFAULT_SESSION_ID = os.getenv("DEFAULT_SESSION_ID")
     MEMORY_KEY = os.getenv("MEMORY_KEY")
-    MAX_HISTORY_MESSAGES = int(os.getenv("MAX_HISTORY_MESSAGES"))  # 超过此数量会进行摘要
+    MAX_HISTORY_MESSAGES = int(os.getenv("MAX_HISTORY_MESSAGES"))  # 保留原文的最近消息数，更早的消息折叠进摘要
+    HISTORY_SUMMARY_BATCH = int(os.getenv("HISTORY_SUMMARY_BATCH", "6"))  # 超出窗口多少条后触发一次后台摘要
+    HISTORY_TTL = int(os.getenv("HISTORY_TTL", "604800"))  # 会话记录多久无新消息后过期(秒)，0 表示不过期
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2048"))  # 注入提示词的历史消息 token 上限
+    TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")  # 安装 tiktoken 时使用的编码
+    TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "4096"))  # token 计数结果缓存条数
+
+    # 情绪识别模式: sequential(先识别再对话) / concurrent(与对话并发) / fused(融入主对话输出)
+    EMOTION_MODE = os.getenv("EMOTION_MODE", "sequential").lower()
+    EMOTION_MODES = ["sequential", "concurrent", "fused"]
+    # 本地情绪分类器：置信度低于阈值时才回退到大模型
+    MOOD_CLASSIFIER_ENABLED = os.getenv("MOOD_CLASSIFIER_ENABLED", "true").lower() == "true"
+    MOOD_CLASSIFIER_THRESHOLD = float(os.getenv("MOOD_CLASSIFIER_THRESHOLD", "0.5"))
     
+    # Agent 实例池配置
+    AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "256"))  # 池中实例上限（即单进程并发对话数）
+    AGENT_POOL_MIN_SIZE = int(os.getenv("AGENT_POOL_MIN_SIZE", "2"))  # 启动时预热的实例数
+    AGENT_POOL_ACQUIRE_TIMEOUT = float(os.getenv("AGENT_POOL_ACQUIRE_TIMEOUT", "30"))  # 借用等待超时(秒)
+
+    # 知识库检索配置（MMR）
+    KB_SEARCH_K = int(os.getenv("KB_SEARCH_K", "4"))  # 返回文档数
+    KB_FETCH_K = int(os.getenv("KB_FETCH_K", "20"))  # MMR 候选文档数
+    KB_MMR_LAMBDA = float(os.getenv("KB_MMR_LAMBDA", "0.5"))  # 相关性与多样性的权衡
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))  # 查询向量缓存条目上限
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")  # 缓存落盘路径(.npz)，留空不落盘
+    # 语义缓存：相近问题直接复用检索结果，知识库入库后自动失效
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1024"))  # 条目上限
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))  # 余弦相似度阈值
+    SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "86400"))  # 过期时间(秒)
+    SEMANTIC_CACHE_REDIS = os.getenv("SEMANTIC_CACHE_REDIS", "false").lower() == "true"  # 通过 Redis 同步失效（多副本）
+
+    # 知识库入库配置
+    INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "800"))  # 文本块大小
+    INGEST_CHUNK_OVERLAP = int(os.getenv("INGEST_CHUNK_OVERLAP", "50"))  # 文本块重叠
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))  # 每批向量化并写入的文本块数
+    INGEST_FETCH_CONCURRENCY = int(os.getenv("INGEST_FETCH_CONCURRENCY", "8"))  # 单个任务的并发抓取数
+    INGEST_UPLOAD_DIR = os.getenv("INGEST_UPLOAD_DIR", "")  # 上传文件暂存目录，留空使用系统临时目录
+    KB_MANIFEST_PATH = os.getenv("KB_MANIFEST_PATH", "kb_manifest.json")  # 知识库来源清单文件
+    KB_MANIFEST_REDIS = os.getenv("KB_MANIFEST_REDIS", "false").lower() == "true"  # 来源清单存入 Redis（多副本共享）
+
+    # 后台任务队列（知识库入库、语音合成）
+    JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "local").lower()  # local(进程内) / redis(多副本共享)
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))  # 每个队列实时通道（语音合成、记忆摘要）的工作线程数
+    JOB_BULK_WORKERS = int(os.getenv("JOB_BULK_WORKERS", "1"))  # 每个队列批量通道（知识库导入）的工作线程数
+    JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "1000"))  # 排队任务上限，超出时拒绝提交
+    JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "2"))  # 失败重试次数
+    JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "1.0"))  # 重试退避基数(秒)
+    JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "86400"))  # Redis 中任务记录保留时间(秒)
+    JOB_MAX_RECORDS = int(os.getenv("JOB_MAX_RECORDS", "1000"))  # 进程内保留的任务记录上限
+
     # API 配置
     SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
     YUANFENJU_API_KEY = os.getenv("YUANFENJU_API_KEY")
     MICROSOFT_TTS_KEY = os.getenv("MICROSOFT_TTS_KEY")
     
+    # 工具结果缓存（八字排盘、解梦等确定性查询）
+    RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))  # 进程内缓存条目上限
+    RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))  # 过期时间(秒)
+    RESULT_CACHE_REDIS = os.getenv("RESULT_CACHE_REDIS", "false").lower() == "true"  # 是否启用 Redis 共享层
+    
     # TTS 配置
     TTS_ENDPOINT = os.getenv("TTS_ENDPOINT")
     TTS_VOICE_NAME = os.getenv("TTS_VOICE_NAME")
     TTS_OUTPUT_FORMAT = os.getenv("TTS_OUTPUT_FORMAT")
     AUDIO_OUTPUT_DIR = os.getenv("AUDIO_OUTPUT_DIR")
+    TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "8"))  # 同时进行的合成请求上限
+    TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "30"))  # 合成请求读取超时(秒)
+    TTS_SENTENCE_MAX_CHARS = int(os.getenv("TTS_SENTENCE_MAX_CHARS", "120"))  # 分句合成时单句最大字数
+    TTS_SENTENCE_MIN_CHARS = int(os.getenv("TTS_SENTENCE_MIN_CHARS", "12"))  # 过短的句子与下一句合并
+    TTS_STREAM_TIMEOUT = float(os.getenv("TTS_STREAM_TIMEOUT", "120"))  # 音频流最长等待时间(秒)
+    TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+    AUDIO_STORE_MAX_MB = int(os.getenv("AUDIO_STORE_MAX_MB", "2048"))  # 音频目录总大小上限(MB)
+    AUDIO_STORE_TTL_HOURS = float(os.getenv("AUDIO_STORE_TTL_HOURS", "168"))  # 音频多久未访问后删除(小时)，0 表示不过期
+    AUDIO_STORE_SWEEP_INTERVAL = float(os.getenv("AUDIO_STORE_SWEEP_INTERVAL", "300"))  # 后台清理间隔(秒)
     
-    # 缘分居 API 端点
+    # 缘分居 API 端点（可通过 YUANFENJU_BASE_URL 指向本地替身服务）
+    YUANFENJU_BASE_URL = os.getenv("YUANFENJU_BASE_URL", "https://api.yuanfenju.com/index.php/v1").rstrip("/")
     YUANFENJU_ENDPOINTS = {
-        "bazi_cesuan": "https://api.yuanfenju.com/index.php/v1/Bazi/cesuan",
-        "yaoyigua": "https://api.yuanfenju.com/index.php/v1/Zhanbu/meiri", 
-        "jiemeng": "https://api.yuanfenju.com/index.php/v1/Gongju/zhougong"
+        "bazi_cesuan": f"{YUANFENJU_BASE_URL}/Bazi/cesuan",
+        "yaoyigua": f"{YUANFENJU_BASE_URL}/Zhanbu/meiri", 
+        "jiemeng": f"{YUANFENJU_BASE_URL}/Gongju/zhougong"
     }
     
+    # 外部 HTTP 调用配置
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))  # 读取超时(秒)
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))  # 连接超时(秒)
+    HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))  # 最大重试次数
+    HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))  # 退避基数(秒)
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))  # 每个客户端的连接池大小
+    
     # 情绪列表
     MOOD_TYPES = ["default", "upbeat", "angry", "depressed", "friendly", "cheerful"]
     
@@ -71,6 +147,8 @@ class BotConfig:
         """获取 Qdrant 配置"""
         return {
             "path": cls.QDRANT_PATH,
+            "url": cls.QDRANT_URL,
+            "api_key": cls.QDRANT_API_KEY,
             "collection_name": cls.QDRANT_COLLECTION_NAME
         }
     
@@ -81,6 +159,144 @@ class BotConfig:
             "url": cls.REDIS_URL
         }
 
+    @classmethod
+    def get_redis_pool_config(cls) -> Dict[str, Any]:
+        """获取 Redis 连接池配置"""
+        return {
+            "max_connections": cls.REDIS_MAX_CONNECTIONS,
+            "timeout": cls.REDIS_POOL_TIMEOUT,
+            "socket_timeout": cls.REDIS_SOCKET_TIMEOUT,
+            "health_check_interval": 30
+        }
+
+    @classmethod
+    def get_memory_config(cls) -> Dict[str, Any]:
+        """获取会话记忆配置"""
+        return {
+            "window": cls.MAX_HISTORY_MESSAGES,
+            "overflow": cls.HISTORY_SUMMARY_BATCH,
+            "ttl": cls.HISTORY_TTL or None
+        }
+
+    @classmethod
+    def get_token_budget_config(cls) -> Dict[str, Any]:
+        """获取提示词 token 预算配置"""
+        return {
+            "history_budget": cls.HISTORY_TOKEN_BUDGET,
+            "encoding": cls.TOKENIZER_ENCODING,
+            "cache_size": cls.TOKEN_COUNT_CACHE_SIZE
+        }
+
+    @classmethod
+    def get_agent_pool_config(cls) -> Dict[str, Any]:
+        """获取 Agent 实例池配置"""
+        return {
+            "max_size": cls.AGENT_POOL_SIZE,
+            "min_size": cls.AGENT_POOL_MIN_SIZE,
+            "acquire_timeout": cls.AGENT_POOL_ACQUIRE_TIMEOUT
+        }
+
+    @classmethod
+    def get_http_config(cls) -> Dict[str, Any]:
+        """获取外部 HTTP 调用配置"""
+        return {
+            "timeout": cls.HTTP_TIMEOUT,
+            "connect_timeout": cls.HTTP_CONNECT_TIMEOUT,
+            "max_retries": cls.HTTP_MAX_RETRIES,
+            "backoff": cls.HTTP_RETRY_BACKOFF,
+            "pool_size": cls.HTTP_POOL_SIZE
+        }
+
+    @classmethod
+    def get_result_cache_config(cls) -> Dict[str, Any]:
+        """获取工具结果缓存配置"""
+        return {
+            "max_size": cls.RESULT_CACHE_SIZE,
+            "ttl": cls.RESULT_CACHE_TTL,
+            "use_redis": cls.RESULT_CACHE_REDIS
+        }
+
+    @classmethod
+    def get_kb_search_config(cls) -> Dict[str, Any]:
+        """获取知识库检索配置"""
+        return {
+            "k": cls.KB_SEARCH_K,
+            "fetch_k": cls.KB_FETCH_K,
+            "lambda_mult": cls.KB_MMR_LAMBDA
+        }
+
+    @classmethod
+    def get_embedding_cache_config(cls) -> Dict[str, Any]:
+        """获取查询向量缓存配置"""
+        return {
+            "max_size": cls.EMBEDDING_CACHE_SIZE,
+            "path": cls.EMBEDDING_CACHE_PATH
+        }
+
+    @classmethod
+    def get_semantic_cache_config(cls) -> Dict[str, Any]:
+        """获取语义缓存配置"""
+        return {
+            "enabled": cls.SEMANTIC_CACHE_ENABLED,
+            "max_size": cls.SEMANTIC_CACHE_SIZE,
+            "threshold": cls.SEMANTIC_CACHE_THRESHOLD,
+            "ttl": cls.SEMANTIC_CACHE_TTL,
+            "redis": cls.SEMANTIC_CACHE_REDIS
+        }
+
+    @classmethod
+    def get_ingest_config(cls) -> Dict[str, Any]:
+        """获取知识库入库配置"""
+        return {
+            "chunk_size": cls.INGEST_CHUNK_SIZE,
+            "chunk_overlap": cls.INGEST_CHUNK_OVERLAP,
+            "batch_size": cls.INGEST_BATCH_SIZE,
+            "fetch_concurrency": cls.INGEST_FETCH_CONCURRENCY,
+            "upload_dir": cls.INGEST_UPLOAD_DIR
+        }
+
+    @classmethod
+    def get_job_queue_config(cls) -> Dict[str, Any]:
+        """获取后台任务队列配置"""
+        return {
+            "backend": cls.JOB_QUEUE_BACKEND,
+            "workers": cls.JOB_WORKERS,
+            "bulk_workers": cls.JOB_BULK_WORKERS,
+            "max_size": cls.JOB_QUEUE_SIZE,
+            "max_retries": cls.JOB_MAX_RETRIES,
+            "retry_backoff": cls.JOB_RETRY_BACKOFF,
+            "result_ttl": cls.JOB_RESULT_TTL,
+            "max_records": cls.JOB_MAX_RECORDS
+        }
+
+    @classmethod
+    def get_tts_engine_config(cls) -> Dict[str, Any]:
+        """获取语音合成引擎配置"""
+        return {
+            "max_concurrency": cls.TTS_MAX_CONCURRENCY,
+            "timeout": cls.TTS_TIMEOUT,
+            "sentence_max_chars": cls.TTS_SENTENCE_MAX_CHARS,
+            "sentence_min_chars": cls.TTS_SENTENCE_MIN_CHARS,
+            "stream_timeout": cls.TTS_STREAM_TIMEOUT
+        }
+
+    @classmethod
+    def get_audio_store_config(cls) -> Dict[str, Any]:
+        """获取音频仓库配置"""
+        return {
+            "root": cls.AUDIO_OUTPUT_DIR or "audio",
+            "max_bytes": cls.AUDIO_STORE_MAX_MB * 1024 * 1024,
+            "ttl": cls.AUDIO_STORE_TTL_HOURS * 3600,
+            "sweep_interval": cls.AUDIO_STORE_SWEEP_INTERVAL
+        }
+
+    @classmethod
+    def get_emotion_mode(cls) -> str:
+        """获取情绪识别模式，无效值回退为 sequential"""
+        if cls.EMOTION_MODE in cls.EMOTION_MODES:
+            return cls.EMOTION_MODE
+        return "sequential"
+
     @classmethod
     def validate_config(cls) -> bool:
         """验证配置完整性"""
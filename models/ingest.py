@@ -0,0 +1,22 @@
+"""
+Mystical Oracle Ingest Models - 知识库入库请求模型
+"""
+from typing import List
+
+from pydantic import BaseModel, field_validator
+
+
+class UrlIngestRequest(BaseModel):
+    """批量网页入库请求"""
+    urls: List[str]  # 待抓取的网页地址
+
+    @field_validator('urls')
+    @classmethod
+    def validate_urls(cls, v):
+        """验证网页地址"""
+        if not v:
+            raise ValueError('至少需要一个网页地址')
+        for url in v:
+            if not url.startswith(('http://', 'https://')):
+                raise ValueError(f'无效的 URL: {url}')
+        return v
@@ -88,6 +88,16 @@ class MoodPrompts:
         """获取所有可用的情绪类型"""
         return list(cls.MOODS.keys())
     
+    @classmethod
+    def get_mood_styles(cls) -> str:
+        """汇总所有情绪的回复风格，用于融合情绪识别提示词"""
+        styles = []
+        for mood, settings in cls.MOODS.items():
+            lines = [line.strip() for line in settings["roleSet"].splitlines() if line.strip()]
+            role_set = "\n".join(lines) or "- 正常对话，保持你的个人设定即可。"
+            styles.append(f"{mood}（{settings['description']}）:\n{role_set}")
+        return "\n".join(styles)
+    
     @classmethod
     def is_valid_mood(cls, mood: str) -> bool:
         """检查情绪是否有效"""
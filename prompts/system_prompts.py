@@ -44,6 +44,15 @@ class SystemPrompts:
         8. 只返回英文，不允许有换行符等其他内容，否则会受到惩罚。
         用户输入的内容是:{query}"""
     
+    # 融合情绪识别提示词（在主对话中同时输出情绪标签）
+    FUSED_EMOTION_PROMPT = """
+        回答之前你需要先判断用户此刻的情绪，规则如下：
+        1. 情绪只能是以下之一：{mood_list}，偏负面或悲伤为depressed，偏正面为friendly，中性为default，包含辱骂或不礼貌词句为angry，比较兴奋为upbeat，比较开心为cheerful。
+        2. 回答的第一行必须是<mood>情绪</mood>，例如<mood>default</mood>，然后换行再给出回答，否则将受到惩罚。
+        3. 根据判断出的情绪采用对应的回复风格：
+        {mood_styles}
+        """
+    
     # 对话摘要提示词
     CONVERSATION_SUMMARY_PROMPT = """这是一段你和用户的对话记忆，对其进行总结摘要，摘要使用第一人称'我'，并且提取其中的用户关键信息，如姓名、年龄、性别、出生日期等。以如下格式返回:
          总结摘要内容｜用户关键信息 
@@ -80,6 +89,11 @@ class SystemPrompts:
         """获取格式化的主提示词"""
         return cls.MASTER_SYSTEM_PROMPT.format(who_are_you=mood_role_set)
     
+    @classmethod
+    def get_fused_emotion_prompt(cls, mood_list: str, mood_styles: str) -> str:
+        """获取格式化的融合情绪识别提示词"""
+        return cls.FUSED_EMOTION_PROMPT.format(mood_list=mood_list, mood_styles=mood_styles)
+    
     @classmethod
     def get_emotion_prompt(cls, query: str) -> str:
         """获取格式化的情绪分析提示词"""
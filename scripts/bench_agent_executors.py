@@ -0,0 +1,62 @@
+"""
+Agent 执行器选取耗时基准：对比每轮对话重建执行器（旧实现）与按情绪选取预编译执行器（现实现）的单轮开销
+不调用大模型，只测量构建/选取执行器本身的耗时
+
+用法: python scripts/bench_agent_executors.py [--turns 200]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent import Master  # noqa: E402
+from prompts.mood_prompts import MoodPrompts  # noqa: E402
+
+
+def measure(func, turns: int) -> list:
+    """逐轮计时，返回每轮耗时(微秒)"""
+    moods = MoodPrompts.get_all_moods()
+    samples = []
+    for turn in range(turns):
+        mood = moods[turn % len(moods)]
+        started = time.perf_counter()
+        func(mood)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+def report(name: str, samples: list) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<10} mean {statistics.mean(samples):>10.1f} us   p50 {statistics.median(samples):>10.1f} us   p95 {p95:>10.1f} us")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200, help="模拟的对话轮数")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    master = Master()
+    print(f"预编译 {len(MoodPrompts.get_all_moods())} 种情绪执行器: {(time.perf_counter() - started) * 1e3:.1f} ms（每个进程一次）")
+
+    def rebuild(mood: str) -> None:
+        # 旧实现：每轮按当前情绪重建提示词模板、Agent 与执行器
+        Master._init_agent_executor(MoodPrompts.get_mood_role_set(mood))
+
+    def select(mood: str) -> None:
+        master.current_mood = mood
+        master.agent_executor
+
+    before = measure(rebuild, args.turns)
+    after = measure(select, args.turns)
+    report("rebuild", before)
+    report("cached", after)
+    print(f"单轮开销降低 {statistics.mean(before) / statistics.mean(after):.0f} 倍")
+
+
+if __name__ == "__main__":
+    main()
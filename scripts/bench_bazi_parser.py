@@ -0,0 +1,88 @@
+"""
+八字参数规则解析基准：统计规则解析（快速路径）对查询日志的覆盖率、单次解析耗时，以及省下的大模型调用耗时
+
+查询日志为文本文件，每行一条八字测算请求；未指定时使用内置的示例日志。
+--llm 时对若干条查询实际调用大模型参数提取链，测得单次耗时后估算节省的总耗时（需要 Ollama 服务）；
+否则可用 --llm-ms 指定大模型单次耗时做估算
+
+用法: python scripts/bench_bazi_parser.py [--log queries.txt] [--llm | --llm-ms 1500] [--repeat 200]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.bazi_parser import bazi_parser  # noqa: E402
+
+# 内置示例日志：常见写法与需要回退大模型的写法混合
+SAMPLE_LOG = """
+我叫张三，男，1990年5月12日早上8点出生
+我叫李梅，女，1988-03-07 14:30 出生
+姓名：王小明，性别：男，生于1995/12/01 23:15
+我叫赵丽，我是女生，农历一九九二年腊月初八子时生
+名叫孙强 男 19851020 下午三点半
+我叫周敏，本人女，公历2001年十二月二十日晚上十点十分出生
+我是吴刚，男，99年8月8日凌晨一点出生
+我叫郑爽，我是男的，阴历1990年正月十五中午12点
+我叫许诺，男，农历1990年三月初三8点出生
+我叫蒋涛，男，1991年2月3日晚上12点出生
+帮我算算八字，我是90年的
+我叫陈静，1995年3月8日早上8点出生，帮我和男朋友合八字
+我叫韩梅，女，1996年4月5日生，一时想不起几点
+我老公1987年冬月初六生的，帮他看看
+我叫刘洋，男，1993年6月18日晚上九点左右出生
+小王，女，2000年1月1日0点
+我叫何军，男，1989年6月6日出生
+我叫冯静，性别女，1993年7月9日一点钟出生
+本人林峰，男，1984年8月15日下午2点10分出生
+我女儿2015年5月20日上午10点出生，叫朵朵
+""".strip()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", help="查询日志文件，每行一条查询")
+    parser.add_argument("--llm", action="store_true", help="实际调用大模型测量单次参数提取耗时")
+    parser.add_argument("--llm-ms", type=float, help="不调用大模型时假定的单次提取耗时(毫秒)")
+    parser.add_argument("--llm-samples", type=int, default=3, help="--llm 时调用大模型的查询数")
+    parser.add_argument("--repeat", type=int, default=200, help="规则解析重复次数，取平均")
+    args = parser.parse_args()
+
+    raw = Path(args.log).read_text(encoding="utf-8") if args.log else SAMPLE_LOG
+    queries = [line.strip() for line in raw.splitlines() if line.strip()]
+
+    hits, timings = 0, []
+    for query in queries:
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            user = bazi_parser.parse(query)
+        timings.append((time.perf_counter() - started) / args.repeat * 1e6)
+        hits += user is not None
+
+    print(f"查询数: {len(queries)}")
+    print(f"快速路径覆盖率: {hits / len(queries):.3f} ({hits}/{len(queries)})")
+    print(f"规则解析耗时: mean {statistics.mean(timings):.1f} us, max {max(timings):.1f} us")
+
+    llm_ms = args.llm_ms
+    if args.llm:
+        from services.tools import _bazi_param_chain
+        chain, samples = _bazi_param_chain(), []
+        for query in queries[:args.llm_samples]:
+            started = time.perf_counter()
+            chain.invoke({"query": query})
+            samples.append((time.perf_counter() - started) * 1e3)
+        llm_ms = statistics.mean(samples)
+        print(f"大模型参数提取耗时: mean {llm_ms:.0f} ms ({len(samples)} 次)")
+    if llm_ms:
+        rule_ms = sum(timings) / 1e3
+        saved = hits * llm_ms - rule_ms
+        print(f"省下的大模型耗时: {saved / 1e3:.2f} s（平均每条查询 {saved / len(queries):.0f} ms）")
+    else:
+        print(f"省下的大模型调用: {hits} 次（用 --llm 或 --llm-ms 估算耗时）")
+
+
+if __name__ == "__main__":
+    main()
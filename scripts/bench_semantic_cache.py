@@ -0,0 +1,119 @@
+"""
+语义缓存命中率基准：按顺序回放查询日志，统计知识库检索结果的语义缓存命中率
+
+- exact: 只有归一化后完全相同的查询才复用结果（仅有查询向量缓存时的情况）
+- semantic@阈值: 经 SemanticCache 按余弦相似度复用结果
+
+查询日志为文本文件，每行一条查询；未指定时使用内置的示例日志。
+默认用 Ollama 嵌入模型计算向量（与线上一致）；--embed bigram 使用字符二元组向量离线估算（无需模型服务）
+
+用法: python scripts/bench_semantic_cache.py [--log queries.txt] [--embed ollama|bigram] [--thresholds 0.85 0.9 0.95]
+"""
+import argparse
+import hashlib
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from services.embedding_cache import normalize_query  # noqa: E402
+from services.semantic_cache import SemanticCache  # noqa: E402
+
+# 内置示例日志：同一问题的不同说法穿插出现
+SAMPLE_LOG = """
+白羊座今年运势怎么样
+白羊座今年的运势如何
+今年白羊座运势怎么样？
+双子座的性格特点
+双子座性格有什么特点
+狮子座和天蝎座配不配
+狮子座跟天蝎座合不合适
+白羊座今年运势怎么样
+属龙的人今年财运如何
+属龙今年财运怎么样
+属龙的人2026年财运
+处女座最近感情运势
+处女座近期的感情运
+梦见掉牙是什么意思
+天秤座适合什么工作
+天秤座适合做什么工作
+双子座的性格特点
+水瓶座和双鱼座配吗
+水瓶座跟双鱼座配不配
+属蛇的本命年要注意什么
+属蛇本命年需要注意什么
+摩羯座今年事业运
+摩羯座今年的事业运势
+巨蟹座的幸运颜色
+巨蟹座幸运色是什么
+狮子座和天蝎座配不配
+射手座今年桃花运
+射手座今年桃花运怎么样
+金牛座性格
+金牛座的性格是怎样的
+属龙的人今年财运如何
+处女座最近感情运势
+""".strip()
+
+
+def bigram_embed(texts: List[str], dim: int = 1024) -> List[List[float]]:
+    """离线估算用的字符二元组哈希向量"""
+    vectors = []
+    for text in texts:
+        vector = np.zeros(dim, dtype=np.float32)
+        text = normalize_query(text)
+        for i in range(len(text) - 1):
+            bucket = int.from_bytes(hashlib.md5(text[i:i + 2].encode("utf-8")).digest()[:4], "little") % dim
+            vector[bucket] += 1.0
+        vectors.append(vector.tolist())
+    return vectors
+
+
+def ollama_embed(texts: List[str]) -> List[List[float]]:
+    """线上嵌入模型"""
+    from services.knowledge_base import knowledge_base
+    return knowledge_base.embeddings.embed_documents(texts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", help="查询日志文件，每行一条查询")
+    parser.add_argument("--embed", choices=("ollama", "bigram"), default="ollama", help="向量来源")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.85, 0.9, 0.95], help="待比较的相似度阈值")
+    args = parser.parse_args()
+
+    raw = Path(args.log).read_text(encoding="utf-8") if args.log else SAMPLE_LOG
+    queries = [line.strip() for line in raw.splitlines() if line.strip()]
+    vectors = (ollama_embed if args.embed == "ollama" else bigram_embed)(queries)
+    print(f"查询数: {len(queries)}, 向量: {args.embed}")
+
+    seen = set()
+    exact_hits = 0
+    for query in queries:
+        key = normalize_query(query)
+        exact_hits += key in seen
+        seen.add(key)
+    print(f"{'exact':<16} 命中率 {exact_hits / len(queries):.3f}")
+
+    for threshold in args.thresholds:
+        cache = SemanticCache(f"bench{threshold}", max_size=len(queries), threshold=threshold, ttl=0)
+        cache.enabled = True
+        hits = 0
+        lookup = 0.0
+        for query, vector in zip(queries, vectors):
+            started = time.perf_counter()
+            cached = cache.get(vector)
+            lookup += time.perf_counter() - started
+            if cached is None:
+                cache.set(vector, query)
+            else:
+                hits += 1
+        print(f"{f'semantic@{threshold}':<16} 命中率 {hits / len(queries):.3f}   平均查找 {lookup / len(queries) * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
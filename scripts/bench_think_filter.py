@@ -0,0 +1,78 @@
+"""
+<think> 过滤基准：对比旧的正则实现与增量 ThinkFilter 在多 KB 流式输出上的耗时
+
+- regex-stream: 旧实现下流式输出只能每收到一块就对累积文本重新执行正则（O(n²)）
+- regex-final: 旧实现对完整文本执行一次正则（非流式的下限）
+- filter-stream: ThinkFilter 逐块过滤，每块 O(块长)
+
+用法: python scripts/bench_think_filter.py [--chunk 8] [--repeat 20]
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.helpers import ThinkFilter  # noqa: E402
+
+
+def regex_delete_think(text: str) -> str:
+    """旧实现：两次整串正则"""
+    cleaned_text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
+    return re.sub(r"\s+", " ", cleaned_text).strip()
+
+
+def make_output(size: int) -> str:
+    """构造模型输出：开头一段思考内容，其后是多段正文"""
+    think = "<think>\n" + "先分析用户的八字与流年运势。" * (size // 80) + "\n</think>\n\n"
+    body = "施主今年财运亨通，宜守不宜攻。\n\n" * (size // 30)
+    return think + body
+
+
+def chunked(text: str, size: int) -> list:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def timed(func, repeat: int) -> float:
+    """重复执行取最短耗时(毫秒)"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk", type=int, default=8, help="流式块大小(字符)，约等于一个 token")
+    parser.add_argument("--repeat", type=int, default=20, help="每项重复次数，取最短耗时")
+    args = parser.parse_args()
+
+    print(f"{'bytes':>8} {'chunks':>7} {'regex-stream':>15} {'regex-final':>15} {'filter-stream':>15}")
+    for size in (2048, 8192, 32768):
+        text = make_output(size)
+        chunks = chunked(text, args.chunk)
+
+        def regex_stream():
+            buffer = ""
+            for chunk in chunks:
+                buffer += chunk
+                regex_delete_think(buffer)
+
+        def filter_stream():
+            think_filter = ThinkFilter()
+            for chunk in chunks:
+                think_filter.feed(chunk)
+            think_filter.flush()
+
+        results = [timed(func, args.repeat) for func in
+                   (regex_stream, lambda: regex_delete_think(text), filter_stream)]
+        print(f"{len(text.encode('utf-8')):>8} {len(chunks):>7} "
+              + " ".join(f"{value:>12.3f} ms" for value in results))
+
+
+if __name__ == "__main__":
+    main()
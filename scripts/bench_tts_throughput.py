@@ -0,0 +1,134 @@
+"""
+语音合成吞吐基准：对本地模拟 TTS 服务提交一批合成任务，对比旧实现与现实现的 jobs/sec
+
+- before: 旧实现，每个任务 asyncio.run 新建事件循环，整段文本一次阻塞 requests.post
+- after-whole: 现实现的引擎（常驻循环、共享连接池、并发上限），整段文本一次请求，与 before 请求模式相同
+- after-split: 现实现默认行为，分句并行请求（首句更早可播放，但每句都要付出一次请求的基础延迟）
+
+两者使用相同数量的任务队列工作线程（JOB_WORKERS）。模拟服务的响应耗时 = 基础延迟 + 每字耗时，
+与真实 TTS 接口一样随文本变长而增加。
+
+用法: python scripts/bench_tts_throughput.py [--jobs 200] [--latency 0.05] [--per-char 0.001]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ["AUDIO_OUTPUT_DIR"] = tempfile.mkdtemp(prefix="bench-tts-")
+os.environ["JOB_QUEUE_BACKEND"] = "local"
+
+import requests  # noqa: E402
+
+from prompts.mood_prompts import MoodPrompts  # noqa: E402
+from services.job_queue import FINISHED_STATES, JobQueue  # noqa: E402
+from services.tts_cache import tts_cache  # noqa: E402
+from services.tts_service import tts_service  # noqa: E402
+
+REPLY = "施主今年流年运势平稳，{n}号贵人在东南方。事业上宜守不宜攻，切忌冒进。感情方面缘分将至，需主动把握。财运中等偏上，正财稳定，偏财少碰。"
+
+
+def start_mock_server(latency: float, per_char: float) -> ThreadingHTTPServer:
+    """启动模拟 TTS 服务：读取请求体后按文本长度延迟返回固定音频"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # 响应头与响应体分两次发送，长连接上需关闭 Nagle 算法，否则每个响应都会被延迟确认拖慢约 40ms
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+            text = body.split(">")[-4] if body.count(">") >= 4 else body
+            time.sleep(latency + per_char * len(text))
+            audio = b"ID3" + b"\0" * 4000
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.send_header("Content-Length", str(len(audio)))
+            self.end_headers()
+            self.wfile.write(audio)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def old_synthesize(job) -> None:
+    """旧实现的任务处理：每个任务新建事件循环，协程内阻塞请求整段文本"""
+
+    async def synthesize():
+        payload = job.payload
+        ssml = tts_service._build_ssml(payload["text"], MoodPrompts.get_voice_style(payload["mood"]))
+        response = requests.post(tts_service.endpoint, headers={"Content-Type": "application/ssml+xml"},
+                                 data=ssml.encode("utf-8"), timeout=30)
+        response.raise_for_status()
+        path = tts_service.get_audio_file_path(payload["uid"])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(response.content)
+
+    asyncio.run(synthesize())
+
+
+def run(jobs: JobQueue, kind: str, count: int, prefix: str) -> float:
+    """提交 count 个任务并等待全部结束，返回 jobs/sec"""
+    started = time.perf_counter()
+    submitted = [
+        jobs.submit(kind, {"text": REPLY.format(n=i), "uid": f"{prefix}-{i}", "mood": "default"}, max_retries=0)
+        for i in range(count)
+    ]
+    while any(job.status not in FINISHED_STATES for job in submitted):
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    failed = sum(job.status != "completed" for job in submitted)
+    if failed:
+        print(f"  {prefix}: {failed} 个任务失败")
+    return count / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=200, help="合成任务数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务每个请求的基础延迟(秒)")
+    parser.add_argument("--per-char", type=float, default=0.001, help="模拟服务每字增加的延迟(秒)")
+    args = parser.parse_args()
+
+    server = start_mock_server(args.latency, args.per_char)
+    tts_service.endpoint = f"http://127.0.0.1:{server.server_address[1]}/tts"
+    tts_service.api_key = tts_service.api_key or "bench"
+    tts_cache.enabled = False  # 每个任务都实际请求合成接口
+
+    before_queue = JobQueue()
+    before_queue.register("tts.old", old_synthesize)
+    after_queue = JobQueue()
+    after_queue.register("tts.synthesize", tts_service._handle_synthesis)
+
+    print(f"任务数 {args.jobs}, 工作线程 {after_queue.workers}, 引擎并发上限 {tts_service.engine.max_concurrency}")
+    before = run(before_queue, "tts.old", args.jobs, "before")
+    print(f"{'before':<12} {before:8.2f} jobs/sec")
+
+    sentence_limits = tts_service.sentence_max_chars, tts_service.sentence_min_chars
+    tts_service.sentence_max_chars = tts_service.sentence_min_chars = len(REPLY) * 2
+    after = run(after_queue, "tts.synthesize", args.jobs, "after-whole")
+    print(f"{'after-whole':<12} {after:8.2f} jobs/sec   ({after / before:.2f}x)")
+
+    tts_service.sentence_max_chars, tts_service.sentence_min_chars = sentence_limits
+    after = run(after_queue, "tts.synthesize", args.jobs, "after-split")
+    print(f"{'after-split':<12} {after:8.2f} jobs/sec   ({after / before:.2f}x)")
+
+    before_queue.shutdown()
+    after_queue.shutdown()
+    tts_service.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,13 @@ Mystical Oracle Server - 神秘预言师 Web 服务器
 """
 import sys
 import os
+import asyncio
+import json
+import re
 import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import List, Optional
 
 # 设置必要的环境变量
 os.environ.setdefault("USER_AGENT", "Mozilla/5.0 (Mystical Oracle/1.0)")
@@ -14,23 +19,61 @@ os.environ.setdefault("USER_AGENT", "Mozilla/5.0 (Mystical Oracle/1.0)")
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_ollama import OllamaEmbeddings
-from langchain_qdrant import Qdrant
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, File, UploadFile, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 
-from agent import Master
+from agent import master_pool
+from models.ingest import UrlIngestRequest
+from services.redis_client import aclose_redis
+from services.http_client import yuanfenju_client
+from services.knowledge_base import knowledge_base
+from services.ingestion import ingestion_service
+from services.job_queue import job_queue, QueueFullError
+from services.embedding_cache import embedding_cache
+from services.semantic_cache import kb_semantic_cache
+from services.tts_service import tts_service
+from services.tts_cache import tts_cache
+from services.audio_store import audio_store
+from services.result_cache import bazi_cache, dream_cache
 from config.settings import config
 from utils.helpers import validate_user_input, format_error_message
+from utils.metrics import metrics
 from config.logger import server_logger
 
+# 音频 ID 仅允许字母、数字、下划线与连字符，防止路径穿越
+AUDIO_ID_PATTERN = re.compile(r"^[\w-]{1,64}$")
+# 已合成音频的缓存策略，以及合成进行中时建议的重试间隔(秒)
+AUDIO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+AUDIO_RETRY_AFTER = 1
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时预热算命大师实例池、后台任务队列与音频清理，退出时关闭共享连接"""
+    try:
+        master_pool.warm_up()
+    except Exception as e:
+        server_logger.error(format_error_message(e, "预热算命大师实例池"))
+    job_queue.start()
+    audio_store.start()
+    yield
+    await asyncio.to_thread(job_queue.shutdown)
+    await yuanfenju_client.aclose()
+    yuanfenju_client.close()
+    await aclose_redis()
+    ingestion_service.shutdown()
+    tts_service.close()
+    audio_store.close()
+    knowledge_base.close()
+
+
 # 创建 FastAPI 应用
 app = FastAPI(
     title="Mystical Oracle API",
     description="神秘预言师 - 基于 LangChain 的智能算命师聊天机器人，支持语音合成",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
@@ -41,56 +84,129 @@ def get_root():
 
 
 @app.post("/chat")
-def chat(query: str, background_tasks: BackgroundTasks):
+async def chat(query: str, session_id: Optional[str] = None):
     """与算命师对话，支持语音合成"""
     try:
         # 验证输入
         if not validate_user_input(query):
             raise HTTPException(status_code=400, detail="输入内容无效")
         
-        # 创建算命师实例并处理对话
-        master = Master()
-        result = master.run(query)
+        # 从实例池借用算命师处理对话，会话按请求绑定
+        async with master_pool.aborrow() as master:
+            result = await master.arun(query, session_id=session_id)
+            mood = master.get_current_mood()
+            voice_style = master.get_voice_style()
         
         # 生成唯一 ID 用于音频文件
         unique_id = str(uuid.uuid4())
         
-        # 后台任务：语音合成
+        # 提交语音合成任务到后台任务队列（实例已归还，只使用借用期间取得的回复与情绪）
         if result.get("output"):
-            background_tasks.add_task(
-                master.synthesize_speech_background,
-                result["output"],
-                unique_id
-            )
+            if tts_service.is_available():
+                await tts_service.asubmit_synthesis(result["output"], unique_id, mood)
+            else:
+                server_logger.warning("TTS 服务不可用，跳过语音合成")
         
         return {
             "msg": result.get("output", "无法获取回复"),
             "id": unique_id,
-            "mood": master.get_current_mood(),
-            "voice_style": master.get_voice_style()
+            "mood": mood,
+            "voice_style": voice_style
         }
         
+    except HTTPException:
+        raise
+    except TimeoutError:
+        server_logger.warning("算命大师实例池繁忙，请求等待超时")
+        raise HTTPException(status_code=503, detail="服务繁忙，请稍后再试")
     except Exception as e:
         error_msg = format_error_message(e, "对话处理")
         server_logger.error(error_msg)
         raise HTTPException(status_code=500, detail="服务暂时不可用，请稍后再试")
 
 
+def _sse_frame(event: str, data: dict) -> str:
+    """格式化一帧 Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _synthesize_after_stream(state: dict) -> None:
+    """流式回复结束后提交语音合成任务"""
+    if state.get("output") and tts_service.is_available():
+        tts_service.submit_synthesis(state["output"], state["id"], state.get("mood", "default"))
+
+
+@app.post("/chat/stream")
+async def chat_stream(query: str, session_id: Optional[str] = None):
+    """与算命师对话（SSE 流式返回），结束帧中携带音频 ID 与情绪"""
+    if not validate_user_input(query):
+        raise HTTPException(status_code=400, detail="输入内容无效")
+    
+    state = {"id": str(uuid.uuid4())}
+    
+    async def event_stream():
+        try:
+            async with master_pool.aborrow() as master:
+                async for frame in master.astream(query, session_id=session_id):
+                    if frame["type"] == "done":
+                        state.update(output=frame["output"], mood=frame["mood"])
+                        frame = {**frame, "id": state["id"]}
+                    yield _sse_frame(frame["type"], frame)
+        except TimeoutError:
+            server_logger.warning("算命大师实例池繁忙，请求等待超时")
+            yield _sse_frame("error", {"type": "error", "content": "服务繁忙，请稍后再试"})
+        except Exception as e:
+            server_logger.error(format_error_message(e, "流式对话处理"))
+            yield _sse_frame("error", {"type": "error", "content": "服务暂时不可用，请稍后再试"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(_synthesize_after_stream, state)
+    )
+
+
 @app.get("/audio/{audio_id}")
-def get_audio(audio_id: str):
-    """获取生成的音频文件"""
-    try:
-        audio_path = Path(f"{audio_id}.mp3")
+async def get_audio(audio_id: str, request: Request):
+    """
+    获取生成的音频文件：支持 Range 请求（拖动播放），带强 ETag 与长期缓存头；
+    合成尚在进行中时返回 202，客户端可按 Retry-After 重试或改用流式接口
+    """
+    if not AUDIO_ID_PATTERN.match(audio_id):
+        raise HTTPException(status_code=400, detail="无效的音频 ID")
 
-        if not audio_path.exists():
+    try:
+        etag = tts_service.get_audio_etag(audio_id)
+        if etag is None:
+            if await tts_service.ais_synthesis_pending(audio_id):
+                return JSONResponse(
+                    status_code=202,
+                    content={"status": "pending", "audio_id": audio_id, "stream_url": f"/audio/{audio_id}/stream"},
+                    headers={"Retry-After": str(AUDIO_RETRY_AFTER)}
+                )
             raise HTTPException(status_code=404, detail="音频文件不存在")
-        
+
+        audio_path = tts_service.get_audio_file_path(audio_id)
+        audio_store.touch(audio_path)
+
+        # 同一音频 ID 的内容合成后不再变化，可长期缓存
+        headers = {"ETag": f'"{etag}"', "Cache-Control": AUDIO_CACHE_CONTROL}
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag_matches(if_none_match, etag):
+            metrics.increment("audio.not_modified")
+            return Response(status_code=304, headers=headers)
+
         return FileResponse(
             path=audio_path,
             media_type="audio/mpeg",
-            filename=f"{audio_id}.mp3"
+            filename=f"{audio_id}.mp3",
+            content_disposition_type="inline",
+            headers=headers
         )
-        
+
+    except HTTPException:
+        raise
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="音频文件不存在")
     except Exception as e:
@@ -99,55 +215,115 @@ def get_audio(audio_id: str):
         raise HTTPException(status_code=500, detail="获取音频文件失败")
 
 
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 是否命中当前 ETag（支持 * 与多个取值）"""
+    candidates = [item.strip() for item in if_none_match.split(",") if item.strip()]
+    return "*" in candidates or any(item.removeprefix("W/") == f'"{etag}"' for item in candidates)
+
+
+@app.get("/audio/{audio_id}/stream")
+async def stream_audio(audio_id: str):
+    """边合成边获取音频：合成进行中时随音频增长持续推送（分块传输），首句合成后即可开始播放"""
+    if not AUDIO_ID_PATTERN.match(audio_id):
+        raise HTTPException(status_code=400, detail="无效的音频 ID")
+
+    audio_ready = (tts_service.get_audio_file_path(audio_id).exists()
+                   or tts_service.get_partial_file_path(audio_id).exists())
+    if not audio_ready and not await tts_service.ais_synthesis_pending(audio_id):
+        raise HTTPException(status_code=404, detail="音频文件不存在")
+
+    return StreamingResponse(
+        tts_service.stream_audio(audio_id),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/add_urls")
-def add_urls(URL: str):
-    """添加网页内容到知识库"""
+def add_urls(URL: Optional[str] = None, request: Optional[UrlIngestRequest] = None):
+    """添加网页内容到知识库：支持单个 URL 参数或批量 urls 请求体，后台任务执行并返回任务 ID"""
+    urls = list(request.urls) if request else []
+    if URL:
+        urls.insert(0, URL)
+
+    # 验证 URL
+    if not urls or not all(url.startswith(('http://', 'https://')) for url in urls):
+        raise HTTPException(status_code=400, detail="无效的 URL")
+
     try:
-        # 验证 URL
-        if not URL or not URL.startswith(('http://', 'https://')):
-            raise HTTPException(status_code=400, detail="无效的 URL")
-        
-        # 加载网页内容
-        loader = WebBaseLoader(URL)
-        docs = loader.load()
-        
-        # 分割文档
-        documents = RecursiveCharacterTextSplitter(
-            chunk_size=800, 
-            chunk_overlap=50
-        ).split_documents(docs)
-        
-        # 获取配置
-        qdrant_config = config.get_qdrant_config()
-        embedding_config = config.get_embedding_config()
-        
-        # 创建向量数据库
-        qdrant = Qdrant.from_documents(
-            documents,
-            OllamaEmbeddings(**embedding_config),
-            path=qdrant_config["path"],
-            collection_name=qdrant_config["collection_name"],
-        )
-        
-        server_logger.info(f'成功添加 URL: {URL} 到向量数据库')
-        return {"response": "网页内容添加成功！"}
-        
+        job = ingestion_service.submit_urls(urls)
+        server_logger.info(f'已提交网页入库任务: {job.id}, 共 {len(urls)} 个 URL')
+        return {"response": "网页内容已开始入库", "job_id": job.id, "job": job.to_dict()}
+
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="任务队列已满，请稍后再试")
     except Exception as e:
-        error_msg = format_error_message(e, f"添加 URL: {URL}")
+        error_msg = format_error_message(e, f"添加 URL: {urls[:3]}")
         server_logger.error(error_msg)
         raise HTTPException(status_code=500, detail="添加网页内容失败，请稍后再试")
 
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询后台任务状态与进度"""
+    job = await job_queue.aget(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.to_dict()
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """取消后台任务：排队中的任务立即取消，执行中的任务在下一个检查点结束"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.to_dict()
+
+
 @app.post("/add_pdfs")
-def add_pdfs():
-    """添加 PDF 文档（待实现）"""
-    return {"response": "PDF 添加功能开发中..."}
+async def add_pdfs(files: List[UploadFile] = File(...)):
+    """添加 PDF 文档到知识库：上传内容分块落盘，后台逐页解析入库并返回任务 ID"""
+    return await _submit_uploads("pdfs", files, ".pdf")
+
+
+@app.post("/add_texts")
+async def add_texts(files: List[UploadFile] = File(...)):
+    """添加文本文件到知识库：上传内容分块落盘，后台分段解析入库并返回任务 ID"""
+    return await _submit_uploads("texts", files, ".txt")
+
+
+async def _submit_uploads(kind: str, files: List[UploadFile], suffix: str):
+    """暂存上传文件并提交入库任务"""
+    if not files:
+        raise HTTPException(status_code=400, detail="未上传文件")
+
+    spooled = []
+    try:
+        for upload in files:
+            path = await ingestion_service.spool_upload(upload, suffix)
+            spooled.append((upload.filename or os.path.basename(path), path))
+        job = ingestion_service.submit_files(kind, spooled)
+        server_logger.info(f'已提交文件入库任务: {job.id} ({kind}), 共 {len(spooled)} 个文件')
+        return {"response": "文件已开始入库", "job_id": job.id, "job": job.to_dict()}
+
+    except QueueFullError:
+        _remove_files(spooled)
+        raise HTTPException(status_code=503, detail="任务队列已满，请稍后再试")
+    except Exception as e:
+        _remove_files(spooled)
+        error_msg = format_error_message(e, f"添加文件: {kind}")
+        server_logger.error(error_msg)
+        raise HTTPException(status_code=500, detail="添加文件失败，请稍后再试")
+    finally:
+        for upload in files:
+            await upload.close()
 
 
-@app.post("/add_texts")  
-def add_texts():
-    """添加文本内容（待实现）"""
-    return {"response": "文本添加功能开发中..."}
+def _remove_files(files: List[tuple]) -> None:
+    """删除未能提交任务的暂存文件"""
+    for _, path in files:
+        Path(path).unlink(missing_ok=True)
 
 
 @app.get("/health")
@@ -170,17 +346,39 @@ def health_check():
                 "tts": tts_available,
                 "knowledge_base": True,
                 "websocket": True
-            }
+            },
+            "agent_pool": master_pool.get_stats()
         }
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}
 
 
+@app.get("/metrics")
+def get_metrics():
+    """运行指标"""
+    return {
+        "agent_pool": master_pool.get_stats(),
+        "emotion_mode": config.get_emotion_mode(),
+        "result_cache": {
+            "bazi": bazi_cache.get_stats(),
+            "jiemeng": dream_cache.get_stats()
+        },
+        "job_queue": job_queue.get_stats(),
+        "tts_engine": tts_service.engine.get_stats(),
+        "tts_cache": tts_cache.get_stats(),
+        "audio_store": audio_store.get_stats(),
+        "embedding_cache": embedding_cache.get_stats(),
+        "semantic_cache": kb_semantic_cache.get_stats(),
+        **metrics.snapshot()
+    }
+
+
 @app.websocket('/ws')
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket 端点 - 实时对话"""
+    """WebSocket 端点 - 实时对话，连接参数 stream=true 时以 JSON 帧逐段推送回复"""
     await websocket.accept()
-    master = Master()
+    session_id = websocket.query_params.get("session_id")
+    streaming = websocket.query_params.get("stream", "").lower() in ("1", "true")
     
     try:
         while True:
@@ -193,8 +391,16 @@ async def websocket_endpoint(websocket: WebSocket):
                 continue
             
             try:
-                # 处理对话
-                result = master.run(data)
+                # 流式模式：逐段推送 token 帧，最后推送 done 帧
+                if streaming:
+                    async with master_pool.aborrow() as master:
+                        async for frame in master.astream(data, session_id=session_id):
+                            await websocket.send_json(frame)
+                    continue
+                
+                # 处理对话，每条消息借用一次实例，避免长连接占满实例池
+                async with master_pool.aborrow() as master:
+                    result = await master.arun(data, session_id=session_id)
                 response = result.get("output", "无法获取回复")
                 
                 # 发送回复
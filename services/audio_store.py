@@ -0,0 +1,193 @@
+"""
+Mystical Oracle Audio Store - 音频文件仓库
+统一管理音频目录：按哈希分片存放音频，后台按总容量与过期时间清理最久未访问的文件
+"""
+import hashlib
+import os
+import stat
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import config
+from config.logger import tts_logger
+from utils.metrics import metrics
+
+# 内容寻址缓存音频所在的子目录
+BLOB_DIR = "blobs"
+# 写入中的临时文件后缀，不计入容量
+TEMP_SUFFIXES = (".part", ".link")
+
+
+class AudioStore:
+    """
+    音频仓库：
+    - 每条回复的音频按音频 ID 的哈希分片存放，避免单个目录文件过多
+    - 缓存音频按内容哈希分片存放在 blobs 子目录，回复音频以符号链接指向它们
+    - 最近访问时间记录在文件 atime 上（显式设置，不受挂载选项影响，也不改变 mtime 与 ETag）
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None, sweep_interval: Optional[float] = None):
+        store_config = config.get_audio_store_config()
+        self.root = Path(root or store_config["root"])
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max(1, max_bytes or store_config["max_bytes"])
+        self.ttl = store_config["ttl"] if ttl is None else ttl  # 0 表示不过期
+        self.sweep_interval = max(1.0, sweep_interval or store_config["sweep_interval"])
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._files = 0
+        self._last_sweep = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def audio_path(self, uid: str) -> Path:
+        """回复音频路径"""
+        return self.root / self._shard(uid) / f"{uid}.mp3"
+
+    def partial_path(self, uid: str) -> Path:
+        """合成中的回复音频路径"""
+        return self.root / self._shard(uid) / f"{uid}.mp3.part"
+
+    def blob_path(self, key: str) -> Path:
+        """缓存音频路径（key 为内容哈希）"""
+        return self.root / BLOB_DIR / key[:2] / f"{key}.mp3"
+
+    def touch(self, path: Path) -> None:
+        """记录一次访问：只更新 atime（mtime 按纳秒原样写回，保证 ETag 不变），符号链接本身与其指向的文件都会刷新"""
+        now_ns = time.time_ns()
+        for follow in (False, True):
+            try:
+                st = os.stat(path, follow_symlinks=follow)
+                os.utime(path, ns=(now_ns, st.st_mtime_ns), follow_symlinks=follow)
+            except (OSError, NotImplementedError):
+                pass
+
+    def record_write(self, size: int) -> None:
+        """记录新写入的音频，超出容量时提前唤醒清理"""
+        with self._lock:
+            self._bytes += size
+            self._files += 1
+            over_budget = self._bytes > self.max_bytes
+        metrics.increment("audio_store.writes")
+        if over_budget:
+            self._wake.set()
+
+    def start(self) -> None:
+        """启动后台清理线程"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audio-store-sweeper", daemon=True)
+        self._thread.start()
+        tts_logger.info(f"音频仓库已启动: {self.root}, 容量上限 {self.max_bytes} 字节, 过期时间 {self.ttl} 秒")
+
+    def close(self, timeout: float = 5.0) -> None:
+        """停止后台清理线程"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def sweep(self) -> Dict[str, int]:
+        """
+        执行一次清理：删除过期文件与失效的符号链接，总大小超出容量时按最近访问时间从旧到新删除
+
+        Returns:
+            本次删除的文件数
+        """
+        now = time.time()
+        expired = dangling = budget = 0
+        files: List[Tuple[float, int, str]] = []  # (最近访问时间, 大小, 路径)
+        with metrics.latency("audio_store.sweep").time():
+            for dirpath, _, names in os.walk(self.root):
+                for name in names:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.lstat(path)
+                    except FileNotFoundError:
+                        continue
+                    last_access = max(st.st_atime, st.st_mtime)
+                    is_expired = bool(self.ttl) and now - last_access > self.ttl
+                    if stat.S_ISLNK(st.st_mode):
+                        if is_expired or not os.path.exists(path):
+                            dangling += self._remove(path)
+                        continue
+                    if is_expired:
+                        expired += self._remove(path)
+                    elif not name.endswith(TEMP_SUFFIXES):
+                        files.append((last_access, st.st_size, path))
+
+            total = sum(size for _, size, _ in files)
+            if total > self.max_bytes:
+                files.sort()
+                for _, size, path in files:
+                    if total <= self.max_bytes:
+                        break
+                    if self._remove(path):
+                        budget += 1
+                        total -= size
+
+        with self._lock:
+            self._bytes = total
+            self._files = len(files) - budget
+            self._last_sweep = now
+        metrics.increment("audio_store.evictions.expired", expired)
+        metrics.increment("audio_store.evictions.budget", budget)
+        metrics.increment("audio_store.evictions.dangling", dangling)
+        if expired or budget or dangling:
+            tts_logger.info(f"音频仓库清理: 过期 {expired}, 超出容量 {budget}, 失效链接 {dangling}, 当前 {total} 字节")
+        return {"expired": expired, "budget": budget, "dangling": dangling}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取仓库统计"""
+        with self._lock:
+            total_bytes, files, last_sweep = self._bytes, self._files, self._last_sweep
+        return {
+            "bytes": total_bytes,
+            "files": files,
+            "max_bytes": self.max_bytes,
+            "usage": round(total_bytes / self.max_bytes, 3),
+            "ttl_s": self.ttl,
+            "evictions": {
+                reason: metrics.get_counter(f"audio_store.evictions.{reason}")
+                for reason in ("expired", "budget", "dangling")
+            },
+            "last_sweep_ago_s": round(time.time() - last_sweep, 1) if last_sweep else None
+        }
+
+    def _run(self) -> None:
+        """后台清理循环：定期清理，写入超出容量时立即清理"""
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                tts_logger.error(f"音频仓库清理失败: {e}")
+            self._wake.wait(self.sweep_interval)
+            self._wake.clear()
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        """删除文件，成功返回 1"""
+        try:
+            os.unlink(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            tts_logger.warning(f"删除音频文件失败 {path}: {e}")
+            return 0
+
+    @staticmethod
+    def _shard(uid: str) -> str:
+        """音频 ID 所在的分片目录"""
+        return hashlib.md5(uid.encode("utf-8")).hexdigest()[:2]
+
+
+# 全局音频仓库
+audio_store = AudioStore()
@@ -0,0 +1,224 @@
+"""
+Mystical Oracle Bazi Parser - 八字参数规则解析器
+从用户输入中直接解析姓名、性别、历法与出生日期时间，无法完整解析时由调用方回退到大模型
+"""
+import re
+from datetime import datetime
+from typing import Optional, Tuple
+
+from config.settings import config
+from models.user import User
+
+# 中文数字
+CN_DIGITS = {"零": 0, "〇": 0, "○": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+             "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+CN_NUMBER_PATTERN = re.compile(r"[零〇○一二两三四五六七八九十廿卅]+")
+# 中文数字只有紧邻日期、时间单位时才转换，避免"一时""一点儿"等词被当成数字
+DATE_UNIT_PATTERN = re.compile(r"\s*[年月日号]")
+CLOCK_UNIT_PATTERN = re.compile(r"\s*[点时]")
+# "一点""一时"多为虚词，只有后接钟/半/几分时才视为时间
+CLOCK_DETAIL_PATTERN = re.compile(r"\s*[点时]\s*(?:钟|半|[零〇○一二两三四五六七八九十\d]+\s*分)")
+
+# 农历月份别称
+LUNAR_MONTH_ALIASES = {"正月": "1月", "冬月": "11月", "腊月": "12月"}
+
+# 十二时辰对应的小时（取时辰中点，子时取 0 点）
+SHICHEN_HOURS = {"子": 0, "丑": 2, "寅": 4, "卯": 6, "辰": 8, "巳": 10,
+                 "午": 12, "未": 14, "申": 16, "酉": 18, "戌": 20, "亥": 22}
+
+# 日期格式
+DATE_PATTERNS = [
+    re.compile(r"(?<!\d)(\d{4}|\d{2})\s*年\s*(\d{1,2})\s*月\s*(?:初)?(\d{1,2})\s*[日号]?"),
+    re.compile(r"(?<!\d)(\d{4})\s*[-/.]\s*(\d{1,2})\s*[-/.]\s*(\d{1,2})(?!\d)"),
+    re.compile(r"(?<!\d)(\d{4})(\d{2})(\d{2})(?!\d)"),
+]
+
+# 时间格式
+CLOCK_PATTERN = re.compile(r"(?<!\d)(\d{1,2})\s*[:：]\s*(\d{2})(?!\d)")
+HOUR_PATTERN = re.compile(
+    r"(凌晨|早上|早晨|上午|中午|下午|傍晚|晚上|夜里|半夜)?\s*(\d{1,2})\s*[点时](?:\s*(半)|\s*(\d{1,2})\s*分)?"
+)
+SHICHEN_PATTERN = re.compile(r"([子丑寅卯辰巳午未申酉戌亥])时")
+AFTERNOON_PERIODS = {"下午", "傍晚", "晚上", "夜里"}
+# 这些时段的"12点"指午夜 0 点
+MIDNIGHT_PERIODS = {"凌晨", "晚上", "夜里", "半夜"}
+
+# 姓名与性别
+NAME_PATTERN = re.compile(
+    r"(?:我叫|我是|名叫|叫做|名字[是叫为]?|姓名[是为]?)\s*[:：]?\s*"
+    r"([\u4e00-\u9fa5·]{2,5}?)(?=[，,。.！!\s；;、]|男|女|生于|出生|性别|农历|阴历|公历|阳历|\d|$)"
+)
+# 出现这些字的多半不是姓名（如"我是想算八字"）
+NAME_STOP_CHARS = set("想要问算帮请来的了吗呢个在")
+# 性别只认自我描述（"我是男生""性别：女""张三，男，…"），不匹配"男朋友""女方"等词中的字
+SEX_EXCLUDED_SUFFIX = r"(?![朋友方孩儿神星装])"
+SEX_PATTERNS = [
+    (re.compile(r"性别\s*[:：是为]?\s*男"), 0),
+    (re.compile(r"性别\s*[:：是为]?\s*女"), 1),
+    (re.compile(r"(?:我|本人)\s*(?:是|为)?\s*(?:一[个名位])?\s*(?:女士|女性|女生|女孩|女的|女)" + SEX_EXCLUDED_SUFFIX), 1),
+    (re.compile(r"(?:我|本人)\s*(?:是|为)?\s*(?:一[个名位])?\s*(?:男士|男性|男生|男孩|男的|男)" + SEX_EXCLUDED_SUFFIX), 0),
+    (re.compile(r"(?:^|[，,。\s；;、(（])女(?=[，,。\s；;、)）]|$|\d|生于|出生|农历|阴历|公历|阳历)"), 1),
+    (re.compile(r"(?:^|[，,。\s；;、(（])男(?=[，,。\s；;、)）]|$|\d|生于|出生|农历|阴历|公历|阳历)"), 0),
+]
+# 时段词，紧跟其后的"一点""一时"视为时间
+CLOCK_PERIODS = ("凌晨", "早上", "早晨", "上午", "中午", "下午", "傍晚", "晚上", "夜里", "半夜")
+
+
+def _convert_cn_number(match: "re.Match[str]") -> str:
+    """
+    按上下文转换一段中文数字：紧邻年/月/日/号、月后或初后的日期、钟点或点后分钟时转为阿拉伯数字，否则原样保留
+    转换结果后补一个空格，避免与紧随其后的数字连在一起（如"初三8点"）
+    """
+    number, text = match.group(0), match.string
+    start, end = match.span()
+    before = text[:start].rstrip()
+    if before.endswith(("初", "月")) or DATE_UNIT_PATTERN.match(text, end):
+        return f"{_cn_to_int(number)} "
+    if CLOCK_UNIT_PATTERN.match(text, end):
+        if number != "一" or CLOCK_DETAIL_PATTERN.match(text, end) or before.endswith(CLOCK_PERIODS):
+            return f"{_cn_to_int(number)} "
+    elif text[end:].lstrip().startswith("分") and before.endswith(("点", "时")):
+        return f"{_cn_to_int(number)} "
+    return number
+
+
+def _cn_to_int(text: str) -> int:
+    """中文数字转整数：含十/廿/卅时按位值计算，否则逐位拼接（如 一九九零）"""
+    if not any(char in text for char in "十廿卅"):
+        return int("".join(str(CN_DIGITS[char]) for char in text))
+
+    tens_map = {"十": 1, "廿": 2, "卅": 3}
+    for marker, tens in tens_map.items():
+        if marker in text:
+            head, _, tail = text.partition(marker)
+            tens = CN_DIGITS.get(head, tens) if head else tens
+            ones = CN_DIGITS.get(tail, 0) if tail else 0
+            return tens * 10 + ones
+    return 0
+
+
+class BaziParser:
+    """八字参数规则解析器"""
+
+    def parse(self, text: str) -> Optional[User]:
+        """
+        解析用户输入
+
+        Args:
+            text: 用户输入
+
+        Returns:
+            解析成功返回 User，缺少任一必要参数或校验失败返回 None
+        """
+        if not text:
+            return None
+
+        # 姓名与性别在原文上识别，避免数字归一化破坏姓名（如"张三"）
+        name, name_span = self._parse_name(text)
+        if not name:
+            return None
+        remainder = text[:name_span[0]] + " " + text[name_span[1]:]
+
+        sex = self._parse_sex(remainder)
+        if sex is None:
+            return None
+
+        normalized = self._normalize(remainder)
+        date, date_span = self._parse_date(normalized)
+        if not date:
+            return None
+
+        time_part = self._parse_time(normalized[:date_span[0]] + " " + normalized[date_span[1]:])
+        if not time_part:
+            return None
+
+        year, month, day = date
+        hours, minute = time_part
+        try:
+            return User(
+                api_key=config.YUANFENJU_API_KEY or "",
+                name=name,
+                sex=sex,
+                type=self._parse_calendar(text),
+                year=year,
+                month=month,
+                day=day,
+                hours=hours,
+                minute=minute
+            )
+        except Exception:
+            return None
+
+    @staticmethod
+    def _parse_name(text: str) -> Tuple[Optional[str], Tuple[int, int]]:
+        """识别姓名及其在原文中的位置"""
+        match = NAME_PATTERN.search(text)
+        if not match or NAME_STOP_CHARS & set(match.group(1)):
+            return None, (0, 0)
+        return match.group(1), match.span(1)
+
+    @staticmethod
+    def _parse_sex(text: str) -> Optional[int]:
+        """识别性别，0 表示男，1 表示女"""
+        for pattern, sex in SEX_PATTERNS:
+            if pattern.search(text):
+                return sex
+        return None
+
+    @staticmethod
+    def _parse_calendar(text: str) -> int:
+        """识别历法，0 农历，1 公历（默认）"""
+        if re.search(r"农历|阴历|旧历", text):
+            return 0
+        return 1
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        """统一全角数字、农历月份别称与中文数字"""
+        text = text.translate(str.maketrans("０１２３４５６７８９", "0123456789"))
+        for alias, month in LUNAR_MONTH_ALIASES.items():
+            text = text.replace(alias, month)
+        return CN_NUMBER_PATTERN.sub(_convert_cn_number, text)
+
+    @staticmethod
+    def _parse_date(text: str) -> Tuple[Optional[Tuple[int, int, int]], Tuple[int, int]]:
+        """识别出生日期及其位置"""
+        for pattern in DATE_PATTERNS:
+            match = pattern.search(text)
+            if not match:
+                continue
+            year, month, day = (int(group) for group in match.groups())
+            if year < 100:
+                # 两位年份：不超过当前年份后两位视为 20xx，否则视为 19xx
+                year += 2000 if year <= datetime.now().year % 100 else 1900
+            return (year, month, day), match.span()
+        return None, (0, 0)
+
+    @staticmethod
+    def _parse_time(text: str) -> Optional[Tuple[int, int]]:
+        """识别出生时间（小时、分钟）"""
+        match = CLOCK_PATTERN.search(text)
+        if match:
+            return int(match.group(1)), int(match.group(2))
+
+        match = HOUR_PATTERN.search(text)
+        if match:
+            period, hour, half, minute = match.groups()
+            hour = int(hour)
+            if period in MIDNIGHT_PERIODS and hour == 12:
+                hour = 0
+            elif period in AFTERNOON_PERIODS and hour < 12:
+                hour += 12
+            elif period == "中午" and hour < 6:
+                hour += 12
+            return hour, 30 if half else int(minute or 0)
+
+        match = SHICHEN_PATTERN.search(text)
+        if match:
+            return SHICHEN_HOURS[match.group(1)], 0
+
+        return None
+
+
+# 全局八字参数解析器实例
+bazi_parser = BaziParser()
@@ -0,0 +1,204 @@
+"""
+Mystical Oracle Chat History - 会话记录存储
+基于 Redis 的聊天记录，同时提供同步与异步访问接口，共享进程内连接池
+只读取最近的有界窗口，更早的消息由后台任务折叠进滚动摘要；读写各一次往返
+"""
+import asyncio
+import json
+import uuid
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+import redis
+import redis.asyncio as aioredis
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, SystemMessage, message_to_dict, messages_from_dict
+
+from services.redis_client import get_async_redis, get_redis
+from utils.metrics import metrics
+
+# 仅当锁仍由自己持有（令牌一致）时才删除，避免锁过期后误删其他任务重新获得的锁
+RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisChatHistory(BaseChatMessageHistory):
+    """
+    Redis 聊天记录，存储格式与 RedisChatMessageHistory 保持一致（LPUSH，最新消息在表头）
+
+    - 读取时只 LRANGE 最近 window + overflow 条消息，并在最前面附上滚动摘要
+    - 写入后消息数超过 window + overflow 时调用 on_overflow（异步写入时优先调用 aon_overflow），由后台将最早的消息折叠进摘要
+    - 指定 assemble 时，读取结果经其处理（如按 token 预算裁剪）后再注入提示词
+    - 指定 ttl 时，每次写入刷新聊天记录与摘要的过期时间，长期不活跃的会话自动过期
+    """
+
+    def __init__(self, session_id: str, url: str, key_prefix: str = "message_store:",
+                 ttl: Optional[int] = None, window: Optional[int] = None, overflow: int = 0,
+                 on_overflow: Optional[Callable[[str], None]] = None,
+                 aon_overflow: Optional[Callable[[str], Awaitable[None]]] = None,
+                 assemble: Optional[Callable[[List[BaseMessage]], List[BaseMessage]]] = None):
+        self.session_id = session_id
+        self.url = url
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        self.window = window  # 保留原文的最近消息数，None 表示不限
+        self.overflow = max(0, overflow)  # 超出窗口多少条后才触发折叠
+        self.on_overflow = on_overflow
+        self.aon_overflow = aon_overflow
+        self.assemble = assemble
+        self._lock_token: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        """Redis 键名"""
+        return self.key_prefix + self.session_id
+
+    @property
+    def summary_key(self) -> str:
+        """滚动摘要的 Redis 键名"""
+        return f"{self.key_prefix}summary:{self.session_id}"
+
+    @property
+    def lock_key(self) -> str:
+        """折叠摘要的互斥锁键名"""
+        return f"{self.key_prefix}summary_lock:{self.session_id}"
+
+    @property
+    def redis_client(self) -> redis.Redis:
+        """同步 Redis 客户端（共享连接池）"""
+        return get_redis(self.url)
+
+    @property
+    def async_redis_client(self) -> aioredis.Redis:
+        """异步 Redis 客户端（共享连接池）"""
+        return get_async_redis(self.url)
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """读取滚动摘要与最近的聊天记录（按时间顺序）"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.get(self.summary_key)
+        pipe.lrange(self.key, 0, self._read_end)
+        with metrics.latency("redis.history.read").time():
+            summary, items = pipe.execute()
+        return self._with_summary(summary, self._decode(items))
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        """异步读取滚动摘要与最近的聊天记录（按时间顺序）"""
+        pipe = self.async_redis_client.pipeline(transaction=False)
+        pipe.get(self.summary_key)
+        pipe.lrange(self.key, 0, self._read_end)
+        with metrics.latency("redis.history.read").time():
+            summary, items = await pipe.execute()
+        return self._with_summary(summary, self._decode(items))
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """追加聊天记录（一轮对话的用户与 AI 消息、TTL 刷新在一次往返内完成）"""
+        if not messages:
+            return
+        pipe = self._write_pipeline(self.redis_client.pipeline(transaction=True), messages)
+        with metrics.latency("redis.history.write").time():
+            length = pipe.execute()[0]
+        self._check_overflow(length)
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """异步追加聊天记录（一次往返）"""
+        if not messages:
+            return
+        pipe = self._write_pipeline(self.async_redis_client.pipeline(transaction=True), messages)
+        with metrics.latency("redis.history.write").time():
+            length = (await pipe.execute())[0]
+        if self._overflowed(length):
+            if self.aon_overflow:
+                await self.aon_overflow(self.session_id)
+            elif self.on_overflow:
+                await asyncio.to_thread(self.on_overflow, self.session_id)
+
+    def clear(self) -> None:
+        """清空聊天记录与摘要"""
+        self.redis_client.delete(self.key, self.summary_key)
+
+    async def aclear(self) -> None:
+        """异步清空聊天记录与摘要"""
+        await self.async_redis_client.delete(self.key, self.summary_key)
+
+    def get_summary(self) -> str:
+        """读取滚动摘要"""
+        summary = self.redis_client.get(self.summary_key)
+        return summary.decode("utf-8") if summary else ""
+
+    def get_stale_messages(self) -> List[BaseMessage]:
+        """读取窗口之外、尚未折叠进摘要的最早消息（按时间顺序）"""
+        if not self.window:
+            return []
+        count = self.redis_client.llen(self.key) - self.window
+        if count <= 0:
+            return []
+        return self._decode(self.redis_client.lrange(self.key, -count, -1))
+
+    def fold(self, summary: str, count: int) -> None:
+        """
+        写入新摘要并删除已折叠的 count 条最早消息
+        新消息只从表头写入，按表尾计数删除不会误删折叠期间新增的消息
+        """
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.set(self.summary_key, summary)
+        pipe.ltrim(self.key, 0, -(count + 1))
+        if self.ttl:
+            pipe.expire(self.summary_key, self.ttl)
+        pipe.execute()
+
+    def acquire_fold_lock(self, timeout: int) -> bool:
+        """获取折叠互斥锁（值为随机令牌），同一会话同时只有一个折叠任务"""
+        token = uuid.uuid4().hex
+        if not self.redis_client.set(self.lock_key, token, nx=True, ex=timeout):
+            return False
+        self._lock_token = token
+        return True
+
+    def release_fold_lock(self) -> None:
+        """释放折叠互斥锁：锁已过期并被其他任务获得时不删除"""
+        token, self._lock_token = self._lock_token, None
+        if token:
+            self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, self.lock_key, token)
+
+    def _write_pipeline(self, pipe, messages: Sequence[BaseMessage]):
+        """构建写入管道：LPUSH 一次写入全部消息（返回列表长度），再刷新过期时间"""
+        pipe.lpush(self.key, *[self._encode(message) for message in messages])
+        if self.ttl:
+            pipe.expire(self.key, self.ttl)
+            pipe.expire(self.summary_key, self.ttl)
+        return pipe
+
+    @property
+    def _read_end(self) -> int:
+        """LRANGE 读取的结束下标"""
+        return self.window + self.overflow - 1 if self.window else -1
+
+    def _check_overflow(self, length: int) -> None:
+        """消息数超过窗口与缓冲之和时通知折叠"""
+        if self.on_overflow and self._overflowed(length):
+            self.on_overflow(self.session_id)
+
+    def _overflowed(self, length: int) -> bool:
+        """消息数是否超过窗口与缓冲之和"""
+        return bool(self.window) and length > self.window + self.overflow
+
+    def _with_summary(self, summary: Optional[bytes], messages: List[BaseMessage]) -> List[BaseMessage]:
+        """在聊天记录前附上滚动摘要，并按需组装"""
+        if summary:
+            messages = [SystemMessage(content=f"此前对话摘要：{summary.decode('utf-8')}")] + messages
+        return self.assemble(messages) if self.assemble else messages
+
+    @staticmethod
+    def _encode(message: BaseMessage) -> str:
+        """序列化单条消息"""
+        return json.dumps(message_to_dict(message))
+
+    @staticmethod
+    def _decode(items: list) -> List[BaseMessage]:
+        """反序列化消息列表，Redis 中最新消息在表头，需倒序还原时间顺序"""
+        return messages_from_dict([json.loads(item) for item in items[::-1]])
@@ -0,0 +1,148 @@
+"""
+Mystical Oracle Embedding Cache - 查询向量缓存
+归一化查询文本 → 向量的 LRU 缓存，向量存放在预分配的 float32 矩阵中，可选落盘跨重启复用
+"""
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config.settings import config
+from config.logger import tools_logger
+from utils.metrics import metrics
+
+
+def normalize_query(text: str) -> str:
+    """归一化查询文本：全角转半角、小写、合并空白"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """查询向量 LRU 缓存"""
+
+    def __init__(self, max_size: Optional[int] = None, path: Optional[str] = None,
+                 model: Optional[str] = None):
+        cache_config = config.get_embedding_cache_config()
+        self.max_size = max(1, max_size or cache_config["max_size"])
+        self.path = cache_config["path"] if path is None else path
+        self.model = model or config.EMBEDDING_MODEL_NAME or ""
+        self._slots: "OrderedDict[str, int]" = OrderedDict()  # 查询 → 矩阵行号，按最近使用排序
+        self._free: List[int] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """读取缓存向量，未命中返回 None"""
+        key = normalize_query(text)
+        with self._lock:
+            self._load()
+            slot = self._slots.get(key)
+            if slot is None:
+                vector = None
+            else:
+                self._slots.move_to_end(key)
+                vector = self._vectors[slot].tolist()
+        metrics.increment("embedding_cache.hits" if vector is not None else "embedding_cache.misses")
+        return vector
+
+    def set(self, text: str, vector: List[float]) -> None:
+        """写入缓存向量"""
+        key = normalize_query(text)
+        with self._lock:
+            self._load()
+            if self._vectors is None:
+                self._allocate(len(vector))
+            elif len(vector) != self._vectors.shape[1]:
+                # 嵌入模型维度变化，旧缓存全部作废
+                tools_logger.warning("查询向量维度变化，清空向量缓存")
+                self._slots.clear()
+                self._allocate(len(vector))
+
+            slot = self._slots.get(key)
+            if slot is None:
+                if self._free:
+                    slot = self._free.pop()
+                else:
+                    _, slot = self._slots.popitem(last=False)
+                    metrics.increment("embedding_cache.evictions")
+            self._vectors[slot] = vector
+            self._slots[key] = slot
+            self._slots.move_to_end(key)
+
+    def save(self) -> None:
+        """将缓存写入磁盘（未配置路径时跳过）"""
+        if not self.path:
+            return
+        with self._lock:
+            if self._vectors is None or not self._slots:
+                return
+            keys = list(self._slots.keys())
+            vectors = self._vectors[list(self._slots.values())]
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp.npz"
+            # 查询文本存为定长 unicode 数组，加载时无需 pickle
+            np.savez(tmp_path, keys=np.array(keys, dtype=np.str_), vectors=vectors,
+                     model=np.array(self.model, dtype=np.str_))
+            os.replace(tmp_path, self.path)
+            tools_logger.info(f"查询向量缓存已保存: {len(keys)} 条")
+        except Exception as e:
+            tools_logger.warning(f"保存查询向量缓存失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        hits = metrics.get_counter("embedding_cache.hits")
+        misses = metrics.get_counter("embedding_cache.misses")
+        total = hits + misses
+        with self._lock:
+            size = len(self._slots)
+            nbytes = self._vectors.nbytes if self._vectors is not None else 0
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "bytes": nbytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 3) if total else 0.0
+        }
+
+    def _allocate(self, dim: int) -> None:
+        """预分配向量矩阵（调用方持有锁）"""
+        self._vectors = np.zeros((self.max_size, dim), dtype=np.float32)
+        self._free = list(range(self.max_size - 1, -1, -1))
+
+    def _load(self) -> None:
+        """首次访问时从磁盘加载缓存（调用方持有锁）"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model"]) != self.model:
+                    tools_logger.info("嵌入模型已变更，忽略磁盘上的查询向量缓存")
+                    return
+                keys, vectors = data["keys"], data["vectors"]
+            # 保留最近使用的部分
+            keys, vectors = keys[-self.max_size:], vectors[-self.max_size:]
+            self._allocate(vectors.shape[1])
+            for key, vector in zip(keys, vectors):
+                slot = self._free.pop()
+                self._vectors[slot] = vector
+                self._slots[str(key)] = slot
+            tools_logger.info(f"已加载查询向量缓存: {len(self._slots)} 条")
+        except Exception as e:
+            tools_logger.warning(f"加载查询向量缓存失败: {e}")
+            self._slots.clear()
+            self._vectors = None
+
+
+# 全局查询向量缓存
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,141 @@
+"""
+Mystical Oracle HTTP Client - 共享 HTTP 客户端
+为外部 API 提供连接复用、超时控制、有限次退避重试与按端点统计（同步与异步）
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.settings import config
+from config.logger import tools_logger
+from utils.metrics import metrics
+
+# 视为可重试的响应状态码
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class HttpClient:
+    """共享 HTTP 客户端，同步请求使用 requests.Session，异步请求使用 httpx.AsyncClient"""
+
+    def __init__(self, name: str, timeout: Optional[float] = None, connect_timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None, backoff: Optional[float] = None,
+                 pool_size: Optional[int] = None):
+        http_config = config.get_http_config()
+        self.name = name
+        self.timeout = timeout or http_config["timeout"]
+        self.connect_timeout = connect_timeout or http_config["connect_timeout"]
+        self.max_retries = max_retries if max_retries is not None else http_config["max_retries"]
+        self.backoff = backoff if backoff is not None else http_config["backoff"]
+        self.pool_size = pool_size or http_config["pool_size"]
+
+        # 同步会话与异步客户端均在首次使用时创建，只走异步请求的调用方（如 TTS）不会建立同步连接池
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
+        # 异步客户端绑定事件循环，首次使用时在服务循环中创建
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def session(self) -> requests.Session:
+        """同步会话：连接池复用 keep-alive 连接，重试由本类统一处理"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+                                          max_retries=0)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """异步客户端"""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size
+                )
+            )
+        return self._async_client
+
+    def post(self, url: str, endpoint: str, **kwargs: Any) -> requests.Response:
+        """同步 POST 请求，连接错误、超时及 429/5xx 响应会退避重试"""
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.post(url, timeout=(self.connect_timeout, self.timeout), **kwargs)
+            except requests.RequestException as e:
+                self._record(endpoint, start, error=True)
+                if attempt >= self.max_retries:
+                    raise
+                self._log_retry(endpoint, attempt, e)
+                time.sleep(self._backoff_delay(attempt))
+                continue
+
+            self._record(endpoint, start, error=response.status_code >= 400)
+            if response.status_code not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                return response
+            self._log_retry(endpoint, attempt, f"HTTP {response.status_code}")
+            time.sleep(self._backoff_delay(attempt))
+
+    async def apost(self, url: str, endpoint: str, **kwargs: Any) -> httpx.Response:
+        """异步 POST 请求，重试策略与同步请求一致"""
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = await self.async_client.post(url, **kwargs)
+            except httpx.HTTPError as e:
+                self._record(endpoint, start, error=True)
+                if attempt >= self.max_retries:
+                    raise
+                self._log_retry(endpoint, attempt, e)
+                await asyncio.sleep(self._backoff_delay(attempt))
+                continue
+
+            self._record(endpoint, start, error=response.status_code >= 400)
+            if response.status_code not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                return response
+            self._log_retry(endpoint, attempt, f"HTTP {response.status_code}")
+            await asyncio.sleep(self._backoff_delay(attempt))
+
+    def close(self) -> None:
+        """关闭同步会话"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self) -> None:
+        """关闭异步客户端"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """指数退避并加入随机抖动"""
+        return self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    def _record(self, endpoint: str, start: float, error: bool) -> None:
+        """记录单次请求的耗时与结果"""
+        prefix = f"http.{self.name}.{endpoint}"
+        metrics.latency(prefix).record(time.perf_counter() - start)
+        metrics.increment(f"{prefix}.requests")
+        if error:
+            metrics.increment(f"{prefix}.errors")
+
+    def _log_retry(self, endpoint: str, attempt: int, reason: Any) -> None:
+        """记录重试"""
+        metrics.increment(f"http.{self.name}.{endpoint}.retries")
+        tools_logger.warning(f"{self.name}/{endpoint} 请求失败({reason})，第 {attempt + 1} 次重试")
+
+
+# 缘分居 API 共享客户端
+yuanfenju_client = HttpClient("yuanfenju")
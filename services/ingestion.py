@@ -0,0 +1,324 @@
+"""
+Mystical Oracle Ingestion - 知识库批量入库
+以任务形式后台导入网页、PDF 与文本：并发抓取或逐页读取、流式切分、分批向量化并增量写入知识库，可随时查询进度
+"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from pypdf import PdfReader
+from langchain_community.document_loaders import WebBaseLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from config.settings import config
+from config.logger import server_logger
+from services.knowledge_base import knowledge_base
+from services.kb_manifest import source_manifest
+from services.job_queue import LANE_BULK, Job, job_queue
+from utils.metrics import metrics
+
+# 单个任务最多保留的错误明细条数
+MAX_JOB_ERRORS = 20
+# 上传文件与文本文件的读取块大小
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+# 文本文件每个分段约包含的文本块数
+TEXT_PART_CHUNKS = 16
+
+
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    """知识库统一的文本切分器"""
+    ingest_config = config.get_ingest_config()
+    return RecursiveCharacterTextSplitter(
+        chunk_size=ingest_config["chunk_size"],
+        chunk_overlap=ingest_config["chunk_overlap"]
+    )
+
+
+class IngestProgress:
+    """入库进度，计数变化时写回所属的后台任务"""
+
+    def __init__(self, job: Job, total: int):
+        self.job = job
+        self.total = total  # 待处理的来源数（网页数或文件数）
+        self.processed = 0  # 已处理的来源数（含失败）
+        self.failed = 0
+        self.pages = 0  # 已解析的页数（网页、PDF 页或文本分段）
+        self.chunks = 0  # 已写入知识库的文本块数
+        self.skipped = 0  # 内容未变化而跳过的文本块数
+        self.errors: List[str] = []
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self.publish(force=True)
+
+    def source_done(self, error: str = "") -> None:
+        """记录一个来源处理完成"""
+        with self._lock:
+            self.processed += 1
+            if error:
+                self.failed += 1
+                if len(self.errors) < MAX_JOB_ERRORS:
+                    self.errors.append(error)
+        self.publish()
+
+    def page_done(self) -> None:
+        with self._lock:
+            self.pages += 1
+
+    def chunks_added(self, count: int) -> None:
+        with self._lock:
+            self.chunks += count
+        self.publish()
+
+    def chunks_skipped(self, count: int) -> None:
+        with self._lock:
+            self.skipped += count
+
+    def publish(self, force: bool = False) -> None:
+        """将进度写回后台任务"""
+        self.job.update_progress(force=force, **self.to_dict())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """进度快照"""
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            return {
+                "total": self.total,
+                "processed": self.processed,
+                "failed": self.failed,
+                "pages": self.pages,
+                "chunks": self.chunks,
+                "skipped": self.skipped,
+                "progress": round(self.processed / self.total, 3) if self.total else 1.0,
+                "elapsed_s": round(elapsed, 2),
+                "pages_per_sec": round(self.pages / elapsed, 2) if elapsed else 0.0,
+                "chunks_per_sec": round((self.chunks + self.skipped) / elapsed, 2) if elapsed else 0.0,
+                "errors": list(self.errors)
+            }
+
+
+class IngestionService:
+    """知识库入库服务：管理入库任务与后台执行"""
+
+    def __init__(self):
+        ingest_config = config.get_ingest_config()
+        self.batch_size = max(1, ingest_config["batch_size"])
+        self.fetch_concurrency = max(1, ingest_config["fetch_concurrency"])
+        self._session = self._create_session()
+        self.upload_dir = ingest_config["upload_dir"] or None
+        if self.upload_dir:
+            os.makedirs(self.upload_dir, exist_ok=True)
+        job_queue.register("ingest.urls", self._handle_urls, lane=LANE_BULK)
+        job_queue.register("ingest.pdfs", self._handle_files, cleanup=self._remove_spooled, lane=LANE_BULK)
+        job_queue.register("ingest.texts", self._handle_files, cleanup=self._remove_spooled, lane=LANE_BULK)
+
+    def submit_urls(self, urls: List[str]) -> Job:
+        """提交网页入库任务"""
+        urls = list(dict.fromkeys(urls))  # 去重并保持顺序
+        return job_queue.submit("ingest.urls", {"urls": urls})
+
+    def submit_files(self, kind: str, files: List[Tuple[str, str]]) -> Job:
+        """
+        提交文件入库任务（依赖本地临时文件，只在当前进程执行且不重试）
+
+        Args:
+            kind: 文件类型，pdfs 或 texts
+            files: (原始文件名, 临时文件路径) 列表，任务结束后删除临时文件
+        """
+        return job_queue.submit(f"ingest.{kind}", {"files": [list(item) for item in files]},
+                                max_retries=0, local=True)
+
+    async def spool_upload(self, upload, suffix: str = "") -> str:
+        """将上传文件分块写入临时文件，返回临时文件路径；磁盘读写在线程池中执行，不阻塞事件循环"""
+        fd, path = await asyncio.to_thread(tempfile.mkstemp, prefix="ingest-", suffix=suffix, dir=self.upload_dir)
+        try:
+            f = os.fdopen(fd, "wb")
+            try:
+                while True:
+                    block = await upload.read(UPLOAD_BLOCK_SIZE)
+                    if not block:
+                        break
+                    await asyncio.to_thread(f.write, block)
+            finally:
+                await asyncio.to_thread(f.close)
+        except BaseException:
+            # 含客户端断开导致的取消，直接删除以确保不留下残缺文件
+            os.remove(path)
+            raise
+        return path
+
+    def shutdown(self) -> None:
+        """关闭抓取会话"""
+        self._session.close()
+
+    def _handle_urls(self, job: Job) -> Dict[str, Any]:
+        """网页入库任务：并发抓取网页，切分结果分批写入知识库"""
+        urls = job.payload["urls"]
+        progress = IngestProgress(job, len(urls))
+        return self._run(job, progress, self._fetch_chunks(progress, urls))
+
+    def _handle_files(self, job: Job) -> Dict[str, Any]:
+        """文件入库任务：逐个文件、逐页解析并分批写入知识库"""
+        files = [tuple(item) for item in job.payload["files"]]
+        reader = self._iter_pdf_pages if job.kind == "ingest.pdfs" else self._iter_text_parts
+        progress = IngestProgress(job, len(files))
+        try:
+            return self._run(job, progress, self._read_files(progress, files, reader))
+        finally:
+            self._remove_spooled(job)
+
+    @staticmethod
+    def _remove_spooled(job: Job) -> None:
+        """删除文件入库任务的暂存文件（任务执行结束，或排队中被取消时调用）"""
+        for _, path in job.payload["files"]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _run(self, job: Job, progress: IngestProgress, sources: Iterable[Tuple[str, List[Document]]]) -> Dict[str, Any]:
+        """执行入库并返回最终进度"""
+        server_logger.info(f"入库任务开始: {job.id} ({job.kind}, {progress.total} 个来源)")
+        try:
+            with metrics.latency(f"{job.kind}.job").time():
+                self._write_batches(job, progress, sources)
+        finally:
+            # 文件模式下每个任务只落盘一次清单（含取消或失败前已提交的来源）
+            source_manifest.save()
+        progress.publish(force=True)
+        server_logger.info(f"入库任务完成: {job.id}, 写入 {progress.chunks} 个文本块")
+        return progress.to_dict()
+
+    def _fetch_chunks(self, progress: IngestProgress, urls: List[str]) -> Iterator[Tuple[str, List[Document]]]:
+        """并发抓取网页并逐页产出文本块，在途抓取数不超过并发上限"""
+        splitter = get_text_splitter()
+        pending = iter(urls)
+        with ThreadPoolExecutor(max_workers=self.fetch_concurrency, thread_name_prefix="ingest-fetch") as pool:
+            futures = {pool.submit(self._fetch_url, url): url
+                       for url in _take(pending, self.fetch_concurrency)}
+            while futures:
+                future = next(as_completed(futures))
+                url = futures.pop(future)
+                for next_url in _take(pending, 1):
+                    futures[pool.submit(self._fetch_url, next_url)] = next_url
+                try:
+                    docs = future.result()
+                except Exception as e:
+                    metrics.increment("ingest.urls.fetch_errors")
+                    progress.source_done(f"{url}: {e}")
+                    continue
+                progress.page_done()
+                yield url, splitter.split_documents(docs)
+                progress.source_done()
+
+    @staticmethod
+    def _read_files(progress: IngestProgress, files: List[Tuple[str, str]],
+                    reader) -> Iterator[Tuple[str, List[Document]]]:
+        """依次读取文件，单个文件解析失败不影响其余文件"""
+        splitter = get_text_splitter()
+        for name, path in files:
+            try:
+                for source, doc in reader(name, path):
+                    progress.page_done()
+                    yield source, splitter.split_documents([doc])
+            except Exception as e:
+                metrics.increment(f"{progress.job.kind}.file_errors")
+                progress.source_done(f"{name}: {e}")
+                continue
+            progress.source_done()
+
+    @staticmethod
+    def _iter_pdf_pages(name: str, path: str) -> Iterator[Tuple[str, Document]]:
+        """按页读取 PDF，每页作为一个来源"""
+        reader = PdfReader(path)
+        for number, page in enumerate(reader.pages, start=1):
+            text = page.extract_text() or ""
+            if text.strip():
+                yield f"{name}#page={number}", Document(page_content=text, metadata={"source": name, "page": number})
+
+    @staticmethod
+    def _iter_text_parts(name: str, path: str) -> Iterator[Tuple[str, Document]]:
+        """分块读取文本文件，按段落边界切出分段，每段作为一个来源"""
+        part_size = config.get_ingest_config()["chunk_size"] * TEXT_PART_CHUNKS
+        number, buffer = 0, ""
+        with open(path, encoding="utf-8", errors="replace") as f:
+            while True:
+                block = f.read(UPLOAD_BLOCK_SIZE)
+                buffer += block
+                while len(buffer) >= part_size or (not block and buffer):
+                    cut = buffer.rfind("\n\n", 0, part_size) if block else -1
+                    cut = cut + 2 if cut > 0 else min(len(buffer), part_size)
+                    part, buffer = buffer[:cut], buffer[cut:]
+                    number += 1
+                    if part.strip():
+                        yield f"{name}#part={number}", Document(page_content=part, metadata={"source": name, "part": number})
+                if not block:
+                    break
+
+    def _fetch_url(self, url: str) -> List[Document]:
+        """抓取单个网页"""
+        with metrics.latency("ingest.urls.fetch").time():
+            return WebBaseLoader(url, session=self._session, raise_for_status=True).load()
+
+    def _write_batches(self, job: Job, progress: IngestProgress,
+                       sources: Iterable[Tuple[str, List[Document]]]) -> None:
+        """
+        按来源去重后分批向量化写入知识库，每批不超过 batch_size 个文本块（大来源拆成多批）；
+        来源的最后一批写入后才更新其清单；每个来源之前检查取消
+        """
+        batch: List[Document] = []
+        pending: List[Tuple[str, List[str], List[str]]] = []
+        for source, chunks in sources:
+            job.raise_if_cancelled()
+            new_chunks, chunk_ids, stale_ids = knowledge_base.plan_source(source, chunks)
+            progress.chunks_skipped(len(chunk_ids) - len(new_chunks))
+            batch.extend(new_chunks)
+            while len(batch) >= self.batch_size:
+                # 之前来源的文本块不足一批，都在第一批内，随第一批提交
+                self._write_batch(progress, batch[:self.batch_size], pending)
+                batch, pending = batch[self.batch_size:], []
+            pending.append((source, chunk_ids, stale_ids))
+        if batch or pending:
+            self._write_batch(progress, batch, pending)
+
+    @staticmethod
+    def _write_batch(progress: IngestProgress, batch: List[Document],
+                     pending: List[Tuple[str, List[str], List[str]]]) -> None:
+        """写入一批文本块并提交其中各来源的清单"""
+        kind = progress.job.kind
+        if batch:
+            with metrics.latency(f"{kind}.batch").time():
+                knowledge_base.add_documents(batch)
+            progress.chunks_added(len(batch))
+            metrics.increment(f"{kind}.chunks", len(batch))
+        for source, chunk_ids, stale_ids in pending:
+            knowledge_base.commit_source(source, chunk_ids, stale_ids)
+
+    def _create_session(self) -> requests.Session:
+        """抓取用的共享 HTTP 会话，连接池与抓取并发数一致"""
+        session = requests.Session()
+        session.headers["User-Agent"] = os.environ.get("USER_AGENT", "Mozilla/5.0 (Mystical Oracle/1.0)")
+        adapter = HTTPAdapter(pool_connections=self.fetch_concurrency, pool_maxsize=self.fetch_concurrency)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+
+def _take(iterator: Iterator[str], count: int) -> List[str]:
+    """从迭代器中取出至多 count 个元素"""
+    items = []
+    for item in iterator:
+        items.append(item)
+        if len(items) >= count:
+            break
+    return items
+
+
+# 全局入库服务实例
+ingestion_service = IngestionService()
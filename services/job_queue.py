@@ -0,0 +1,560 @@
+"""
+Mystical Oracle Job Queue - 后台任务队列
+有界队列 + 工作线程池，支持重试、取消与进度查询；Redis 模式下多个服务副本共享同一队列
+实时任务与批量任务分通道排队，各用一组工作线程，长耗时的知识库导入不会拖慢语音合成等实时任务
+"""
+import asyncio
+import inspect
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from config.settings import config
+from config.logger import server_logger
+from services.redis_client import get_async_redis, get_redis
+from utils.helpers import format_error_message
+from utils.metrics import metrics
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+# 任务通道
+LANE_DEFAULT = "default"  # 实时任务（语音合成、记忆摘要等）
+LANE_BULK = "bulk"  # 批量任务（知识库导入等）
+
+# Redis 键名
+REDIS_QUEUE_KEY = "job_queue:pending"  # 实时通道；其他通道为 "job_queue:pending:<通道>"
+REDIS_PROCESSING_KEY = "job_queue:processing"
+REDIS_JOB_KEY = "job_queue:job:"
+REDIS_CANCEL_KEY = "job_queue:cancel:"
+REDIS_LEASE_KEY = "job_queue:lease:"
+
+# Redis 模式下进度写回的最小间隔(秒)
+PROGRESS_FLUSH_INTERVAL = 0.5
+# Redis 模式下领取任务的租约时长(秒)：执行进程定期续约，租约过期说明执行进程已退出，任务重新入队
+JOB_LEASE_TTL = 30
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+
+class JobCancelled(Exception):
+    """任务已被取消，处理函数抛出此异常以提前结束"""
+
+
+class Job:
+    """后台任务记录"""
+
+    def __init__(self, kind: str, payload: Dict[str, Any], job_id: Optional[str] = None,
+                 max_retries: int = 0, local: bool = True):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.local = local  # 仅在提交任务的进程内执行（如依赖本地临时文件）
+        self.status = JOB_QUEUED
+        self.attempts = 0
+        self.max_retries = max_retries
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.cancel_requested = False
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._queue: Optional["JobQueue"] = None
+        self._flushed_at = 0.0
+
+    def update_progress(self, force: bool = False, **fields: Any) -> None:
+        """更新任务进度"""
+        self.progress.update(fields)
+        if self._queue is not None and not self.local:
+            now = time.monotonic()
+            if force or now - self._flushed_at >= PROGRESS_FLUSH_INTERVAL:
+                self._flushed_at = now
+                self._queue._save(self)
+
+    def is_cancelled(self) -> bool:
+        """任务是否已被请求取消"""
+        if not self.cancel_requested and self._queue is not None and not self.local:
+            self.cancel_requested = bool(get_redis().exists(REDIS_CANCEL_KEY + self.id))
+        return self.cancel_requested
+
+    def raise_if_cancelled(self) -> None:
+        """已被请求取消时抛出 JobCancelled"""
+        if self.is_cancelled():
+            raise JobCancelled(self.id)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """任务状态快照"""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_retries": self.max_retries,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+    def dumps(self) -> str:
+        """序列化（Redis 存储）"""
+        return json.dumps({**self.to_dict(), "payload": self.payload}, ensure_ascii=False, default=str)
+
+    @classmethod
+    def loads(cls, raw: Any) -> "Job":
+        """反序列化（Redis 存储）"""
+        data = json.loads(raw)
+        job = cls(data["kind"], data["payload"], job_id=data["job_id"],
+                  max_retries=data["max_retries"], local=False)
+        for field in ("status", "attempts", "progress", "result", "error",
+                      "created_at", "started_at", "finished_at"):
+            setattr(job, field, data.get(field))
+        return job
+
+
+class JobQueue:
+    """后台任务队列：按任务类型注册处理函数，由常驻工作线程执行"""
+
+    def __init__(self):
+        queue_config = config.get_job_queue_config()
+        self.backend = queue_config["backend"]
+        self.workers = max(1, queue_config["workers"])
+        self.bulk_workers = max(1, queue_config["bulk_workers"])
+        self.max_size = max(1, queue_config["max_size"])
+        self.max_retries = queue_config["max_retries"]
+        self.retry_backoff = queue_config["retry_backoff"]
+        self.result_ttl = queue_config["result_ttl"]
+        self.max_records = max(1, queue_config["max_records"])
+        self._handlers: Dict[str, Callable[[Job], Any]] = {}
+        self._cleanups: Dict[str, Callable[[Job], None]] = {}
+        self._lanes: Dict[str, str] = {}
+        self._local: Dict[str, "queue.Queue[str]"] = {
+            lane: queue.Queue(maxsize=self.max_size) for lane in self.lane_workers
+        }
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        # 本进程领取、尚未结束的 Redis 任务（需续约租约）
+        self._leased: set = set()
+
+    @property
+    def use_redis(self) -> bool:
+        """是否启用 Redis 共享队列"""
+        return self.backend == "redis"
+
+    @property
+    def lane_workers(self) -> Dict[str, int]:
+        """各通道的工作线程数"""
+        return {LANE_DEFAULT: self.workers, LANE_BULK: self.bulk_workers}
+
+    def register(self, kind: str, handler: Callable[[Job], Any],
+                 cleanup: Optional[Callable[[Job], None]] = None, lane: str = LANE_DEFAULT) -> None:
+        """
+        注册任务处理函数，支持普通函数与协程函数
+
+        cleanup 在任务未经处理函数就结束（排队中被取消、无法重新入队等）时调用，用于释放任务占用的资源（如临时文件）；
+        lane 为任务所在通道，长耗时的批量任务应注册到 LANE_BULK
+        """
+        if lane not in self._local:
+            raise ValueError(f"未知的任务通道: {lane}")
+        self._handlers[kind] = handler
+        self._lanes[kind] = lane
+        if cleanup is not None:
+            self._cleanups[kind] = cleanup
+
+    def start(self) -> None:
+        """启动工作线程（重复调用无副作用）"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            sources = ["local"] + (["redis"] if self.use_redis else [])
+            for source in sources:
+                for lane, workers in self.lane_workers.items():
+                    for index in range(workers):
+                        thread = threading.Thread(target=self._worker, args=(source, lane),
+                                                  name=f"job-{source}-{lane}-{index}", daemon=True)
+                        thread.start()
+                        self._threads.append(thread)
+            if self.use_redis:
+                thread = threading.Thread(target=self._keep_leases, name="job-redis-lease", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        server_logger.info(f"后台任务队列已启动: {self.backend} 模式, "
+                           f"每个队列实时通道 {self.workers} 个、批量通道 {self.bulk_workers} 个工作线程")
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """停止工作线程，最多等待 timeout 秒让执行中的任务结束"""
+        self._stopping.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+
+    def submit(self, kind: str, payload: Dict[str, Any], job_id: Optional[str] = None,
+               max_retries: Optional[int] = None, local: bool = False) -> Job:
+        """
+        提交任务
+
+        Args:
+            kind: 任务类型（需已注册处理函数）
+            payload: 任务参数（Redis 模式下需可 JSON 序列化）
+            job_id: 指定任务 ID，默认随机生成
+            max_retries: 失败重试次数，默认使用配置
+            local: 是否只在当前进程执行
+
+        Raises:
+            QueueFullError: 队列已满
+        """
+        job = self._create_job(kind, payload, job_id, max_retries, local)
+        if job.local:
+            self._enqueue_local(job)
+        else:
+            client = get_redis()
+            pending_key = self._pending_key(kind)
+            if client.llen(pending_key) >= self.max_size:
+                self._reject()
+            self._save(job)
+            client.lpush(pending_key, job.id)
+
+        metrics.increment(f"jobs.{kind}.submitted")
+        return job
+
+    async def asubmit(self, kind: str, payload: Dict[str, Any], job_id: Optional[str] = None,
+                      max_retries: Optional[int] = None, local: bool = False) -> Job:
+        """异步提交任务（参数同 submit），Redis 模式下使用异步客户端，不阻塞事件循环"""
+        job = self._create_job(kind, payload, job_id, max_retries, local)
+        if job.local:
+            self._enqueue_local(job)
+        else:
+            client = get_async_redis()
+            pending_key = self._pending_key(kind)
+            if await client.llen(pending_key) >= self.max_size:
+                self._reject()
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.set(REDIS_JOB_KEY + job.id, job.dumps(), ex=self.result_ttl)
+                pipe.lpush(pending_key, job.id)
+                await pipe.execute()
+
+        metrics.increment(f"jobs.{kind}.submitted")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """查询任务"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.use_redis:
+            job = self._load_redis(job_id)
+        return job
+
+    async def aget(self, job_id: str) -> Optional[Job]:
+        """异步查询任务，Redis 模式下使用异步客户端，不阻塞事件循环"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.use_redis:
+            raw = await get_async_redis().get(REDIS_JOB_KEY + job_id)
+            job = Job.loads(raw) if raw else None
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """取消任务：排队中的任务直接取消，执行中的任务在下一个检查点结束"""
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        job.cancel_requested = True
+        if not job.local:
+            # 取消标记单独存放，避免被执行中任务的进度写回覆盖
+            get_redis().set(REDIS_CANCEL_KEY + job.id, 1, ex=self.result_ttl)
+        if job.status == JOB_QUEUED:
+            self._finish(job, JOB_CANCELLED)
+            self._cleanup(job)
+        return job
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取队列统计"""
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        stats = {
+            "backend": self.backend,
+            "workers": len(self._threads),
+            "local_pending": sum(pending.qsize() for pending in self._local.values()),
+            "local_running": statuses.count(JOB_RUNNING),
+            "lanes": {lane: {"workers": workers, "local_pending": self._local[lane].qsize()}
+                      for lane, workers in self.lane_workers.items()}
+        }
+        if self.use_redis:
+            try:
+                with get_redis().pipeline(transaction=False) as pipe:
+                    for lane in self.lane_workers:
+                        pipe.llen(self._lane_key(lane))
+                    *pending, stats["redis_processing"] = pipe.llen(REDIS_PROCESSING_KEY).execute()
+                stats["redis_pending"] = sum(pending)
+                for lane, count in zip(self.lane_workers, pending):
+                    stats["lanes"][lane]["redis_pending"] = count
+            except Exception as e:
+                stats["redis_pending"] = None
+                server_logger.warning(f"读取 Redis 任务队列长度失败: {e}")
+        return stats
+
+    def _create_job(self, kind: str, payload: Dict[str, Any], job_id: Optional[str],
+                    max_retries: Optional[int], local: bool) -> Job:
+        """校验任务类型、启动工作线程并创建任务记录"""
+        if kind not in self._handlers:
+            raise ValueError(f"未注册的任务类型: {kind}")
+        self.start()
+        return Job(kind, payload, job_id=job_id, local=local or not self.use_redis,
+                   max_retries=self.max_retries if max_retries is None else max_retries)
+
+    def _enqueue_local(self, job: Job) -> None:
+        """本地任务入队"""
+        self._remember(job)
+        try:
+            self._local[self._lanes[job.kind]].put_nowait(job.id)
+        except queue.Full:
+            self._forget(job.id)
+            self._reject()
+
+    @staticmethod
+    def _reject() -> None:
+        """拒绝提交"""
+        metrics.increment("jobs.rejected")
+        raise QueueFullError("任务队列已满")
+
+    @staticmethod
+    def _lane_key(lane: str) -> str:
+        """通道对应的 Redis 排队列表"""
+        return REDIS_QUEUE_KEY if lane == LANE_DEFAULT else f"{REDIS_QUEUE_KEY}:{lane}"
+
+    def _pending_key(self, kind: str) -> str:
+        """任务类型所在通道的 Redis 排队列表（未在本进程注册的类型归入实时通道）"""
+        return self._lane_key(self._lanes.get(kind, LANE_DEFAULT))
+
+    def _worker(self, source: str, lane: str) -> None:
+        """工作线程：常驻事件循环，依次领取并执行所在通道的任务"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    job = self._next_job(source, lane)
+                except Exception as e:
+                    server_logger.error(format_error_message(e, f"领取后台任务 ({source}/{lane})"))
+                    time.sleep(1)
+                    continue
+                if job is not None:
+                    self._execute(job, loop)
+        finally:
+            loop.close()
+
+    def _next_job(self, source: str, lane: str) -> Optional[Job]:
+        """领取通道中的下一个任务，等待超时返回 None"""
+        if source == "local":
+            try:
+                job_id = self._local[lane].get(timeout=1)
+            except queue.Empty:
+                return None
+            with self._lock:
+                return self._jobs.get(job_id)
+
+        # 领取时原子地移入处理中列表并加租约，执行进程退出后任务不会丢失
+        client = get_redis()
+        item = client.blmove(self._lane_key(lane), REDIS_PROCESSING_KEY, 1, src="RIGHT", dest="LEFT")
+        if item is None:
+            return None
+        job_id = item.decode() if isinstance(item, bytes) else item
+        with self._lock:
+            self._leased.add(job_id)
+        client.set(REDIS_LEASE_KEY + job_id, 1, ex=JOB_LEASE_TTL)
+        job = self._load_redis(job_id)
+        if job is None:
+            self._release_lease(job_id)
+        return job
+
+    def _execute(self, job: Job, loop: asyncio.AbstractEventLoop) -> None:
+        """执行任务并处理重试"""
+        if job.status != JOB_QUEUED:
+            if not job.local:
+                self._release_lease(job.id)
+            self._cleanup(job)
+            return
+        handler = self._handlers.get(job.kind)
+        if handler is None:
+            self._finish(job, JOB_FAILED, error=f"未注册的任务类型: {job.kind}")
+            return
+
+        job._queue = self
+        if job.is_cancelled():
+            self._finish(job, JOB_CANCELLED)
+            self._cleanup(job)
+            return
+        job.status = JOB_RUNNING
+        job.attempts += 1
+        job.started_at = time.time()
+        if not job.local:
+            self._save(job)
+
+        try:
+            with metrics.latency(f"jobs.{job.kind}").time():
+                result = handler(job)
+                if inspect.isawaitable(result):
+                    result = loop.run_until_complete(result)
+            self._finish(job, JOB_COMPLETED, result=result)
+        except JobCancelled:
+            self._finish(job, JOB_CANCELLED)
+        except Exception as e:
+            error_msg = format_error_message(e, f"后台任务 {job.kind}:{job.id}")
+            if job.attempts <= job.max_retries and not job.is_cancelled():
+                server_logger.warning(f"{error_msg}，第 {job.attempts} 次失败，稍后重试")
+                metrics.increment(f"jobs.{job.kind}.retries")
+                self._retry(job, error_msg)
+            else:
+                server_logger.error(error_msg)
+                self._finish(job, JOB_FAILED, error=error_msg)
+
+    def _retry(self, job: Job, error: str) -> None:
+        """按指数退避重新入队"""
+        job.status = JOB_QUEUED
+        job.error = error
+        if not job.local:
+            self._save(job)
+        delay = self.retry_backoff * (2 ** (job.attempts - 1))
+
+        def requeue():
+            if job.local:
+                try:
+                    self._local[self._lanes[job.kind]].put_nowait(job.id)
+                except queue.Full:
+                    self._finish(job, JOB_FAILED, error="任务队列已满，放弃重试")
+                    self._cleanup(job)
+            else:
+                # 等待重试期间任务留在处理中列表并持续续约，进程退出时由租约过期重新入队
+                with get_redis().pipeline() as pipe:
+                    pipe.lrem(REDIS_PROCESSING_KEY, 1, job.id).lpush(self._pending_key(job.kind), job.id)
+                    pipe.delete(REDIS_LEASE_KEY + job.id).execute()
+                with self._lock:
+                    self._leased.discard(job.id)
+
+        timer = threading.Timer(delay, requeue)
+        timer.daemon = True
+        timer.start()
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        """记录任务最终状态"""
+        job.status = status
+        job.result = result
+        job.error = error if status == JOB_FAILED else None
+        job.finished_at = time.time()
+        metrics.increment(f"jobs.{job.kind}.{status}")
+        if not job.local:
+            self._save(job)
+            self._release_lease(job.id)
+
+    def _cleanup(self, job: Job) -> None:
+        """任务未经处理函数就结束时，释放其占用的资源"""
+        cleanup = self._cleanups.get(job.kind)
+        if cleanup is None:
+            return
+        try:
+            cleanup(job)
+        except Exception as e:
+            server_logger.warning(format_error_message(e, f"清理后台任务 {job.kind}:{job.id}"))
+
+    def _remember(self, job: Job) -> None:
+        """登记本地任务，超出上限时丢弃最早的已结束任务"""
+        with self._lock:
+            self._jobs[job.id] = job
+            overflow = len(self._jobs) - self.max_records
+            if overflow > 0:
+                finished = [job_id for job_id, item in self._jobs.items() if item.status in FINISHED_STATES]
+                for job_id in finished[:overflow]:
+                    del self._jobs[job_id]
+
+    def _forget(self, job_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _release_lease(self, job_id: str) -> None:
+        """任务结束，移出处理中列表并释放租约"""
+        with self._lock:
+            self._leased.discard(job_id)
+        with get_redis().pipeline() as pipe:
+            pipe.lrem(REDIS_PROCESSING_KEY, 1, job_id).delete(REDIS_LEASE_KEY + job_id).execute()
+
+    def _keep_leases(self) -> None:
+        """续约本进程执行中的任务，并将租约过期（执行进程已退出）的任务重新入队"""
+        suspects: set = set()
+        next_reap = 0.0
+        while not self._stopping.wait(JOB_LEASE_TTL / 3):
+            try:
+                with self._lock:
+                    leased = list(self._leased)
+                client = get_redis()
+                if leased:
+                    with client.pipeline(transaction=False) as pipe:
+                        for job_id in leased:
+                            pipe.set(REDIS_LEASE_KEY + job_id, 1, ex=JOB_LEASE_TTL)
+                        pipe.execute()
+                if time.monotonic() >= next_reap:
+                    next_reap = time.monotonic() + JOB_LEASE_TTL
+                    suspects = self._requeue_orphans(client, suspects)
+            except Exception as e:
+                server_logger.error(format_error_message(e, "续约后台任务"))
+
+    def _requeue_orphans(self, client: Any, suspects: set) -> set:
+        """
+        处理中列表里连续两轮检查都没有租约的任务视为执行进程已退出，重新入队（两轮间隔一个租约时长，
+        避免误判刚领取、尚未加租约的任务）；返回本轮没有租约的任务，供下一轮确认
+        """
+        processing = {
+            job_id.decode() if isinstance(job_id, bytes) else job_id
+            for job_id in client.lrange(REDIS_PROCESSING_KEY, 0, -1)
+        }
+        if not processing:
+            return set()
+        with client.pipeline(transaction=False) as pipe:
+            for job_id in processing:
+                pipe.exists(REDIS_LEASE_KEY + job_id)
+            leased = pipe.execute()
+        orphans = {job_id for job_id, alive in zip(processing, leased) if not alive}
+        for job_id in orphans & suspects:
+            # LREM 成功的副本才重新入队，多个副本同时检查时不会重复入队
+            if not client.lrem(REDIS_PROCESSING_KEY, 1, job_id):
+                continue
+            job = self._load_redis(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                continue
+            job.status = JOB_QUEUED
+            self._save(job)
+            client.lpush(self._pending_key(job.kind), job_id)
+            metrics.increment("jobs.requeued_orphans")
+            server_logger.warning(f"后台任务执行进程已退出，重新入队: {job.kind}:{job_id}")
+        return orphans
+
+    def _save(self, job: Job) -> None:
+        """写入 Redis 任务记录"""
+        get_redis().set(REDIS_JOB_KEY + job.id, job.dumps(), ex=self.result_ttl)
+
+    def _load_redis(self, job_id: str) -> Optional[Job]:
+        """读取 Redis 任务记录"""
+        raw = get_redis().get(REDIS_JOB_KEY + job_id)
+        return Job.loads(raw) if raw else None
+
+
+# 全局任务队列
+job_queue = JobQueue()
@@ -0,0 +1,108 @@
+"""
+Mystical Oracle KB Manifest - 知识库来源清单
+记录每个来源（网页、文件）当前已入库的文本块 ID，用于重复入库时跳过未变化的文本块并清理过期文本块
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from config.settings import config
+from config.logger import tools_logger
+from services.redis_client import get_redis
+
+# Redis 模式下的清单哈希：字段为来源，值为该来源的文本块 ID 列表
+REDIS_MANIFEST_KEY = "kb_manifest:sources"
+
+
+class SourceManifest:
+    """
+    来源清单：source → {chunk_ids, updated_at}
+    - Redis 模式：每个来源是共享哈希中的一个字段，逐来源读写，多个副本看到同一份清单
+    - 文件模式：以 JSON 文件持久化，文件被其他进程更新后重新加载；保存时加文件锁读取最新清单，只合并本进程改动过的来源
+    """
+
+    def __init__(self, path: Optional[str] = None, use_redis: Optional[bool] = None):
+        self.path = path if path is not None else config.KB_MANIFEST_PATH
+        self.use_redis = config.KB_MANIFEST_REDIS if use_redis is None else use_redis
+        self._sources: Dict[str, Dict[str, Any]] = {}
+        self._dirty: Set[str] = set()
+        self._lock = threading.Lock()
+        self._mtime_ns: Optional[int] = None
+
+    def get(self, source: str) -> List[str]:
+        """获取来源已入库的文本块 ID"""
+        if self.use_redis:
+            raw = get_redis().hget(REDIS_MANIFEST_KEY, source)
+            return json.loads(raw)["chunk_ids"] if raw else []
+        with self._lock:
+            self._refresh()
+            entry = self._sources.get(source)
+            return list(entry["chunk_ids"]) if entry else []
+
+    def set(self, source: str, chunk_ids: List[str]) -> None:
+        """更新来源的文本块 ID（文件模式下需调用 save 落盘）"""
+        entry = {"chunk_ids": list(chunk_ids), "updated_at": time.time()}
+        if self.use_redis:
+            get_redis().hset(REDIS_MANIFEST_KEY, source, json.dumps(entry, ensure_ascii=False))
+            return
+        with self._lock:
+            self._refresh()
+            self._sources[source] = entry
+            self._dirty.add(source)
+
+    def save(self) -> None:
+        """文件模式下将改动合并写入磁盘：持锁读取最新清单，覆盖本进程改动过的来源，再原子替换"""
+        if self.use_redis or not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+                with open(f"{self.path}.lock", "w") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    merged = self._read()
+                    merged.update({source: self._sources[source] for source in self._dirty})
+                    tmp_path = f"{self.path}.tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(merged, f, ensure_ascii=False)
+                    os.replace(tmp_path, self.path)
+                    self._mtime_ns = os.stat(self.path).st_mtime_ns
+                self._sources = merged
+                self._dirty.clear()
+            except Exception as e:
+                tools_logger.warning(f"保存知识库来源清单失败: {e}")
+
+    def _refresh(self) -> None:
+        """清单文件被更新（含其他进程写入）时重新加载，保留本进程尚未保存的改动（调用方持有锁）"""
+        if not self.path:
+            return
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+        self._mtime_ns = mtime_ns
+        loaded = self._read()
+        loaded.update({source: self._sources[source] for source in self._dirty})
+        self._sources = loaded
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        """读取清单文件，文件不存在或损坏时返回空清单"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            tools_logger.warning(f"加载知识库来源清单失败: {e}")
+            return {}
+
+
+# 全局来源清单
+source_manifest = SourceManifest()
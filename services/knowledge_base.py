@@ -0,0 +1,240 @@
+"""
+Mystical Oracle Knowledge Base - 本地知识库服务
+进程内只打开一次 Qdrant 连接与向量库，供检索工具与入库接口共享
+"""
+import hashlib
+import threading
+import uuid
+from contextlib import nullcontext
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_ollama import OllamaEmbeddings
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointIdsList, PointStruct, VectorParams
+
+from config.settings import config
+from config.logger import tools_logger
+from services.embedding_cache import embedding_cache
+from services.kb_manifest import source_manifest
+from services.semantic_cache import kb_semantic_cache
+from utils.metrics import metrics
+
+# 文本块 ID 命名空间：同一来源下内容相同的文本块始终得到相同的 ID
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c3a52-8d0e-4f7b-9a51-2c4e8b7d9f10")
+# 每批向量化并写入的文档数（与 langchain_qdrant 默认批大小一致）
+ADD_BATCH_SIZE = 64
+
+
+def chunk_id(source: str, content: str) -> str:
+    """按来源与内容哈希生成确定性的文本块 ID"""
+    digest = hashlib.sha256(f"{source}\n{content}".encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, digest))
+
+
+class KnowledgeBase:
+    """知识库服务：懒加载共享的 Qdrant 客户端、嵌入模型与向量库"""
+
+    def __init__(self):
+        self._client: Optional[QdrantClient] = None
+        self._embeddings: Optional[OllamaEmbeddings] = None
+        self._vectorstore: Optional[QdrantVectorStore] = None
+        self._init_lock = threading.Lock()
+        # 本地存储模式下客户端非线程安全，读写串行；服务端模式无需加锁
+        self._store_lock = threading.RLock()
+
+    @property
+    def is_local(self) -> bool:
+        """是否使用本地存储模式"""
+        return not config.get_qdrant_config()["url"]
+
+    @property
+    def client(self) -> QdrantClient:
+        """共享 Qdrant 客户端"""
+        if self._client is None:
+            with self._init_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    @property
+    def embeddings(self) -> OllamaEmbeddings:
+        """共享嵌入模型"""
+        if self._embeddings is None:
+            with self._init_lock:
+                if self._embeddings is None:
+                    self._embeddings = OllamaEmbeddings(**config.get_embedding_config())
+        return self._embeddings
+
+    @property
+    def collection_name(self) -> str:
+        """知识库集合名"""
+        return config.get_qdrant_config()["collection_name"]
+
+    def get_vectorstore(self) -> QdrantVectorStore:
+        """获取共享向量库，集合不存在时自动创建"""
+        if self._vectorstore is None:
+            client, embeddings = self.client, self.embeddings
+            with self._init_lock:
+                if self._vectorstore is None:
+                    with self._guard():
+                        self._ensure_collection(client, embeddings)
+                        self._vectorstore = QdrantVectorStore(
+                            client=client,
+                            collection_name=self.collection_name,
+                            embedding=embeddings
+                        )
+        return self._vectorstore
+
+    def embed_query(self, query: str) -> List[float]:
+        """查询向量化，优先读取向量缓存"""
+        embedding = embedding_cache.get(query)
+        if embedding is None:
+            with metrics.latency("kb.embed").time():
+                embedding = self.embeddings.embed_query(query)
+            embedding_cache.set(query, embedding)
+        return embedding
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """异步查询向量化，优先读取向量缓存"""
+        embedding = embedding_cache.get(query)
+        if embedding is None:
+            with metrics.latency("kb.embed").time():
+                embedding = await self.embeddings.aembed_query(query)
+            embedding_cache.set(query, embedding)
+        return embedding
+
+    def plan_source(self, source: str, chunks: List[Document]) -> Tuple[List[Document], List[str], List[str]]:
+        """
+        对比来源清单，计算某个来源需要新写入与需要删除的文本块
+
+        Returns:
+            (待写入的文本块, 该来源的全部文本块 ID, 已过期的文本块 ID)
+        """
+        unique = {}
+        for chunk in chunks:
+            unique.setdefault(chunk_id(source, chunk.page_content), chunk)
+        chunk_ids = list(unique)
+
+        indexed = set(source_manifest.get(source))
+        candidates = [point_id for point_id in chunk_ids if point_id not in indexed]
+        # 清单缺失（如首次启用清单）时以向量库中实际存在的点为准
+        existing = self._existing_ids(candidates)
+        new_ids = [point_id for point_id in candidates if point_id not in existing]
+        stale_ids = list(indexed - set(chunk_ids))
+
+        metrics.increment("kb.chunks_skipped", len(chunk_ids) - len(new_ids))
+        for point_id in new_ids:
+            unique[point_id].metadata["chunk_id"] = point_id
+        return [unique[point_id] for point_id in new_ids], chunk_ids, stale_ids
+
+    def commit_source(self, source: str, chunk_ids: List[str], stale_ids: List[str]) -> None:
+        """新文本块写入后更新来源清单，并删除过期文本块"""
+        if stale_ids:
+            with metrics.latency("kb.delete").time(), self._guard():
+                self.client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=PointIdsList(points=stale_ids)
+                )
+            metrics.increment("kb.chunks_deleted", len(stale_ids))
+            # 过期文本块已删除，已缓存的检索结果失效
+            kb_semantic_cache.clear()
+        source_manifest.set(source, chunk_ids)
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        """向知识库写入文档，未指定 ID 时使用文本块上的确定性 ID"""
+        if not documents:
+            return []
+        if ids is None and all("chunk_id" in doc.metadata for doc in documents):
+            ids = [doc.metadata["chunk_id"] for doc in documents]
+        if ids is None:
+            ids = [uuid.uuid4().hex for _ in documents]
+        vectorstore = self.get_vectorstore()
+        with metrics.latency("kb.add_documents").time():
+            for start in range(0, len(documents), ADD_BATCH_SIZE):
+                batch = documents[start:start + ADD_BATCH_SIZE]
+                # 向量化耗时最长，放在锁外执行，避免本地存储模式下阻塞检索
+                with metrics.latency("kb.embed_documents").time():
+                    vectors = self.embeddings.embed_documents([doc.page_content for doc in batch])
+                points = [
+                    PointStruct(
+                        id=point_id,
+                        vector={vectorstore.vector_name: vector},
+                        payload={
+                            vectorstore.content_payload_key: doc.page_content,
+                            vectorstore.metadata_payload_key: doc.metadata,
+                        }
+                    )
+                    for point_id, doc, vector in zip(ids[start:start + ADD_BATCH_SIZE], batch, vectors)
+                ]
+                with self._guard():
+                    self.client.upsert(collection_name=self.collection_name, points=points)
+        metrics.increment("kb.documents_added", len(ids))
+        # 知识库内容变化，已缓存的检索结果失效
+        kb_semantic_cache.clear()
+        return ids
+
+    def close(self) -> None:
+        """保存查询向量缓存并关闭 Qdrant 连接（释放本地存储锁）"""
+        embedding_cache.save()
+        source_manifest.save()
+        with self._init_lock:
+            if self._client is not None:
+                try:
+                    self._client.close()
+                except Exception as e:
+                    tools_logger.warning(f"关闭 Qdrant 连接失败: {e}")
+            self._client = None
+            self._vectorstore = None
+
+    def search(self, embedding: List[float],
+               vectorstore: Optional[QdrantVectorStore] = None) -> List[Document]:
+        """按查询向量执行 MMR 检索"""
+        vectorstore = vectorstore or self.get_vectorstore()
+        with metrics.latency("kb.search").time(), self._guard():
+            return vectorstore.max_marginal_relevance_search_by_vector(
+                embedding, **config.get_kb_search_config()
+            )
+
+    def _existing_ids(self, point_ids: List[str]) -> set:
+        """查询向量库中已存在的点 ID"""
+        if not point_ids:
+            return set()
+        self.get_vectorstore()
+        with self._guard():
+            points = self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=point_ids,
+                with_payload=False,
+                with_vectors=False
+            )
+        return {str(point.id) for point in points}
+
+    def _guard(self):
+        """本地存储模式返回串行锁，服务端模式不加锁"""
+        return self._store_lock if self.is_local else nullcontext()
+
+    def _create_client(self) -> QdrantClient:
+        """按配置创建 Qdrant 客户端"""
+        qdrant_config = config.get_qdrant_config()
+        if qdrant_config["url"]:
+            tools_logger.info(f"连接 Qdrant 服务: {qdrant_config['url']}")
+            return QdrantClient(url=qdrant_config["url"], api_key=qdrant_config["api_key"] or None)
+        tools_logger.info(f"打开本地 Qdrant 存储: {qdrant_config['path']}")
+        return QdrantClient(path=qdrant_config["path"])
+
+    def _ensure_collection(self, client: QdrantClient, embeddings: OllamaEmbeddings) -> None:
+        """集合不存在时按嵌入维度创建"""
+        if client.collection_exists(self.collection_name):
+            return
+        size = len(embeddings.embed_query("init"))
+        client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=VectorParams(size=size, distance=Distance.COSINE)
+        )
+        tools_logger.info(f"创建知识库集合: {self.collection_name} (维度 {size})")
+
+
+# 全局知识库实例
+knowledge_base = KnowledgeBase()
@@ -0,0 +1,96 @@
+"""
+Mystical Oracle Mood Classifier - 本地情绪分类器
+基于关键词词典打分，纯 CPU 计算，置信度不足时由调用方回退到大模型
+"""
+from typing import Dict, NamedTuple
+
+from prompts.mood_prompts import MoodPrompts
+
+
+class MoodPrediction(NamedTuple):
+    """情绪分类结果"""
+    mood: str
+    confidence: float
+    scores: Dict[str, float]
+
+
+class MoodClassifier:
+    """基于词典打分的情绪分类器"""
+
+    # 各情绪的关键词及权重（与 EMOTION_ANALYSIS_PROMPT 的判定规则保持一致）
+    LEXICON = {
+        "angry": {
+            "傻逼": 4, "去死": 4, "混蛋": 3, "王八蛋": 4, "滚": 3, "闭嘴": 3, "放屁": 3,
+            "骗子": 3, "神棍": 3, "垃圾": 3, "废物": 3, "妈的": 3, "他妈": 3, "有病": 3,
+            "胡说": 2, "骗人": 2, "气死": 2, "烦死": 2, "扯淡": 2, "fuck": 4, "shit": 3,
+        },
+        "depressed": {
+            "不想活": 4, "绝望": 4, "崩溃": 3, "难过": 3, "伤心": 3, "痛苦": 3, "悲伤": 3,
+            "沮丧": 3, "想哭": 3, "不开心": 3, "失恋": 3, "没希望": 3, "郁闷": 2, "分手": 2,
+            "失业": 2, "倒霉": 2, "孤独": 2, "焦虑": 2, "害怕": 2, "失败": 2, "哭": 2,
+            "担心": 1, "压力": 1, "累": 1, "唉": 1,
+        },
+        "upbeat": {
+            "太棒了": 3, "太好了": 3, "激动": 3, "兴奋": 3, "迫不及待": 3, "中奖": 3,
+            "升职": 2, "加薪": 2, "录取": 2, "考上": 2, "终于": 1, "！！": 2, "!!": 2,
+        },
+        "cheerful": {
+            "哈哈": 3, "开心": 3, "高兴": 3, "快乐": 3, "嘻嘻": 2, "嘿嘿": 2, "好玩": 2,
+            "有趣": 2, "呵呵": 1, "😄": 2, "😂": 2, "😊": 2,
+        },
+        "friendly": {
+            "谢谢": 3, "感谢": 3, "多谢": 3, "辛苦": 2, "您好": 2, "请问": 2, "劳驾": 2,
+            "喜欢": 2, "拜托": 1, "麻烦": 1, "你好": 1, "大师": 1,
+        },
+    }
+
+    # 没有命中任何关键词时判为默认情绪的置信度（没有证据，低于任何阈值，交由大模型判断）
+    NEUTRAL_CONFIDENCE = 0.0
+    # 单个情绪得分达到该值视为证据充分
+    STRONG_SCORE = 3.0
+
+    def __init__(self):
+        # 按关键词长度降序匹配，长词优先（如"不开心"优先于"开心"）
+        self._keywords = sorted(
+            (
+                (keyword.lower(), mood, float(weight))
+                for mood, keywords in self.LEXICON.items()
+                if MoodPrompts.is_valid_mood(mood)
+                for keyword, weight in keywords.items()
+            ),
+            key=lambda item: len(item[0]),
+            reverse=True
+        )
+
+    def predict(self, text: str) -> MoodPrediction:
+        """对文本进行情绪分类"""
+        text = (text or "").lower()
+        scores: Dict[str, float] = {}
+        consumed = [False] * len(text)
+
+        for keyword, mood, weight in self._keywords:
+            start = text.find(keyword)
+            while start != -1:
+                end = start + len(keyword)
+                # 已被更长关键词覆盖的位置不再重复计分
+                if not any(consumed[start:end]):
+                    scores[mood] = scores.get(mood, 0.0) + weight
+                    for i in range(start, end):
+                        consumed[i] = True
+                start = text.find(keyword, end)
+
+        if not scores:
+            return MoodPrediction(MoodPrompts.get_default_mood(), self.NEUTRAL_CONFIDENCE, scores)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best_mood, best_score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+
+        # 置信度 = 领先程度 × 证据强度
+        margin = best_score / (best_score + runner_up)
+        strength = min(1.0, best_score / self.STRONG_SCORE)
+        return MoodPrediction(best_mood, round(margin * strength, 3), scores)
+
+
+# 全局情绪分类器实例
+mood_classifier = MoodClassifier()
@@ -0,0 +1,47 @@
+"""
+Mystical Oracle Redis Client - 共享 Redis 客户端
+按 URL 缓存同步与异步客户端，进程内所有会话与任务复用同一个有界连接池
+"""
+import threading
+from typing import Dict, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from config.settings import config
+
+_clients: Dict[str, redis.Redis] = {}
+_async_clients: Dict[str, aioredis.Redis] = {}
+_lock = threading.Lock()
+
+
+def get_redis(url: Optional[str] = None) -> redis.Redis:
+    """获取共享的同步 Redis 客户端（连接用尽时等待空闲连接而不是报错）"""
+    url = url or config.REDIS_URL
+    with _lock:
+        client = _clients.get(url)
+        if client is None:
+            pool = redis.BlockingConnectionPool.from_url(url, **config.get_redis_pool_config())
+            client = _clients[url] = redis.Redis(connection_pool=pool)
+        return client
+
+
+def get_async_redis(url: Optional[str] = None) -> aioredis.Redis:
+    """获取共享的异步 Redis 客户端（绑定服务事件循环）"""
+    url = url or config.REDIS_URL
+    client = _async_clients.get(url)
+    if client is None:
+        pool = aioredis.BlockingConnectionPool.from_url(url, **config.get_redis_pool_config())
+        client = _async_clients[url] = aioredis.Redis(connection_pool=pool)
+    return client
+
+
+async def aclose_redis() -> None:
+    """关闭所有共享 Redis 客户端"""
+    for client in list(_async_clients.values()):
+        await client.aclose()
+    _async_clients.clear()
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,113 @@
+"""
+Mystical Oracle Result Cache - 工具结果缓存
+确定性查询（八字排盘、解梦）的结果缓存：进程内 LRU + TTL，可选 Redis 共享层供多副本复用
+"""
+import json
+from typing import Any, Dict, Optional
+
+from config.settings import config
+from config.logger import tools_logger
+from services.redis_client import get_redis, get_async_redis
+from utils.cache import TTLCache
+from utils.metrics import metrics
+
+
+class ResultCache:
+    """两级结果缓存，先查进程内缓存，再查 Redis（启用时），命中 Redis 后回填进程内缓存"""
+
+    def __init__(self, name: str, max_size: Optional[int] = None, ttl: Optional[int] = None,
+                 use_redis: Optional[bool] = None):
+        cache_config = config.get_result_cache_config()
+        self.name = name
+        self.ttl = ttl or cache_config["ttl"]
+        self.use_redis = cache_config["use_redis"] if use_redis is None else use_redis
+        self._local = TTLCache(max_size=max_size or cache_config["max_size"], ttl=self.ttl)
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，未命中返回 None"""
+        value = self._local.get(key)
+        if value is not None:
+            self._count("hits_local")
+            return value
+
+        if self.use_redis:
+            try:
+                raw = get_redis().get(self._redis_key(key))
+            except Exception as e:
+                tools_logger.warning(f"{self.name} 缓存读取 Redis 失败: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self._local.set(key, value)
+                self._count("hits_redis")
+                return value
+
+        self._count("misses")
+        return None
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """异步读取缓存，未命中返回 None"""
+        value = self._local.get(key)
+        if value is not None:
+            self._count("hits_local")
+            return value
+
+        if self.use_redis:
+            try:
+                raw = await get_async_redis().get(self._redis_key(key))
+            except Exception as e:
+                tools_logger.warning(f"{self.name} 缓存读取 Redis 失败: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self._local.set(key, value)
+                self._count("hits_redis")
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        """写入缓存"""
+        self._local.set(key, value)
+        if self.use_redis:
+            try:
+                get_redis().set(self._redis_key(key), json.dumps(value, ensure_ascii=False), ex=self.ttl)
+            except Exception as e:
+                tools_logger.warning(f"{self.name} 缓存写入 Redis 失败: {e}")
+
+    async def aset(self, key: str, value: Any) -> None:
+        """异步写入缓存"""
+        self._local.set(key, value)
+        if self.use_redis:
+            try:
+                await get_async_redis().set(self._redis_key(key), json.dumps(value, ensure_ascii=False), ex=self.ttl)
+            except Exception as e:
+                tools_logger.warning(f"{self.name} 缓存写入 Redis 失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        hits_local = metrics.get_counter(f"result_cache.{self.name}.hits_local")
+        hits_redis = metrics.get_counter(f"result_cache.{self.name}.hits_redis")
+        misses = metrics.get_counter(f"result_cache.{self.name}.misses")
+        total = hits_local + hits_redis + misses
+        return {
+            "size": len(self._local),
+            "hits_local": hits_local,
+            "hits_redis": hits_redis,
+            "misses": misses,
+            "hit_ratio": round((hits_local + hits_redis) / total, 3) if total else 0.0
+        }
+
+    def _redis_key(self, key: str) -> str:
+        """Redis 键名"""
+        return f"result_cache:{self.name}:{key}"
+
+    def _count(self, outcome: str) -> None:
+        """记录命中情况"""
+        metrics.increment(f"result_cache.{self.name}.{outcome}")
+
+
+# 各工具的结果缓存
+bazi_cache = ResultCache("bazi")
+dream_cache = ResultCache("jiemeng")
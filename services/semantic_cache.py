@@ -0,0 +1,181 @@
+"""
+Mystical Oracle Semantic Cache - 语义结果缓存
+按查询向量的余弦相似度复用知识库检索结果，相近问题（如不同说法的星座运势）直接返回已缓存的文档
+多副本部署时通过 Redis 中的缓存代数同步失效：任一副本清空缓存即递增代数，其他副本查找时发现代数变化后清空本地缓存
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config.settings import config
+from config.logger import tools_logger
+from services.redis_client import get_async_redis, get_redis
+from utils.metrics import metrics
+
+# Redis 中的缓存代数键前缀，后接缓存名
+REDIS_GENERATION_KEY = "semantic_cache:generation:"
+
+
+class SemanticCache:
+    """语义缓存：向量矩阵上的最近邻查找，带 TTL 与 LRU 淘汰"""
+
+    def __init__(self, name: str, max_size: Optional[int] = None, threshold: Optional[float] = None,
+                 ttl: Optional[float] = None, use_redis: Optional[bool] = None):
+        cache_config = config.get_semantic_cache_config()
+        self.name = name
+        self.enabled = cache_config["enabled"]
+        self.use_redis = cache_config["redis"] if use_redis is None else use_redis
+        self.max_size = max(1, max_size or cache_config["max_size"])
+        self.threshold = threshold if threshold is not None else cache_config["threshold"]
+        self.ttl = ttl if ttl is not None else cache_config["ttl"]
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # 归一化后的查询向量
+        self._expires = np.zeros(self.max_size, dtype=np.float64)  # 0 表示空槽
+        self._values: List[Any] = [None] * self.max_size
+        self._order: "OrderedDict[int, None]" = OrderedDict()  # 已用槽位，按最近使用排序
+        self._generation: Optional[int] = None  # 本地缓存对应的共享代数
+
+    @property
+    def generation_key(self) -> str:
+        """Redis 中的缓存代数键"""
+        return REDIS_GENERATION_KEY + self.name
+
+    def get(self, vector: List[float]) -> Optional[Any]:
+        """查找相似度不低于阈值的缓存结果，未命中返回 None"""
+        if not self.enabled:
+            return None
+        if self.use_redis and not self._sync_generation(self._read_generation()):
+            return None
+        return self._lookup(vector)
+
+    async def aget(self, vector: List[float]) -> Optional[Any]:
+        """异步查找（参数同 get），共享代数使用异步客户端读取，不阻塞事件循环"""
+        if not self.enabled:
+            return None
+        if self.use_redis and not self._sync_generation(await self._aread_generation()):
+            return None
+        return self._lookup(vector)
+
+    def _lookup(self, vector: List[float]) -> Optional[Any]:
+        """在本地向量矩阵上查找"""
+        query = self._normalize(vector)
+        with self._lock:
+            value = None
+            if self._vectors is not None and self._order and query.shape[0] == self._vectors.shape[1]:
+                now = time.monotonic()
+                scores = self._vectors @ query
+                scores[self._expires <= now] = -1.0
+                slot = int(np.argmax(scores))
+                if scores[slot] >= self.threshold:
+                    self._order.move_to_end(slot)
+                    value = self._values[slot]
+            self._evict_expired()
+        metrics.increment(f"semantic_cache.{self.name}.{'hits' if value is not None else 'misses'}")
+        return value
+
+    def set(self, vector: List[float], value: Any) -> None:
+        """写入缓存结果"""
+        if not self.enabled:
+            return
+        query = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self._reset(query.shape[0])
+            if len(self._order) >= self.max_size:
+                slot, _ = self._order.popitem(last=False)
+            else:
+                slot = int(np.argmin(self._expires))
+            self._vectors[slot] = query
+            self._expires[slot] = time.monotonic() + self.ttl if self.ttl else np.inf
+            self._values[slot] = value
+            self._order[slot] = None
+
+    def clear(self) -> None:
+        """清空缓存（知识库内容变化时调用），共享模式下同时递增代数，使其他副本的缓存失效"""
+        with self._lock:
+            if self._vectors is not None:
+                self._reset(self._vectors.shape[1])
+        if self.use_redis:
+            try:
+                generation = get_redis().incr(self.generation_key)
+                with self._lock:
+                    self._generation = generation
+            except Exception as e:
+                tools_logger.warning(f"递增语义缓存代数失败: {e}")
+        metrics.increment(f"semantic_cache.{self.name}.invalidations")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        hits = metrics.get_counter(f"semantic_cache.{self.name}.hits")
+        misses = metrics.get_counter(f"semantic_cache.{self.name}.misses")
+        total = hits + misses
+        with self._lock:
+            size = len(self._order)
+        return {
+            "enabled": self.enabled,
+            "size": size,
+            "threshold": self.threshold,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 3) if total else 0.0
+        }
+
+    def _read_generation(self) -> Optional[int]:
+        """读取共享代数，读取失败返回 None"""
+        try:
+            return int(get_redis().get(self.generation_key) or 0)
+        except Exception as e:
+            tools_logger.warning(f"读取语义缓存代数失败: {e}")
+            return None
+
+    async def _aread_generation(self) -> Optional[int]:
+        """异步读取共享代数，读取失败返回 None"""
+        try:
+            return int(await get_async_redis().get(self.generation_key) or 0)
+        except Exception as e:
+            tools_logger.warning(f"读取语义缓存代数失败: {e}")
+            return None
+
+    def _sync_generation(self, generation: Optional[int]) -> bool:
+        """
+        对齐共享代数：代数与本地缓存不一致时清空本地缓存；代数读取失败（None）时同样清空，
+        返回 False 表示本次不使用缓存（无法确认缓存是否已失效）
+        """
+        with self._lock:
+            if generation != self._generation:
+                if self._vectors is not None:
+                    self._reset(self._vectors.shape[1])
+                self._generation = generation
+        if generation is None:
+            metrics.increment(f"semantic_cache.{self.name}.misses")
+            return False
+        return True
+
+    def _reset(self, dim: int) -> None:
+        """重新分配存储（调用方持有锁）"""
+        self._vectors = np.zeros((self.max_size, dim), dtype=np.float32)
+        self._expires[:] = 0.0
+        self._values = [None] * self.max_size
+        self._order.clear()
+
+    def _evict_expired(self) -> None:
+        """回收已过期的槽位（调用方持有锁）"""
+        now = time.monotonic()
+        for slot in [slot for slot in self._order if self._expires[slot] <= now]:
+            del self._order[slot]
+            self._expires[slot] = 0.0
+            self._values[slot] = None
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        """转为单位向量，点积即余弦相似度"""
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        return array / norm if norm else array
+
+
+# 知识库检索结果的语义缓存
+kb_semantic_cache = SemanticCache("kb")
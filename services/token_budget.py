@@ -0,0 +1,150 @@
+"""
+Mystical Oracle Token Budget - 提示词 token 预算
+统计消息 token 数，并按预算组装注入 Agent 提示词的历史消息，使预填充耗时不随对话变长而增长
+"""
+import re
+import threading
+from functools import lru_cache
+from typing import Any, List, Optional
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+from config.settings import config
+from config.logger import agent_logger
+from utils.metrics import metrics
+
+# 中日韩文字与全角符号，估算时每个字符约计 1 个 token
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+# 其余字符估算时约 4 个字符计 1 个 token
+CHARS_PER_TOKEN = 4
+# 每条消息的角色标记与分隔符开销
+MESSAGE_OVERHEAD = 4
+# 截断消息时追加的标记
+TRUNCATION_MARK = "……"
+
+
+class TokenCounter:
+    """token 计数器：安装了 tiktoken 时按其编码精确计数，否则按字符估算；计数结果按文本缓存"""
+
+    def __init__(self, encoding_name: Optional[str] = None, cache_size: Optional[int] = None):
+        budget_config = config.get_token_budget_config()
+        self.encoding_name = encoding_name or budget_config["encoding"]
+        self._encoding: Any = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.count = lru_cache(maxsize=cache_size or budget_config["cache_size"])(self._count)
+
+    @property
+    def encoding(self) -> Any:
+        """tiktoken 编码（只加载一次），未安装或加载失败时为 None"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._encoding = self._load_encoding()
+                    self._loaded = True
+        return self._encoding
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """截断文本使其不超过 max_tokens 个 token（保留开头）"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        max_tokens = max(0, max_tokens - self.count(TRUNCATION_MARK))
+        encoding = self.encoding
+        if encoding is not None:
+            return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]) + TRUNCATION_MARK
+        # 估算模式下二分查找可保留的字符数
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._estimate(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low] + TRUNCATION_MARK
+
+    def _count(self, text: str) -> int:
+        """计算 token 数（经 lru_cache 包装为 count）"""
+        encoding = self.encoding
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return self._estimate(text)
+
+    @staticmethod
+    def _estimate(text: str) -> int:
+        """按字符估算 token 数"""
+        cjk = len(CJK_PATTERN.findall(text))
+        return cjk + -(-(len(text) - cjk) // CHARS_PER_TOKEN)
+
+    def _load_encoding(self) -> Any:
+        """加载 tiktoken 编码（可选依赖）"""
+        try:
+            import tiktoken
+            return tiktoken.get_encoding(self.encoding_name)
+        except ImportError:
+            agent_logger.info("未安装 tiktoken，按字符估算 token 数")
+        except Exception as e:
+            agent_logger.warning(f"加载 tiktoken 编码 {self.encoding_name} 失败，按字符估算 token 数: {e}")
+        return None
+
+
+class HistoryAssembler:
+    """历史消息组装器：保留开头的摘要，再从最新消息往前放入，直到用完 token 预算"""
+
+    def __init__(self, budget: Optional[int] = None, counter: Optional[TokenCounter] = None):
+        self.budget = max(1, budget or config.get_token_budget_config()["history_budget"])
+        self.counter = counter or token_counter
+
+    def message_tokens(self, message: BaseMessage) -> int:
+        """单条消息的 token 数"""
+        return self.counter.count(self._content(message)) + MESSAGE_OVERHEAD
+
+    def assemble(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        按预算组装历史消息
+
+        - 开头的摘要（系统消息）始终保留，最多占用一半预算
+        - 其余消息从新到旧放入，放不下的更早消息不进入本轮提示词（仍保留在聊天记录中，稍后折叠进摘要）
+        - 最新一条消息单独就超出预算时截断其内容
+        """
+        lead: List[BaseMessage] = []
+        if messages and isinstance(messages[0], SystemMessage):
+            lead, messages = [self._fit(messages[0], self.budget // 2)], messages[1:]
+        remaining = self.budget - sum(self.message_tokens(message) for message in lead)
+
+        kept: List[BaseMessage] = []
+        for message in reversed(messages):
+            tokens = self.message_tokens(message)
+            if tokens > remaining:
+                if not kept:
+                    message = self._fit(message, remaining)
+                    kept.append(message)
+                    remaining -= self.message_tokens(message)
+                break
+            kept.append(message)
+            remaining -= tokens
+
+        trimmed = len(messages) - len(kept)
+        if trimmed:
+            metrics.increment("history.trimmed_messages", trimmed)
+        metrics.values("history.tokens").record(self.budget - remaining)
+        return lead + kept[::-1]
+
+    def _fit(self, message: BaseMessage, max_tokens: int) -> BaseMessage:
+        """截断消息内容使其不超过 max_tokens（含消息开销）"""
+        if self.message_tokens(message) <= max_tokens:
+            return message
+        metrics.increment("history.truncated_messages")
+        content = self.counter.truncate(self._content(message), max_tokens - MESSAGE_OVERHEAD)
+        return message.model_copy(update={"content": content})
+
+    @staticmethod
+    def _content(message: BaseMessage) -> str:
+        """消息文本内容"""
+        return message.content if isinstance(message.content, str) else str(message.content)
+
+
+# 全局 token 计数器与历史消息组装器
+token_counter = TokenCounter()
+history_assembler = HistoryAssembler()
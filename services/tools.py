@@ -1,28 +1,32 @@
 """
 Mystical Oracle Tools - 神秘预言师工具集
-使用配置管理和更好的错误处理
+使用配置管理和更好的错误处理，每个工具同时提供同步与异步实现
 """
-import requests
-from typing import Optional
+import asyncio
+import re
+from typing import Any, Dict, Optional, Tuple
 
-from langchain.agents import tool
 from langchain_community.utilities import SerpAPIWrapper
 from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from langchain_core.runnables import RunnableLambda
-from langchain_ollama import OllamaEmbeddings, ChatOllama, OllamaLLM
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
+from langchain_core.tools import StructuredTool
+from langchain_ollama import ChatOllama, OllamaLLM
 
 from models.user import User
+from services.http_client import yuanfenju_client
+from services.knowledge_base import knowledge_base
+from services.bazi_parser import bazi_parser
+from services.result_cache import bazi_cache, dream_cache
+from services.semantic_cache import kb_semantic_cache
 from utils.helpers import delete_think
+from utils.metrics import metrics
 from config.settings import config
 from config.logger import tools_logger
 from prompts.system_prompts import SystemPrompts
 
 
-@tool
-def search(query: str) -> str:
+def _search(query: str) -> str:
     """只有需要了解实时信息或不知道的事情的时候才会使用这个工具。"""
     try:
         serp = SerpAPIWrapper()
@@ -34,152 +38,311 @@ def search(query: str) -> str:
         return "搜索服务暂时不可用，请稍后再试。"
 
 
-@tool
-def get_info_from_local_db(query: str) -> str:
+async def _asearch(query: str) -> str:
+    """异步实时搜索"""
+    try:
+        serp = SerpAPIWrapper()
+        result = await serp.arun(query)
+        tools_logger.info(f"实时搜索结果: {result}")
+        return result
+    except Exception as e:
+        tools_logger.error(f"搜索工具出错: {e}")
+        return "搜索服务暂时不可用，请稍后再试。"
+
+
+def _format_docs(docs: list) -> str:
+    """格式化文档为字符串"""
+    if docs:
+        return "\n\n".join([
+            f"来源: {doc.metadata.get('source', '未知')}\n内容: {doc.page_content}"
+            for doc in docs
+        ])
+    return "未找到相关信息"
+
+
+def _get_info_from_local_db(query: str) -> str:
     """
     只有回答与2025年运势相关的问题的时候，会使用这个工具
     只有回答与生肖运势相关的问题的时候，会使用这个工具
     只有回答与星座(比如水瓶座,等等其他星座)相关的问题的时候，会使用这个工具
     """
     try:
-        # 获取 Qdrant 配置
-        qdrant_config = config.get_qdrant_config()
-        embedding_config = config.get_embedding_config()
-        
-        # 连接本地 Qdrant 数据库
-        qdrant_client = QdrantClient(path=qdrant_config["path"])
-        vectorstore = QdrantVectorStore(
-            client=qdrant_client,
-            collection_name=qdrant_config["collection_name"],
-            embedding=OllamaEmbeddings(**embedding_config)
-        )
-        
-        # 检索相关文档
-        retriever = vectorstore.as_retriever(search_type="mmr")
-        docs = retriever.get_relevant_documents(query)
-        
-        # 格式化文档为字符串
-        if docs:
-            formatted_docs = "\n\n".join([
-                f"来源: {doc.metadata.get('source', '未知')}\n内容: {doc.page_content}"
-                for doc in docs
-            ])
-            return formatted_docs
-        else:
-            return "未找到相关信息"
-            
+        # 相近问题直接复用语义缓存中的检索结果
+        embedding = knowledge_base.embed_query(query)
+        result = kb_semantic_cache.get(embedding)
+        if result is None:
+            result = _format_docs(knowledge_base.search(embedding))
+            kb_semantic_cache.set(embedding, result)
+        return result
     except Exception as e:
         tools_logger.error(f"本地知识库查询出错: {e}")
         return "知识库暂时不可用，请稍后再试。"
 
 
-@tool
-def bazi_cesuan(query: str) -> str:
+async def _aget_info_from_local_db(query: str) -> str:
+    """异步查询本地知识库"""
+    try:
+        embedding = await knowledge_base.aembed_query(query)
+        result = await kb_semantic_cache.aget(embedding)
+        if result is None:
+            docs = await asyncio.to_thread(knowledge_base.search, embedding)
+            result = _format_docs(docs)
+            kb_semantic_cache.set(embedding, result)
+        return result
+    except Exception as e:
+        tools_logger.error(f"本地知识库查询出错: {e}")
+        return "知识库暂时不可用，请稍后再试。"
+
+
+def _bazi_param_chain():
+    """构建八字参数提取链"""
+    # 设置解析器
+    parser = JsonOutputParser(pydantic_object=User)
+
+    # 使用 partial 方法安全地预填充静态变量
+    prompt = ChatPromptTemplate.from_template(SystemPrompts.BAZI_PARAM_EXTRACTION_PROMPT).partial(
+        api_key=config.YUANFENJU_API_KEY,
+        format_instructions=parser.get_format_instructions()
+    )
+
+    # 创建模型
+    model_config = config.get_model_config()
+    model = ChatOllama(**model_config, format="json")
+
+    return prompt | model | parser
+
+
+def _parse_bazi_params(query: str) -> Optional[Dict[str, Any]]:
+    """规则解析八字参数，无法完整解析时返回 None"""
+    with metrics.latency("bazi_params.rule").time():
+        user = bazi_parser.parse(query)
+    if user is None:
+        metrics.increment("bazi_params.llm_fallback")
+        return None
+    metrics.increment("bazi_params.rule_hits")
+    return user.model_dump()
+
+
+def _extract_bazi_params(query: str) -> Dict[str, Any]:
+    """提取八字参数：优先规则解析，失败时回退大模型"""
+    data = _parse_bazi_params(query)
+    if data is None:
+        with metrics.latency("bazi_params.llm").time():
+            data = _bazi_param_chain().invoke({"query": query})
+    return data
+
+
+async def _aextract_bazi_params(query: str) -> Dict[str, Any]:
+    """异步提取八字参数：优先规则解析，失败时回退大模型"""
+    data = _parse_bazi_params(query)
+    if data is None:
+        with metrics.latency("bazi_params.llm").time():
+            data = await _bazi_param_chain().ainvoke({"query": query})
+    return data
+
+
+def _bazi_cache_key(data: Dict[str, Any]) -> Optional[str]:
+    """根据校验后的用户信息生成缓存键，参数无效时返回 None"""
+    try:
+        user = User(**{"api_key": config.YUANFENJU_API_KEY, **data})
+    except Exception:
+        return None
+
+    fields = user.model_dump(exclude={"api_key"})
+    fields["name"] = str(fields["name"]).strip()
+    return "|".join(f"{key}={fields[key]}" for key in sorted(fields))
+
+
+def _parse_bazi_response(result: Any) -> Tuple[str, bool]:
+    """解析八字接口返回（兼容 requests 与 httpx 的响应对象），返回 (回复文本, 是否成功)"""
+    if result.status_code != 200:
+        return "技术错误，请告诉用户稍后再试。", False
+
+    tools_logger.debug(f'八字查询返回数据: {result.json()}')
+    try:
+        data_json = result.json()
+        return f"八字排盘完成：{data_json['data']['bazi_info']['bazi']}", True
+    except Exception as e:
+        tools_logger.error(f"解析八字结果失败: {e}")
+        return "八字查询失败，可能是你忘记询问用户姓名或者出生年月日时了。", False
+
+
+def _bazi_cesuan(query: str) -> str:
     """
     只有做八字排查的时候才会使用这个工具，需要输入用户姓名和出生年月时，如果缺少用户姓名和出生年月时则不可用
     """
     try:
-        api_key = config.YUANFENJU_API_KEY
-        url = config.YUANFENJU_ENDPOINTS["bazi_cesuan"]
-        
-        # 设置解析器
-        parser = JsonOutputParser(pydantic_object=User)
-        
-        # 直接使用统一管理的模板
-        prompt_template = SystemPrompts.BAZI_PARAM_EXTRACTION_PROMPT
-        
-        # 使用 partial 方法安全地预填充静态变量
-        prompt = ChatPromptTemplate.from_template(prompt_template).partial(
-            api_key=api_key,
-            format_instructions=parser.get_format_instructions()
-        )
-        
-        # 创建模型
-        model_config = config.get_model_config()
-        model = ChatOllama(**model_config, format="json")
-        
-        # 构建处理链
-        chain = prompt | model | parser
-        data = chain.invoke({"query": query})
-        
+        data = _extract_bazi_params(query)
+        tools_logger.debug(f'八字查询请求参数: {data}')
+
+        # 同一用户信息的排盘结果固定，优先读取缓存
+        cache_key = _bazi_cache_key(data)
+        if cache_key:
+            cached = bazi_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        # 调用 API
+        result = yuanfenju_client.post(config.YUANFENJU_ENDPOINTS["bazi_cesuan"], "bazi_cesuan", data=data)
+        text, ok = _parse_bazi_response(result)
+        if ok and cache_key:
+            bazi_cache.set(cache_key, text)
+        return text
+
+    except Exception as e:
+        tools_logger.error(f"八字查询工具出错: {e}")
+        return "八字查询服务暂时不可用，请稍后再试。"
+
+
+async def _abazi_cesuan(query: str) -> str:
+    """异步八字测算"""
+    try:
+        data = await _aextract_bazi_params(query)
         tools_logger.debug(f'八字查询请求参数: {data}')
-        
+
+        # 同一用户信息的排盘结果固定，优先读取缓存
+        cache_key = _bazi_cache_key(data)
+        if cache_key:
+            cached = await bazi_cache.aget(cache_key)
+            if cached is not None:
+                return cached
+
         # 调用 API
-        result = requests.post(url, data=data)
-        if result.status_code == 200:
-            tools_logger.debug(f'八字查询返回数据: {result.json()}')
-            try:
-                data_json = result.json()
-                return f"八字排盘完成：{data_json['data']['bazi_info']['bazi']}"
-            except Exception as e:
-                tools_logger.error(f"解析八字结果失败: {e}")
-                return "八字查询失败，可能是你忘记询问用户姓名或者出生年月日时了。"
-        else:
-            return "技术错误，请告诉用户稍后再试。"
-            
+        result = await yuanfenju_client.apost(config.YUANFENJU_ENDPOINTS["bazi_cesuan"], "bazi_cesuan", data=data)
+        text, ok = _parse_bazi_response(result)
+        if ok and cache_key:
+            await bazi_cache.aset(cache_key, text)
+        return text
+
     except Exception as e:
         tools_logger.error(f"八字查询工具出错: {e}")
         return "八字查询服务暂时不可用，请稍后再试。"
 
 
-@tool
-def yaoyigua() -> str:
+def _parse_data_response(result: Any, label: str, default: str) -> Tuple[Any, bool]:
+    """解析缘分居接口中 data 字段（兼容 requests 与 httpx 的响应对象），返回 (结果, 是否成功)"""
+    if result.status_code != 200:
+        return "技术错误，请告诉用户稍后再试。", False
+
+    data_json = result.json()
+    tools_logger.debug(f"{label}返回数据: {data_json}")
+    if "data" not in data_json:
+        return default, False
+    return data_json["data"], True
+
+
+def _yaoyigua() -> str:
     """只要用户想要摇卦占卜抽签的时候才会使用这个工具"""
     try:
-        api_key = config.YUANFENJU_API_KEY
-        url = config.YUANFENJU_ENDPOINTS["yaoyigua"]
-        
-        result = requests.post(url, data={'api_key': api_key})
-        if result.status_code == 200:
-            tools_logger.debug(f"摇卦返回数据: {result.json()}")
-            data_json = result.json()
-            return data_json.get("data", "摇卦失败")
-        else:
-            return "技术错误，请告诉用户稍后再试。"
-            
+        result = yuanfenju_client.post(
+            config.YUANFENJU_ENDPOINTS["yaoyigua"],
+            "yaoyigua",
+            data={'api_key': config.YUANFENJU_API_KEY}
+        )
+        return _parse_data_response(result, "摇卦", "摇卦失败")[0]
+
+    except Exception as e:
+        tools_logger.error(f"摇卦工具出错: {e}")
+        return "摇卦服务暂时不可用，请稍后再试。"
+
+
+async def _ayaoyigua() -> str:
+    """异步摇卦"""
+    try:
+        result = await yuanfenju_client.apost(
+            config.YUANFENJU_ENDPOINTS["yaoyigua"],
+            "yaoyigua",
+            data={'api_key': config.YUANFENJU_API_KEY}
+        )
+        return _parse_data_response(result, "摇卦", "摇卦失败")[0]
+
     except Exception as e:
         tools_logger.error(f"摇卦工具出错: {e}")
         return "摇卦服务暂时不可用，请稍后再试。"
 
 
-@tool
-def jiemeng(query: str) -> str:
+def _dream_keyword_chain():
+    """构建解梦关键词提取链"""
+    # 创建关键词提取模型
+    model_config = config.get_model_config()
+    llm = OllamaLLM(**model_config)
+
+    prompt = PromptTemplate.from_template(SystemPrompts.DREAM_KEYWORD_EXTRACTION_PROMPT)
+    return prompt | llm | StrOutputParser() | RunnableLambda(delete_think)
+
+
+def _normalize_dream_keyword(keyword: str) -> str:
+    """规范化梦境关键词（仅用作缓存键）：统一分隔符，去除空白与重复词"""
+    words = [word.strip() for word in re.split(r"[,，、;；\s]+", str(keyword)) if word.strip()]
+    return ",".join(dict.fromkeys(words))
+
+
+def _jiemeng_payload(keyword: str) -> Dict[str, Any]:
+    """构建解梦接口请求参数"""
+    tools_logger.debug(f"提取的关键词: {keyword}")
+    return {
+        "api_key": config.YUANFENJU_API_KEY,
+        "title_zhougong": keyword
+    }
+
+
+def _jiemeng(query: str) -> str:
     """只有用户想要解梦的时候才会使用这个工具，需要输入用户梦境的内容，如果缺少用户梦境的内容则不可用。"""
     try:
-        api_key = config.YUANFENJU_API_KEY
-        url = config.YUANFENJU_ENDPOINTS["jiemeng"]
-        
-        # 创建关键词提取模型
-        model_config = config.get_model_config()
-        llm = OllamaLLM(**model_config)
-        
-        # 直接使用统一管理的模板
-        dream_prompt_template = SystemPrompts.DREAM_KEYWORD_EXTRACTION_PROMPT
-        
-        # 构建关键词提取链
-        prompt = PromptTemplate.from_template(dream_prompt_template)
-        chain = prompt | llm | StrOutputParser() | RunnableLambda(delete_think)
-        
-        # 提取关键词
-        keyword = chain.invoke({"query": query})
-        tools_logger.debug(f"提取的关键词: {keyword}")
-        
+        # 提取关键词，规范化后的关键词只用作缓存键，接口仍使用原始关键词
+        keyword = _dream_keyword_chain().invoke({"query": query})
+        cache_key = _normalize_dream_keyword(keyword)
+
+        # 相同关键词的解梦结果固定，优先读取缓存
+        cached = dream_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         # 调用解梦 API
-        result = requests.post(url, data={
-            "api_key": api_key, 
-            "title_zhougong": keyword
-        })
-        
-        if result.status_code == 200:
-            tools_logger.debug(f"解梦返回数据: {result.json()}")
-            data_json = result.json()
-            return data_json.get("data", "解梦失败")
-        else:
-            return "技术错误，请告诉用户稍后再试。"
-            
+        result = yuanfenju_client.post(config.YUANFENJU_ENDPOINTS["jiemeng"], "jiemeng", data=_jiemeng_payload(keyword))
+        data, ok = _parse_data_response(result, "解梦", "解梦失败")
+        if ok:
+            dream_cache.set(cache_key, data)
+        return data
+
     except Exception as e:
         tools_logger.error(f"解梦工具出错: {e}")
         return "解梦服务暂时不可用，请稍后再试。"
 
 
+async def _ajiemeng(query: str) -> str:
+    """异步解梦"""
+    try:
+        # 提取关键词，规范化后的关键词只用作缓存键，接口仍使用原始关键词
+        keyword = await _dream_keyword_chain().ainvoke({"query": query})
+        cache_key = _normalize_dream_keyword(keyword)
+
+        # 相同关键词的解梦结果固定，优先读取缓存
+        cached = await dream_cache.aget(cache_key)
+        if cached is not None:
+            return cached
+
+        # 调用解梦 API
+        result = await yuanfenju_client.apost(
+            config.YUANFENJU_ENDPOINTS["jiemeng"],
+            "jiemeng",
+            data=_jiemeng_payload(keyword)
+        )
+        data, ok = _parse_data_response(result, "解梦", "解梦失败")
+        if ok:
+            await dream_cache.aset(cache_key, data)
+        return data
+
+    except Exception as e:
+        tools_logger.error(f"解梦工具出错: {e}")
+        return "解梦服务暂时不可用，请稍后再试。"
+
 
+# 对外暴露的工具：同步调用走 func，异步调用（ainvoke）走 coroutine
+search = StructuredTool.from_function(func=_search, coroutine=_asearch, name="search")
+get_info_from_local_db = StructuredTool.from_function(
+    func=_get_info_from_local_db, coroutine=_aget_info_from_local_db, name="get_info_from_local_db"
+)
+bazi_cesuan = StructuredTool.from_function(func=_bazi_cesuan, coroutine=_abazi_cesuan, name="bazi_cesuan")
+yaoyigua = StructuredTool.from_function(func=_yaoyigua, coroutine=_ayaoyigua, name="yaoyigua")
+jiemeng = StructuredTool.from_function(func=_jiemeng, coroutine=_ajiemeng, name="jiemeng")
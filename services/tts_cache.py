@@ -0,0 +1,68 @@
+"""
+Mystical Oracle TTS Cache - 语音合成结果缓存
+按 (文本, 发音人, 语音风格, 输出格式) 的哈希存放音频，重复的回复（口头禅、兜底提示、卦辞等）直接复用已合成的音频
+"""
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from config.settings import config
+from services.audio_store import audio_store
+from utils.metrics import metrics
+
+
+class TTSCache:
+    """内容寻址的音频缓存：音频以内容哈希存入音频仓库，音频 ID 以符号链接指向缓存文件；容量与过期由音频仓库统一清理"""
+
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = config.TTS_CACHE_ENABLED if enabled is None else enabled
+
+    @staticmethod
+    def key(text: str, voice_name: str, voice_style: str, output_format: str) -> str:
+        """计算缓存键"""
+        raw = "\x1f".join([text.strip(), voice_name or "", voice_style or "", output_format or ""])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """查找缓存音频，命中时刷新其最近访问时间，未命中返回 None"""
+        if not self.enabled:
+            return None
+        path = audio_store.blob_path(key)
+        hit = path.exists()
+        if hit:
+            audio_store.touch(path)
+        metrics.increment("tts_cache.hits" if hit else "tts_cache.misses")
+        return path if hit else None
+
+    def store(self, key: str, source: Path) -> Path:
+        """将合成好的音频移入缓存"""
+        path = audio_store.blob_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, path)
+        audio_store.record_write(path.stat().st_size)
+        return path
+
+    def link(self, audio_path: Path, blob: Path) -> None:
+        """让音频 ID 对应的文件指向缓存音频（先建临时链接再原子替换）"""
+        target = os.path.relpath(blob, audio_path.parent)
+        tmp_path = audio_path.with_name(f"{audio_path.name}.link")
+        tmp_path.unlink(missing_ok=True)
+        os.symlink(target, tmp_path)
+        os.replace(tmp_path, audio_path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        hits = metrics.get_counter("tts_cache.hits")
+        misses = metrics.get_counter("tts_cache.misses")
+        total = hits + misses
+        return {
+            "enabled": self.enabled,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 3) if total else 0.0
+        }
+
+
+# 全局语音合成缓存
+tts_cache = TTSCache()
@@ -3,14 +3,124 @@ Mystical Oracle TTS Service - 文字转语音服务模块
 使用微软 Azure TTS API 进行语音合成
 """
 import asyncio
-import requests
 import os
-from typing import Optional
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional
 from pathlib import Path
+from xml.sax.saxutils import escape
 
 from config.settings import config
 from config.logger import tts_logger
 from prompts.mood_prompts import MoodPrompts
+from services.http_client import HttpClient
+from services.job_queue import JOB_QUEUED, JOB_RUNNING, Job, QueueFullError, job_queue
+from services.audio_store import audio_store
+from services.tts_cache import tts_cache
+from utils.helpers import split_sentences
+from utils.metrics import metrics
+
+# 计算合成吞吐(jobs/sec)的时间窗口(秒)
+THROUGHPUT_WINDOW = 60
+# 音频流读取块大小与轮询间隔(秒)
+STREAM_BLOCK_SIZE = 64 * 1024
+STREAM_POLL_INTERVAL = 0.1
+# 音频流等待期间查询合成任务状态的间隔(秒)，平时只轮询文件
+STREAM_STATE_INTERVAL = 1.0
+
+
+class TTSEngine:
+    """语音合成引擎：常驻事件循环线程，所有合成请求共享连接池并受并发上限约束"""
+
+    def __init__(self, max_concurrency: Optional[int] = None, timeout: Optional[float] = None):
+        tts_config = config.get_tts_engine_config()
+        self.max_concurrency = max(1, max_concurrency or tts_config["max_concurrency"])
+        self.timeout = timeout or tts_config["timeout"]
+        # 异步客户端只在引擎循环中使用
+        self.http = HttpClient("tts", timeout=self.timeout, pool_size=self.max_concurrency)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = deque(maxlen=10000)  # 最近完成时间，用于计算吞吐
+
+    def start(self) -> None:
+        """启动引擎线程（重复调用无副作用）"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="tts-engine", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def submit(self, coro: Awaitable[Any]) -> Future:
+        """将协程提交到引擎循环执行"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def arun(self, coro: Awaitable[Any]) -> Any:
+        """在引擎循环中执行协程，当前事件循环异步等待结果"""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    async def post(self, url: str, **kwargs: Any):
+        """发送合成请求（需在引擎循环中调用），超过并发上限时排队等待"""
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                return await self.http.apost(url, "synthesize", **kwargs)
+            finally:
+                self._in_flight -= 1
+
+    def record_job(self, ok: bool) -> None:
+        """记录一次合成结果"""
+        metrics.increment("tts.jobs_completed" if ok else "tts.jobs_failed")
+        if ok:
+            self._completed.append(time.monotonic())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取引擎统计，吞吐按最近时间窗口计算"""
+        now = time.monotonic()
+        recent = [t for t in list(self._completed) if now - t <= THROUGHPUT_WINDOW]
+        span = now - recent[0] if recent else 0.0
+        return {
+            "running": self._thread is not None,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "completed": metrics.get_counter("tts.jobs_completed"),
+            "failed": metrics.get_counter("tts.jobs_failed"),
+            "jobs_per_sec": round(len(recent) / max(span, 1.0), 2) if recent else 0.0
+        }
+
+    def close(self, timeout: float = 5.0) -> None:
+        """关闭连接池并停止引擎线程"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.http.aclose(), loop).result(timeout)
+        except Exception as e:
+            tts_logger.warning(f"关闭 TTS 连接池失败: {e}")
+        self.http.close()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+    def _run_loop(self, ready: threading.Event) -> None:
+        """引擎线程：创建并常驻运行事件循环"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
 
 
 class TTSService:
@@ -22,67 +132,198 @@ class TTSService:
         self.voice_name = config.TTS_VOICE_NAME
         self.output_format = config.TTS_OUTPUT_FORMAT
         
-        # 确保音频目录存在
-        self.audio_dir = Path(config.AUDIO_OUTPUT_DIR)
-        self.audio_dir.mkdir(parents=True, exist_ok=True)
+        # 音频文件由音频仓库统一分片存放与清理
+        self.audio_dir = audio_store.root
+        
+        # 所有合成请求都在引擎的常驻事件循环中执行
+        self.engine = TTSEngine()
+        
+        # 分句合成与流式读取配置
+        tts_config = config.get_tts_engine_config()
+        self.sentence_max_chars = tts_config["sentence_max_chars"]
+        self.sentence_min_chars = tts_config["sentence_min_chars"]
+        self.stream_timeout = tts_config["stream_timeout"]
+        
+        # 语音合成任务由后台任务队列执行
+        job_queue.register("tts.synthesize", self._handle_synthesis)
     
-    def synthesize_speech_background(self, text: str, uid: str, mood: str = "default") -> None:
-        """后台语音合成任务"""
+    def submit_synthesis(self, text: str, uid: str, mood: str = "default") -> Optional[Job]:
+        """提交语音合成任务，任务 ID 即音频 ID；队列已满时放弃合成"""
         try:
-            asyncio.run(self._synthesize_speech(text, uid, mood))
-        except Exception as e:
-            tts_logger.error(f"语音合成失败: {e}")
+            return job_queue.submit("tts.synthesize", {"text": text, "uid": uid, "mood": mood}, job_id=uid)
+        except QueueFullError:
+            tts_logger.warning(f"任务队列已满，跳过语音合成: {uid}")
+            return None
+    
+    async def asubmit_synthesis(self, text: str, uid: str, mood: str = "default") -> Optional[Job]:
+        """异步提交语音合成任务（同 submit_synthesis），不阻塞事件循环"""
+        try:
+            return await job_queue.asubmit("tts.synthesize", {"text": text, "uid": uid, "mood": mood}, job_id=uid)
+        except QueueFullError:
+            tts_logger.warning(f"任务队列已满，跳过语音合成: {uid}")
+            return None
+    
+    async def _handle_synthesis(self, job: Job) -> dict:
+        """语音合成任务处理函数，失败时抛出异常以触发重试"""
+        payload = job.payload
+        audio_path = await self.asynthesize(payload["text"], payload["uid"], payload["mood"])
+        if audio_path is None:
+            raise RuntimeError("语音合成失败")
+        return {"audio_path": audio_path}
+    
+    async def asynthesize(self, text: str, uid: str, mood: str = "default") -> Optional[str]:
+        """异步语音合成，可在任意事件循环中等待，返回音频路径，失败返回 None"""
+        return await self.engine.arun(self._synthesize_speech(text, uid, mood))
+    
+    def close(self) -> None:
+        """关闭语音合成引擎"""
+        self.engine.close()
     
     async def _synthesize_speech(self, text: str, uid: str, mood: str = "default") -> Optional[str]:
-        """异步语音合成"""
+        """
+        异步语音合成（在引擎循环中执行）
+        相同文本、发音人、风格与格式的音频直接复用缓存；否则按句切分后并行合成，
+        按顺序追加写入 .part 文件，全部完成后移入缓存（或重命名为正式音频文件）
+        """
+        part_path = self.get_partial_file_path(uid)
+        audio_path = self.get_audio_file_path(uid)
+        tasks = []
         try:
             tts_logger.info(f"开始语音合成: {text[:50]}...")
             tts_logger.debug(f"用户ID: {uid}, 情绪: {mood}")
             
             # 获取语音风格
             voice_style = MoodPrompts.get_voice_style(mood)
+            audio_path.parent.mkdir(parents=True, exist_ok=True)
             
-            # 构建请求头
-            headers = {
-                "Ocp-Apim-Subscription-Key": self.api_key,
-                "Content-Type": "application/ssml+xml",
-                "X-Microsoft-OutputFormat": self.output_format,
-                "User-Agent": "King's Fortune Teller Bot"
-            }
+            # 命中缓存时无需调用 TTS 接口
+            cache_key = tts_cache.key(text, self.voice_name, voice_style, self.output_format)
+            cached = tts_cache.lookup(cache_key)
+            if cached is not None:
+                tts_cache.link(audio_path, cached)
+                tts_logger.info(f"语音缓存命中，音频已保存为: {audio_path}")
+                return str(audio_path)
             
-            # 构造 SSML 请求体
-            ssml = self._build_ssml(text, voice_style)
+            # 分句并行合成（并发受引擎上限约束），按句序写入以便边合成边播放
+            sentences = split_sentences(text, self.sentence_max_chars, self.sentence_min_chars)
+            if not sentences:
+                raise ValueError("没有可合成的文本")
+            tasks = [asyncio.create_task(self._synthesize_segment(sentence, voice_style)) for sentence in sentences]
             
-            # 发送请求
-            response = requests.post(
-                self.endpoint,
-                headers=headers,
-                data=ssml.encode("utf-8"),
-                timeout=30
-            )
+            start = time.perf_counter()
+            with open(part_path, "wb") as f:
+                for index, task in enumerate(tasks):
+                    f.write(await task)
+                    f.flush()
+                    if index == 0:
+                        metrics.latency("tts.first_segment").record(time.perf_counter() - start)
             
-            if response.status_code == 200:
-                # 保存音频文件到统一目录
-                audio_path = self.audio_dir / f"{uid}.mp3"
-                with open(audio_path, "wb") as f:
-                    f.write(response.content)
-                
-                tts_logger.info(f"语音合成成功，音频已保存为: {audio_path}")
-                return str(audio_path)
+            # 保存音频文件到统一目录（启用缓存时存入缓存并以音频 ID 链接）
+            if tts_cache.enabled:
+                tts_cache.link(audio_path, tts_cache.store(cache_key, part_path))
             else:
-                tts_logger.error(f"TTS API 请求失败: {response.status_code}")
-                tts_logger.error(f"错误信息: {response.text}")
-                return None
+                os.replace(part_path, audio_path)
+                audio_store.record_write(audio_path.stat().st_size)
+            
+            tts_logger.info(f"语音合成成功（{len(sentences)} 句），音频已保存为: {audio_path}")
+            self.engine.record_job(ok=True)
+            return str(audio_path)
                 
         except Exception as e:
+            for task in tasks:
+                task.cancel()
+            part_path.unlink(missing_ok=True)
             tts_logger.error(f"语音合成过程中出现错误: {e}")
+            self.engine.record_job(ok=False)
             return None
     
+    async def _synthesize_segment(self, text: str, voice_style: str) -> bytes:
+        """合成单句音频，请求失败时抛出异常"""
+        # 构建请求头
+        headers = {
+            "Ocp-Apim-Subscription-Key": self.api_key,
+            "Content-Type": "application/ssml+xml",
+            "X-Microsoft-OutputFormat": self.output_format,
+            "User-Agent": "King's Fortune Teller Bot"
+        }
+        
+        # 构造 SSML 请求体
+        ssml = self._build_ssml(text, voice_style)
+        
+        # 发送请求（共享连接池，受并发上限约束）
+        response = await self.engine.post(
+            self.endpoint,
+            headers=headers,
+            content=ssml.encode("utf-8")
+        )
+        if response.status_code != 200:
+            tts_logger.error(f"错误信息: {response.text}")
+            raise RuntimeError(f"TTS API 请求失败: {response.status_code}")
+        return response.content
+    
+    async def stream_audio(self, uid: str) -> AsyncIterator[bytes]:
+        """
+        边合成边读取音频：跟随 .part 文件增长输出新写入的数据，合成完成（文件重命名）后读完剩余数据结束
+        合成失败、任务取消或等待超时时提前结束；等待期间只轮询文件，任务状态每 STREAM_STATE_INTERVAL 秒查询一次
+        """
+        audio_path = self.get_audio_file_path(uid)
+        part_path = self.get_partial_file_path(uid)
+        deadline = time.monotonic() + self.stream_timeout
+        checked_at = time.monotonic()  # 调用方打开流前已确认过任务状态
+        
+        async def synthesis_stopped() -> bool:
+            """距上次查询已满间隔且任务已不在排队或执行中"""
+            nonlocal checked_at
+            if time.monotonic() - checked_at < STREAM_STATE_INTERVAL:
+                return False
+            checked_at = time.monotonic()
+            return not await self.ais_synthesis_pending(uid)
+        
+        f = None
+        try:
+            while time.monotonic() < deadline:
+                if f is None:
+                    # 优先打开进行中的 .part 文件；合成已完成则直接读取正式文件
+                    for path in (part_path, audio_path):
+                        try:
+                            f = open(path, "rb")
+                            break
+                        except FileNotFoundError:
+                            continue
+                    if f is None:
+                        if await synthesis_stopped():
+                            return
+                        await asyncio.sleep(STREAM_POLL_INTERVAL)
+                        continue
+                
+                data = f.read(STREAM_BLOCK_SIZE)
+                if data:
+                    yield data
+                    continue
+                # 读到末尾：.part 已被重命名说明写入完毕，经同一文件句柄读完剩余数据
+                if not part_path.exists():
+                    rest = f.read()
+                    if rest:
+                        yield rest
+                    return
+                if not audio_path.exists() and await synthesis_stopped():
+                    return
+                await asyncio.sleep(STREAM_POLL_INTERVAL)
+            tts_logger.warning(f"音频流等待超时: {uid}")
+        finally:
+            if f is not None:
+                f.close()
+    
+    async def ais_synthesis_pending(self, uid: str) -> bool:
+        """异步查询合成任务是否仍在排队或执行中，不阻塞事件循环"""
+        job = await job_queue.aget(uid)
+        return job is not None and job.status in (JOB_QUEUED, JOB_RUNNING)
+    
     def _build_ssml(self, text: str, voice_style: str) -> str:
         """构建 SSML 格式的语音合成请求体"""
         return f"""<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xmlns:mstts="https://www.w3.org/2001/mstts" xml:lang='zh-CN'>
             <voice name='{self.voice_name}'>
-                <mstts:express-as style="{voice_style}" role="SeniorMale">{text}</mstts:express-as>
+                <mstts:express-as style="{voice_style}" role="SeniorMale">{escape(text)}</mstts:express-as>
             </voice>
         </speak>"""
     
@@ -92,7 +333,25 @@ class TTSService:
     
     def get_audio_file_path(self, uid: str) -> Path:
         """获取音频文件路径"""
-        return self.audio_dir / f"{uid}.mp3"
+        return audio_store.audio_path(uid)
+    
+    def get_audio_etag(self, uid: str) -> Optional[str]:
+        """
+        获取音频的强 ETag：缓存音频取内容哈希，未经缓存的音频取修改时间与大小（合成完成后文件不再变化）
+        音频不存在时返回 None
+        """
+        audio_path = self.get_audio_file_path(uid)
+        try:
+            stat = audio_path.stat()
+        except FileNotFoundError:
+            return None
+        if audio_path.is_symlink():
+            return Path(os.readlink(audio_path)).stem
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    
+    def get_partial_file_path(self, uid: str) -> Path:
+        """获取合成中的音频文件路径"""
+        return audio_store.partial_path(uid)
 
 
 # 全局 TTS 服务实例
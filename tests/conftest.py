@@ -0,0 +1,27 @@
+"""
+测试环境：以 .env.example 为默认配置，数据目录指向临时目录，任务队列使用本地模式
+需在导入 config.settings 之前设置环境变量
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_data_dir = tempfile.mkdtemp(prefix="mystical-oracle-tests-")
+os.environ.update({
+    "AUDIO_OUTPUT_DIR": os.path.join(_data_dir, "audio"),
+    "LOG_DIR": os.path.join(_data_dir, "logs"),
+    "QDRANT_PATH": os.path.join(_data_dir, "qdrant"),
+    "KB_MANIFEST_PATH": "",
+    "EMBEDDING_CACHE_PATH": "",
+    "INGEST_UPLOAD_DIR": "",
+    "JOB_QUEUE_BACKEND": "local",
+    "LANGCHAIN_TRACING_V2": "false",
+    "LANGSMITH_TRACING": "false",
+})
+load_dotenv(ROOT / ".env.example")
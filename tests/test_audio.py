@@ -0,0 +1,73 @@
+"""音频接口测试"""
+import os
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from services.tts_service import tts_service
+
+
+@pytest.fixture
+def client():
+    return TestClient(server.app)
+
+
+@pytest.fixture
+def audio_id():
+    """未经缓存的普通音频文件，mtime 带纳秒部分"""
+    uid = "test-audio-etag"
+    path = tts_service.get_audio_file_path(uid)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"ID3" + b"\0" * 1000)
+    os.utime(path, ns=(1_700_000_000_123_456_789, 1_700_000_000_987_654_321))
+    yield uid
+    path.unlink(missing_ok=True)
+
+
+def test_first_etag_revalidates(client, audio_id):
+    """首次访问刷新访问时间后 ETag 不变，用首个 ETag 重新验证得到 304"""
+    first = client.get(f"/audio/{audio_id}")
+    assert first.status_code == 200
+
+    revalidated = client.get(f"/audio/{audio_id}", headers={"If-None-Match": first.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == first.headers["etag"]
+
+
+def test_range_request(client, audio_id):
+    response = client.get(f"/audio/{audio_id}", headers={"Range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 0-99/1003"
+    assert len(response.content) == 100
+
+
+def test_missing_audio(client):
+    assert client.get("/audio/not-there").status_code == 404
+
+
+def test_stream_follows_partial_file(client):
+    """流式接口跟随 .part 文件增长输出，写入完成（重命名）后结束"""
+    uid = "test-audio-stream"
+    part = tts_service.get_partial_file_path(uid)
+    final = tts_service.get_audio_file_path(uid)
+    part.parent.mkdir(parents=True, exist_ok=True)
+    part.write_bytes(b"first-")
+
+    def finish():
+        time.sleep(0.3)
+        with open(part, "ab") as f:
+            f.write(b"second")
+        os.replace(part, final)
+
+    writer = threading.Thread(target=finish)
+    writer.start()
+    try:
+        response = client.get(f"/audio/{uid}/stream")
+        assert response.status_code == 200
+        assert response.content == b"first-second"
+    finally:
+        writer.join()
+        final.unlink(missing_ok=True)
@@ -0,0 +1,56 @@
+"""八字参数规则解析器测试语料"""
+import pytest
+
+from services.bazi_parser import bazi_parser
+
+# (用户输入, 期望解析结果 (name, sex, type, year, month, day, hours, minute))
+PARSED = [
+    ("我叫张三，男，1990年5月12日早上8点出生", ("张三", 0, 1, 1990, 5, 12, 8, 0)),
+    ("我叫李梅，女，1988-03-07 14:30 出生", ("李梅", 1, 1, 1988, 3, 7, 14, 30)),
+    ("姓名：王小明，性别：男，生于1995/12/01 23:15", ("王小明", 0, 1, 1995, 12, 1, 23, 15)),
+    ("我叫赵丽，我是女生，农历一九九二年腊月初八子时生", ("赵丽", 1, 0, 1992, 12, 8, 0, 0)),
+    ("名叫孙强 男 19851020 下午三点半", ("孙强", 0, 1, 1985, 10, 20, 15, 30)),
+    ("我叫周敏，本人女，公历2001年十二月二十日晚上十点十分出生", ("周敏", 1, 1, 2001, 12, 20, 22, 10)),
+    ("我是吴刚，男，99年8月8日凌晨一点出生", ("吴刚", 0, 1, 1999, 8, 8, 1, 0)),
+    ("我叫郑爽，我是男的，阴历1990年正月十五中午12点", ("郑爽", 0, 0, 1990, 1, 15, 12, 0)),
+    ("我叫冯静，性别女，1993年7月9日一点钟出生", ("冯静", 1, 1, 1993, 7, 9, 1, 0)),
+    # 夜间时段的"12点"是午夜 0 点，不是中午
+    ("我叫蒋涛，男，1991年2月3日晚上12点出生", ("蒋涛", 0, 1, 1991, 2, 3, 0, 0)),
+    ("我叫沈悦，女，1994年6月1日夜里12点出生", ("沈悦", 1, 1, 1994, 6, 1, 0, 0)),
+    ("我叫韩雪，女，1997年9月9日半夜12点半出生", ("韩雪", 1, 1, 1997, 9, 9, 0, 30)),
+    ("我叫曹阳，男，1986年5月5日晚上11点出生", ("曹阳", 0, 1, 1986, 5, 5, 23, 0)),
+    # 农历日与钟点之间没有分隔
+    ("我叫许诺，男，农历1990年三月初三8点出生", ("许诺", 0, 0, 1990, 3, 3, 8, 0)),
+    ("我叫邓佳，女，阴历一九八八年腊月廿三9点", ("邓佳", 1, 0, 1988, 12, 23, 9, 0)),
+]
+
+# 信息不完整或有歧义时必须返回 None，交给大模型回退处理
+UNPARSED = [
+    # "男朋友"中的"男"不是本人性别
+    "我叫陈静，1995年3月8日早上8点出生，帮我和男朋友合八字",
+    # "女方"中的"女"不是本人性别
+    "我叫刘洋，1990年1月1日10点出生，想看看和女方合不合",
+    # "一时"不是出生时辰
+    "我叫韩梅，女，1996年4月5日生，一时想不起几点",
+    # "有一点"不是出生时间
+    "我叫何军，男，1989年6月6日出生，有一点担心",
+    # 缺少姓名
+    "我是想算八字，男，1990年5月12日8点",
+    # 缺少出生时间
+    "我叫张三，男，1990年5月12日出生",
+    "帮我算算八字",
+    "",
+]
+
+
+@pytest.mark.parametrize("text,expected", PARSED)
+def test_parse(text, expected):
+    user = bazi_parser.parse(text)
+    assert user is not None
+    assert (user.name, user.sex, user.type, user.year, user.month,
+            user.day, user.hours, user.minute) == expected
+
+
+@pytest.mark.parametrize("text", UNPARSED)
+def test_fallback(text):
+    assert bazi_parser.parse(text) is None
@@ -0,0 +1,55 @@
+"""聊天记录测试（使用 fakeredis）"""
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import services.chat_history as chat_history_module
+from services.chat_history import RedisChatHistory
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(chat_history_module, "get_redis", lambda url: client)
+    monkeypatch.setattr(chat_history_module, "get_async_redis",
+                        lambda url: fakeredis.FakeAsyncRedis(server=server))
+    return client
+
+
+def make_history(**kwargs):
+    return RedisChatHistory("session", url="redis://unused", **kwargs)
+
+
+def test_fold_lock_release_keeps_foreign_lock(fake_redis):
+    """锁过期后被其他任务获得时，原持有者释放不会删除别人的锁"""
+    first, second = make_history(), make_history()
+    assert first.acquire_fold_lock(30)
+    assert not second.acquire_fold_lock(30)
+
+    fake_redis.delete(first.lock_key)  # 模拟锁过期
+    assert second.acquire_fold_lock(30)
+    first.release_fold_lock()
+    assert fake_redis.exists(second.lock_key)
+
+    second.release_fold_lock()
+    assert not fake_redis.exists(second.lock_key)
+
+
+def test_async_write_awaits_async_overflow_hook(fake_redis):
+    """异步写入溢出时调用异步回调，而不是在事件循环中执行同步回调"""
+    calls = []
+
+    async def aon_overflow(session_id):
+        calls.append(("async", session_id))
+
+    history = make_history(window=2, on_overflow=lambda session_id: calls.append(("sync", session_id)),
+                           aon_overflow=aon_overflow)
+    turn = [HumanMessage(content="问"), AIMessage(content="答")]
+    asyncio.run(history.aadd_messages(turn))
+    assert calls == []
+    asyncio.run(history.aadd_messages(turn))
+    assert calls == [("async", "session")]
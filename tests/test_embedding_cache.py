@@ -0,0 +1,28 @@
+"""查询向量缓存测试"""
+import numpy as np
+
+from services.embedding_cache import EmbeddingCache
+
+
+def test_round_trip_without_pickle(tmp_path):
+    """落盘的缓存不含对象数组，可在 allow_pickle=False 下加载"""
+    path = str(tmp_path / "embedding_cache.npz")
+    cache = EmbeddingCache(max_size=4, path=path, model="test-model")
+    cache.set("今年 运势", [0.1, 0.2, 0.3])
+    cache.set("Hello", [1.0, 0.0, 0.5])
+    cache.save()
+
+    with np.load(path, allow_pickle=False) as data:
+        assert data["keys"].dtype.kind == "U"
+
+    restored = EmbeddingCache(max_size=4, path=path, model="test-model")
+    assert restored.get("今年   运势") == cache.get("今年 运势")
+    assert restored.get("hello") == cache.get("Hello")
+
+
+def test_other_model_is_ignored(tmp_path):
+    path = str(tmp_path / "embedding_cache.npz")
+    cache = EmbeddingCache(max_size=4, path=path, model="a")
+    cache.set("q", [1.0])
+    cache.save()
+    assert EmbeddingCache(max_size=4, path=path, model="b").get("q") is None
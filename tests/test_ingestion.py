@@ -0,0 +1,122 @@
+"""知识库入库测试"""
+import asyncio
+import os
+import threading
+
+import pytest
+from langchain_core.documents import Document
+
+import services.ingestion as ingestion_module
+from services.ingestion import IngestProgress, ingestion_service
+from services.job_queue import JOB_CANCELLED, LANE_BULK, Job, JobQueue
+
+
+def test_batches_are_bounded_and_manifest_follows_last_slice(monkeypatch):
+    """单个来源的文本块远超批大小时拆成多批写入，来源清单在其最后一批写入后才提交"""
+    events = []
+
+    def plan_source(source, chunks):
+        return chunks, [f"{source}-{i}" for i in range(len(chunks))], []
+
+    monkeypatch.setattr(ingestion_module.knowledge_base, "plan_source", plan_source)
+    monkeypatch.setattr(ingestion_module.knowledge_base, "add_documents",
+                        lambda batch: events.append(("write", [doc.page_content for doc in batch])))
+    monkeypatch.setattr(ingestion_module.knowledge_base, "commit_source",
+                        lambda source, chunk_ids, stale_ids: events.append(("commit", source)))
+    monkeypatch.setattr(ingestion_service, "batch_size", 4)
+
+    def docs(source, count):
+        return source, [Document(page_content=f"{source}{i}") for i in range(count)]
+
+    job = Job("ingest.texts", {})
+    progress = IngestProgress(job, total=3)
+    ingestion_service._write_batches(job, progress, [docs("a", 2), docs("b", 9), docs("c", 1)])
+
+    writes = [batch for kind, batch in events if kind == "write"]
+    assert all(len(batch) <= 4 for batch in writes)
+    assert sum(len(batch) for batch in writes) == 12
+    assert progress.chunks == 12
+
+    def position(event):
+        return events.index(event)
+
+    last_b_write = max(i for i, (kind, batch) in enumerate(events) if kind == "write" and "b8" in batch)
+    assert position(("commit", "a")) > events.index(("write", ["a0", "a1", "b0", "b1"]))
+    assert position(("commit", "b")) > last_b_write
+    assert position(("commit", "c")) == len(events) - 1
+
+
+def test_cancelled_queued_upload_removes_spooled_files(tmp_path):
+    """排队中的文件入库任务被取消时，暂存文件随即删除（处理函数不会执行）"""
+    jobs = JobQueue()
+    jobs.bulk_workers = 1
+    release = threading.Event()
+    jobs.register("block", lambda job: release.wait(5), lane=LANE_BULK)
+    jobs.register("ingest.texts", ingestion_service._handle_files,
+                  cleanup=ingestion_service._remove_spooled, lane=LANE_BULK)
+
+    spooled = [tmp_path / "a.txt", tmp_path / "b.txt"]
+    for path in spooled:
+        path.write_text("内容", encoding="utf-8")
+    try:
+        jobs.submit("block", {})
+        job = jobs.submit("ingest.texts", {"files": [[path.name, str(path)] for path in spooled]}, local=True)
+        assert jobs.cancel(job.id).status == JOB_CANCELLED
+        assert not any(path.exists() for path in spooled)
+    finally:
+        release.set()
+        jobs.shutdown()
+
+
+class FakeUpload:
+    """按块返回数据的上传文件，读到 fail_at 块时抛出异常"""
+
+    def __init__(self, blocks, fail_at=None):
+        self.blocks = list(blocks)
+        self.fail_at = fail_at
+        self.reads = 0
+
+    async def read(self, size):
+        self.reads += 1
+        if self.reads == self.fail_at:
+            raise ConnectionResetError("client disconnected")
+        return self.blocks.pop(0) if self.blocks else b""
+
+
+def test_spool_upload_writes_off_event_loop(tmp_path, monkeypatch):
+    """暂存上传文件时磁盘写入在线程池中执行，中途失败删除残缺文件"""
+    monkeypatch.setattr(ingestion_service, "upload_dir", str(tmp_path))
+    writer_threads = []
+    fdopen = os.fdopen
+
+    class RecordingFile:
+        def __init__(self, f):
+            self.f = f
+
+        def write(self, data):
+            writer_threads.append(threading.get_ident())
+            return self.f.write(data)
+
+        def close(self):
+            self.f.close()
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.close()
+
+    monkeypatch.setattr(os, "fdopen", lambda fd, mode: RecordingFile(fdopen(fd, mode)))
+
+    async def spool(upload):
+        return threading.get_ident(), await ingestion_service.spool_upload(upload, suffix=".txt")
+
+    loop_thread, path = asyncio.run(spool(FakeUpload([b"abc", b"def"])))
+    with open(path, "rb") as f:
+        assert f.read() == b"abcdef"
+    assert writer_threads and loop_thread not in writer_threads
+    os.remove(path)
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(spool(FakeUpload([b"abc", b"def"], fail_at=2)))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,114 @@
+"""后台任务队列测试"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+import services.job_queue as job_queue_module
+from services.job_queue import (JOB_COMPLETED, JOB_QUEUED, JOB_RUNNING, LANE_BULK,
+                                REDIS_PROCESSING_KEY, REDIS_QUEUE_KEY, JobQueue)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def redis_queue(monkeypatch):
+    """Redis 模式的任务队列（使用 fakeredis）"""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(job_queue_module, "get_redis", lambda: client)
+    monkeypatch.setattr(job_queue_module, "get_async_redis",
+                        lambda: fakeredis.FakeAsyncRedis(server=server))
+    jobs = JobQueue()
+    jobs.backend = "redis"
+    yield jobs, client
+    jobs.shutdown()
+
+
+def test_local_submit_and_get():
+    jobs = JobQueue()
+    jobs.register("echo", lambda job: job.payload["value"])
+    job = jobs.submit("echo", {"value": 42})
+    assert wait_for(lambda: jobs.get(job.id).status == JOB_COMPLETED)
+    assert asyncio.run(jobs.aget(job.id)).result == 42
+    jobs.shutdown()
+
+
+def test_tts_not_blocked_by_long_ingest():
+    """批量通道被长耗时导入占满时，实时通道的语音合成任务照常完成"""
+    jobs = JobQueue()
+    release = threading.Event()
+    jobs.register("ingest.texts", lambda job: release.wait(5), lane=LANE_BULK)
+    jobs.register("tts.synthesize", lambda job: "audio.mp3")
+    try:
+        ingests = [jobs.submit("ingest.texts", {}) for _ in range(jobs.workers + jobs.bulk_workers)]
+        assert wait_for(lambda: jobs.get(ingests[0].id).status == JOB_RUNNING)
+        tts = jobs.submit("tts.synthesize", {})
+        assert wait_for(lambda: jobs.get(tts.id).status == JOB_COMPLETED, timeout=2)
+        assert jobs.get(ingests[0].id).status == JOB_RUNNING
+        assert jobs.get_stats()["lanes"]["bulk"]["local_pending"] == len(ingests) - jobs.bulk_workers
+    finally:
+        release.set()
+        jobs.shutdown()
+
+
+def test_redis_lanes_use_separate_lists(redis_queue):
+    """Redis 模式下批量任务进入独立的排队列表"""
+    jobs, client = redis_queue
+    release = threading.Event()
+    jobs.register("ingest.texts", lambda job: release.wait(5), lane=LANE_BULK)
+    try:
+        running = jobs.submit("ingest.texts", {})
+        assert wait_for(lambda: jobs.get(running.id).status == JOB_RUNNING)
+        pending = jobs.submit("ingest.texts", {})
+        assert client.lrange(REDIS_QUEUE_KEY + ":bulk", 0, -1) == [pending.id.encode()]
+        assert client.llen(REDIS_QUEUE_KEY) == 0
+        assert jobs.get_stats()["lanes"]["bulk"]["redis_pending"] == 1
+    finally:
+        release.set()
+
+
+def test_redis_async_submit_and_get(redis_queue):
+    jobs, client = redis_queue
+    jobs.register("echo", lambda job: job.payload["value"])
+
+    async def scenario():
+        job = await jobs.asubmit("echo", {"value": 7})
+        for _ in range(250):
+            record = await jobs.aget(job.id)
+            if record.status == JOB_COMPLETED:
+                return record
+            await asyncio.sleep(0.02)
+
+    record = asyncio.run(scenario())
+    assert record is not None and record.result == 7
+    assert client.llen(REDIS_PROCESSING_KEY) == 0
+
+
+def test_redis_orphan_is_requeued(redis_queue):
+    """领取任务的进程退出（租约过期）后，任务从处理中列表重新入队"""
+    jobs, client = redis_queue
+    jobs.register("echo", lambda job: job.payload["value"])
+    job = jobs._create_job("echo", {"value": 1}, None, None, False)
+    jobs.shutdown()
+    job.status = JOB_RUNNING
+    jobs._save(job)
+    client.lpush(REDIS_PROCESSING_KEY, job.id)
+
+    # 第一轮只记为可疑，第二轮确认后重新入队
+    suspects = jobs._requeue_orphans(client, set())
+    assert suspects == {job.id}
+    assert client.llen(REDIS_QUEUE_KEY) == 0
+    jobs._requeue_orphans(client, suspects)
+    assert client.llen(REDIS_PROCESSING_KEY) == 0
+    assert client.lrange(REDIS_QUEUE_KEY, 0, -1) == [job.id.encode()]
+    assert jobs.get(job.id).status == JOB_QUEUED
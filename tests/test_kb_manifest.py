@@ -0,0 +1,33 @@
+"""知识库来源清单测试"""
+from services.kb_manifest import SourceManifest
+
+
+def test_replicas_merge_on_save(tmp_path):
+    """两个进程共用清单文件时，各自保存不会覆盖对方的来源"""
+    path = str(tmp_path / "kb_manifest.json")
+    first = SourceManifest(path, use_redis=False)
+    second = SourceManifest(path, use_redis=False)
+    first.get("a")
+    second.get("b")
+
+    first.set("a", ["1", "2"])
+    second.set("b", ["3"])
+    first.save()
+    second.save()
+
+    fresh = SourceManifest(path, use_redis=False)
+    assert fresh.get("a") == ["1", "2"]
+    assert fresh.get("b") == ["3"]
+    # 已加载的实例在文件被其他进程更新后读到最新内容
+    assert first.get("b") == ["3"]
+
+
+def test_unsaved_changes_survive_reload(tmp_path):
+    path = str(tmp_path / "kb_manifest.json")
+    first = SourceManifest(path, use_redis=False)
+    second = SourceManifest(path, use_redis=False)
+    first.set("a", ["1"])
+    second.set("b", ["2"])
+    second.save()
+    assert first.get("a") == ["1"]
+    assert first.get("b") == ["2"]
@@ -0,0 +1,58 @@
+"""知识库写入测试"""
+import threading
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from qdrant_client import QdrantClient
+
+from services.knowledge_base import KnowledgeBase, chunk_id
+
+
+class LockProbeEmbeddings(Embeddings):
+    """向量化时从另一线程尝试获取存储锁，记录向量化期间检索是否会被阻塞"""
+
+    def __init__(self, lock):
+        self.lock = lock
+        self.lock_free = []
+
+    def embed_documents(self, texts):
+        acquired = []
+
+        def try_lock():
+            if self.lock.acquire(blocking=False):
+                acquired.append(True)
+                self.lock.release()
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        self.lock_free.append(bool(acquired))
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+
+def test_add_documents_embeds_outside_store_lock(tmp_path):
+    """本地存储模式下向量化不持有存储锁，写入后可检索到文档"""
+    kb = KnowledgeBase()
+    kb._client = QdrantClient(path=str(tmp_path / "qdrant"))
+    kb._embeddings = LockProbeEmbeddings(kb._store_lock)
+    try:
+        documents = [Document(page_content=f"第{i}段", metadata={"source": "s"}) for i in range(3)]
+        for doc in documents:
+            doc.metadata["chunk_id"] = chunk_id("s", doc.page_content)
+        # 向量库初始化时会校验一次维度，只观察写入阶段
+        kb.get_vectorstore()
+        kb._embeddings.lock_free.clear()
+
+        ids = kb.add_documents(documents)
+
+        assert kb.is_local
+        assert kb._embeddings.lock_free == [True]
+        assert ids == [doc.metadata["chunk_id"] for doc in documents]
+        assert kb._existing_ids(ids) == set(ids)
+        found = kb.search(kb.embeddings.embed_query("第1段"))
+        assert any(doc.page_content == "第1段" and doc.metadata["source"] == "s" for doc in found)
+    finally:
+        kb.close()
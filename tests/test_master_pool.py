@@ -0,0 +1,48 @@
+"""算命大师实例池测试"""
+import asyncio
+
+import pytest
+
+from agent import MasterPool
+
+
+class StubMaster:
+    def reset(self):
+        pass
+
+
+class StubPool(MasterPool):
+    def _create_master(self):
+        return StubMaster()
+
+
+def test_cancelled_aborrow_returns_slot():
+    """池满时等待中的异步借用被取消，线程随后借到的实例必须归还，名额不泄漏"""
+    pool = StubPool(max_size=1, min_size=0, acquire_timeout=5)
+
+    async def scenario():
+        holder = pool.acquire()
+
+        async def borrow():
+            async with pool.aborrow():
+                pass
+
+        waiter = asyncio.create_task(borrow())
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        pool.release(holder)
+        # 线程中的等待借到实例后应由回调归还
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if pool.get_stats()["in_use"] == 0:
+                break
+
+        async with pool.aborrow():
+            assert pool.get_stats()["in_use"] == 1
+
+    asyncio.run(scenario())
+    assert pool.get_stats()["in_use"] == 0
+    assert pool.get_stats()["idle"] == 1
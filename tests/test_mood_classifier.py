@@ -0,0 +1,16 @@
+"""本地情绪分类器测试"""
+from config.settings import config
+from services.mood_classifier import mood_classifier
+
+
+def test_zero_hit_falls_back():
+    """没有命中关键词的文本置信度低于阈值，交给大模型判断"""
+    prediction = mood_classifier.predict("我下周要搬家，不知道选哪天")
+    assert prediction.scores == {}
+    assert prediction.confidence < config.MOOD_CLASSIFIER_THRESHOLD
+
+
+def test_strong_hit_is_confident():
+    prediction = mood_classifier.predict("失恋了，好难过，想哭")
+    assert prediction.mood == "depressed"
+    assert prediction.confidence >= config.MOOD_CLASSIFIER_THRESHOLD
@@ -0,0 +1,62 @@
+"""语义缓存测试"""
+import asyncio
+
+import pytest
+
+import services.semantic_cache as semantic_cache_module
+from services.semantic_cache import SemanticCache
+
+
+@pytest.fixture
+def shared_redis(monkeypatch):
+    """两个副本共用的 Redis（使用 fakeredis）"""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(semantic_cache_module, "get_redis", lambda: client)
+    monkeypatch.setattr(semantic_cache_module, "get_async_redis",
+                        lambda: fakeredis.FakeAsyncRedis(server=server))
+    return client
+
+
+def make_cache(**kwargs):
+    cache = SemanticCache("test", max_size=4, threshold=0.9, ttl=60, **kwargs)
+    cache.enabled = True
+    return cache
+
+
+def test_similar_query_hits_and_clear_invalidates():
+    cache = make_cache(use_redis=False)
+    cache.set([1.0, 0.0, 0.0], "星座运势")
+    assert cache.get([0.99, 0.05, 0.0]) == "星座运势"
+    assert cache.get([0.0, 1.0, 0.0]) is None
+    cache.clear()
+    assert cache.get([1.0, 0.0, 0.0]) is None
+
+
+def test_clear_on_one_replica_invalidates_others(shared_redis):
+    """一个副本入库后清空缓存，其他副本下一次查找即不再返回旧结果"""
+    replica_a, replica_b = make_cache(use_redis=True), make_cache(use_redis=True)
+    assert replica_a.get([1.0, 0.0]) is None
+    replica_a.set([1.0, 0.0], "旧结果")
+    assert replica_a.get([1.0, 0.0]) == "旧结果"
+
+    replica_b.clear()
+    assert shared_redis.get("semantic_cache:generation:test") == b"1"
+    assert replica_a.get([1.0, 0.0]) is None
+
+    replica_a.set([1.0, 0.0], "新结果")
+    assert asyncio.run(replica_a.aget([1.0, 0.0])) == "新结果"
+    replica_b.clear()
+    assert asyncio.run(replica_a.aget([1.0, 0.0])) is None
+
+
+def test_unreadable_generation_bypasses_cache(monkeypatch):
+    """无法读取共享代数时不返回可能已失效的结果"""
+    def unavailable():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(semantic_cache_module, "get_redis", unavailable)
+    cache = make_cache(use_redis=True)
+    cache.set([1.0, 0.0], "结果")
+    assert cache.get([1.0, 0.0]) is None
@@ -0,0 +1,59 @@
+"""语音合成请求测试：本地替身服务验证连接复用与失败重试"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services.tts_service import TTSEngine, tts_service
+
+AUDIO = b"ID3" + b"\0" * 256
+
+
+@pytest.fixture
+def stand_in_server():
+    """替身 TTS 服务：记录每个请求所用的客户端连接，第一个请求返回 503"""
+    connections = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            connections.append(self.client_address)
+            status, body = (503, b"busy") if len(connections) == 1 else (200, AUDIO)
+            self.send_response(status)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/tts", connections
+    server.shutdown()
+    server.server_close()
+
+
+def test_synthesis_reuses_connection_and_retries(stand_in_server, monkeypatch):
+    """多次合成共用同一条 keep-alive 连接，503 响应退避后重试成功；TTS 只走异步客户端"""
+    url, connections = stand_in_server
+    engine = TTSEngine(max_concurrency=1, timeout=5)
+    engine.http.backoff = 0.01
+    monkeypatch.setattr(tts_service, "engine", engine)
+    monkeypatch.setattr(tts_service, "endpoint", url)
+    try:
+        for text in ("第一句。", "第二句。", "第三句。"):
+            audio = engine.submit(tts_service._synthesize_segment(text, "calm")).result(10)
+            assert audio == AUDIO
+    finally:
+        engine.close()
+
+    assert len(connections) == 4  # 第一句重试一次
+    assert len(set(connections)) == 1
+    assert engine.http._session is None
@@ -0,0 +1,55 @@
+"""
+缓存工具模块
+线程安全的进程内 LRU + TTL 缓存
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """带过期时间的 LRU 缓存，超出容量时淘汰最久未使用的条目"""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取缓存，过期或不存在时返回 default"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """写入缓存"""
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl else 0.0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """删除缓存条目"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -3,7 +3,91 @@
 优化后的工具函数，移除硬编码配置
 """
 import re
-from typing import Any
+from typing import Any, List, Optional, Tuple
+
+# 融合情绪识别时模型输出的情绪标签
+MOOD_TAG_PATTERN = re.compile(r"<mood>\s*(\w+)\s*</mood>", flags=re.IGNORECASE)
+# 句子：非句末标点内容 + 句末标点 + 紧随的右引号/右括号
+SENTENCE_PATTERN = re.compile(r"[^。！？!?；;…\n]+[。！？!?；;…]*[”’\"』」）)]*")
+CLAUSE_PATTERN = re.compile(r"[^，,、：:]+[，,、：:]*")
+
+
+class ThinkFilter:
+    """
+    增量过滤 <think>...</think> 结构的有状态过滤器
+    
+    逐段喂入模型输出，跨分段的标签也能正确识别；每次调用只处理本段内容
+    与不超过标签长度的残留片段，不会回扫已处理的文本。
+    """
+    
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+    
+    def __init__(self, strip_leading: bool = True):
+        self._in_think = False
+        # 末尾可能构成不完整标签的片段，留待下一段判断
+        self._pending = ""
+        # 是否已输出过可见字符（之前的空白会被丢弃）
+        self._started = not strip_leading
+    
+    def feed(self, chunk: str) -> str:
+        """
+        喂入一段文本
+        
+        Args:
+            chunk: 模型输出的增量文本
+            
+        Returns:
+            本段可立即输出的干净文本
+        """
+        text = self._pending + chunk
+        self._pending = ""
+        visible = []
+        pos = 0
+        
+        while True:
+            tag = self.CLOSE_TAG if self._in_think else self.OPEN_TAG
+            index = text.find(tag, pos)
+            if index == -1:
+                keep = self._partial_tag_length(text, tag, pos)
+                if not self._in_think:
+                    visible.append(text[pos:len(text) - keep])
+                self._pending = text[len(text) - keep:]
+                break
+            
+            if not self._in_think:
+                visible.append(text[pos:index])
+            pos = index + len(tag)
+            self._in_think = not self._in_think
+        
+        return self._emit("".join(visible))
+    
+    def flush(self) -> str:
+        """
+        结束输入，输出残留内容
+        
+        Returns:
+            残留的可见文本（未闭合的 <think> 内容会被丢弃）
+        """
+        pending, self._pending = self._pending, ""
+        if self._in_think:
+            return ""
+        return self._emit(pending)
+    
+    def _emit(self, text: str) -> str:
+        """丢弃首个可见字符之前的空白"""
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+    
+    @staticmethod
+    def _partial_tag_length(text: str, tag: str, start: int) -> int:
+        """计算 text 末尾与 tag 前缀重合的最大长度"""
+        for size in range(min(len(tag) - 1, len(text) - start), 0, -1):
+            if text.endswith(tag[:size]):
+                return size
+        return 0
 
 
 def delete_think(text: str) -> str:
@@ -14,18 +98,74 @@ def delete_think(text: str) -> str:
         text: 原始文本
         
     Returns:
-        清洗后的文本
+        清洗后的文本（保留有意义的换行）
     """
     if not isinstance(text, str):
         return str(text)
     
     # 移除 <think>...</think> 标签及其内容
-    cleaned_text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
+    think_filter = ThinkFilter()
+    cleaned_text = think_filter.feed(text) + think_filter.flush()
+    
+    # 合并多余的空白字符，保留段落换行
+    cleaned_text = re.sub(r"[^\S\n]+", " ", cleaned_text)
+    cleaned_text = re.sub(r" ?\n ?", "\n", cleaned_text)
+    cleaned_text = re.sub(r"\n{3,}", "\n\n", cleaned_text)
     
-    # 移除多余的空白字符
-    cleaned_text = re.sub(r'\s+', ' ', cleaned_text).strip()
+    return cleaned_text.strip()
+
+
+def extract_mood_tag(text: str) -> Tuple[Optional[str], str]:
+    """
+    提取并移除模型输出中的 <mood>...</mood> 情绪标签
+    
+    Args:
+        text: 模型输出文本
+        
+    Returns:
+        (情绪标签, 移除标签后的文本)，未找到标签时情绪为 None
+    """
+    if not isinstance(text, str):
+        return None, str(text)
+    
+    match = MOOD_TAG_PATTERN.search(text)
+    if not match:
+        return None, text
+    
+    cleaned_text = (text[:match.start()] + text[match.end():]).strip()
+    return match.group(1).lower(), cleaned_text
+
+
+def split_sentences(text: str, max_chars: int = 120, min_chars: int = 12) -> List[str]:
+    """
+    按句切分文本（用于分句语音合成）
+    
+    Args:
+        text: 原始文本
+        max_chars: 单句最大字数，超长句子先按逗号再按字数切开
+        min_chars: 过短的句子与下一句合并，减少请求数
+        
+    Returns:
+        句子列表
+    """
+    pieces = []
+    for sentence in SENTENCE_PATTERN.findall(text or ""):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in CLAUSE_PATTERN.findall(sentence):
+            pieces.extend(clause[i:i + max_chars] for i in range(0, len(clause), max_chars))
     
-    return cleaned_text
+    sentences: List[str] = []
+    for piece in pieces:
+        if sentences and len(sentences[-1]) < min_chars and len(sentences[-1]) + len(piece) <= max_chars:
+            sentences[-1] += piece
+        else:
+            sentences.append(piece)
+    return sentences
 
 
 def format_error_message(error: Exception, context: str = "") -> str:
@@ -0,0 +1,121 @@
+"""
+运行指标模块
+进程内的轻量计数器与延迟统计，供 /metrics 端点汇总输出
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+
+class LatencyRecorder:
+    """延迟统计：累计次数、均值、最大值，以及最近样本的分位数"""
+
+    # 快照中的换算倍数与字段后缀（秒 → 毫秒）
+    SCALE = 1000
+    SUFFIX = "_ms"
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+
+    def record(self, seconds: float) -> None:
+        """记录一次耗时（秒）"""
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+            self._total += seconds
+            self._max = max(self._max, seconds)
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """以上下文管理器方式计时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取统计快照（毫秒）"""
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total, maximum = self._count, self._total, self._max
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            index = min(len(samples) - 1, int(round(p * (len(samples) - 1))))
+            return round(samples[index] * self.SCALE, 2)
+
+        return {
+            "count": count,
+            f"avg{self.SUFFIX}": round(total / count * self.SCALE, 2) if count else 0.0,
+            f"max{self.SUFFIX}": round(maximum * self.SCALE, 2),
+            f"p50{self.SUFFIX}": percentile(0.50),
+            f"p95{self.SUFFIX}": percentile(0.95),
+            f"p99{self.SUFFIX}": percentile(0.99)
+        }
+
+
+class ValueRecorder(LatencyRecorder):
+    """数值分布统计（如每轮提示词 token 数）：与延迟统计相同，但按原值输出"""
+
+    SCALE = 1
+    SUFFIX = ""
+
+
+class MetricsRegistry:
+    """指标注册表，按名称管理计数器与延迟统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._latencies: Dict[str, LatencyRecorder] = {}
+        self._values: Dict[str, ValueRecorder] = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """计数器累加"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get_counter(self, name: str) -> int:
+        """读取计数器当前值"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def latency(self, name: str) -> LatencyRecorder:
+        """获取（或创建）指定名称的延迟统计"""
+        with self._lock:
+            recorder = self._latencies.get(name)
+            if recorder is None:
+                recorder = self._latencies[name] = LatencyRecorder()
+            return recorder
+
+    def values(self, name: str) -> ValueRecorder:
+        """获取（或创建）指定名称的数值分布统计"""
+        with self._lock:
+            recorder = self._values.get(name)
+            if recorder is None:
+                recorder = self._values[name] = ValueRecorder()
+            return recorder
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取全部指标快照"""
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = dict(self._latencies)
+            values = dict(self._values)
+        return {
+            "counters": counters,
+            "latency": {name: recorder.snapshot() for name, recorder in latencies.items()},
+            "values": {name: recorder.snapshot() for name, recorder in values.items()}
+        }
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()